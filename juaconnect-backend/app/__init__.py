@@ -1,30 +1,66 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import DevelopmentConfig
+from app.services.replicas import RoutingSession
+from app.services.tokens import RequestJWTManager
 
-db = SQLAlchemy()
-jwt = JWTManager()
+# Routes statements to region shards or read replicas, see app/services/replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+# Decodes a bearer token once per request, however many batch sub-requests reuse it
+jwt = RequestJWTManager()
 
 def create_app(config_class=DevelopmentConfig):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    from app.services.payments import check_config
+    check_config(app)
+    
+    # Behind PROXY_HOPS proxies, request.remote_addr is the real client rather than the proxy
+    if app.config['PROXY_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'], x_proto=app.config['PROXY_HOPS'])
+    
     # Initialize extensions
     db.init_app(app)
     jwt.init_app(app)
-    CORS(app)
+    CORS(app, expose_headers=['X-Last-Write'])
+    
+    # Admission control runs before every request, ahead of the route's own work
+    from app.services.ratelimit import limiter
+    limiter.init_app(app)
+    
+    # Read-your-writes: stamp write responses so the caller's next reads skip lagging replicas
+    from app.services.replicas import monitor
+    monitor.init_app(app)
+    
+    # Sharded mode: pick the caller's region database before the view runs
+    from app.services.sharding import shard_router
+    shard_router.init_app(app)
     
     # Register blueprints
-    from app.routes import auth_routes, client_routes, artisan_routes, notification_routes
+    from app.routes import (
+        auth_routes, client_routes, artisan_routes, notification_routes, batch_routes, payment_routes, analytics_routes
+    )
     app.register_blueprint(auth_routes.bp)
     app.register_blueprint(client_routes.bp)
     app.register_blueprint(artisan_routes.bp)
     app.register_blueprint(notification_routes.bp)
+    app.register_blueprint(batch_routes.bp)
+    app.register_blueprint(payment_routes.bp)
+    app.register_blueprint(analytics_routes.bp)
+    
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Create database tables and add columns newer than the database (skipped in production, see `flask init-db`)
+    if app.config['CREATE_TABLES']:
+        from app.services.schema import upgrade_schema
+        with app.app_context():
+            db.create_all()
+            shard_router.create_tables(db, app)
+            upgrade_schema(app)
     
     return app
@@ -0,0 +1,266 @@
+"""ASGI serving mode.
+
+Read-heavy GET endpoints of the artisan and notification blueprints are served
+natively async on an async SQLAlchemy engine, including a long-poll endpoint
+for new notifications. Everything else falls through to the regular Flask app
+via asgiref's WSGI adapter, so the sync mode and its routes stay the single
+source of truth for writes.
+
+Native handlers read the primary database, never a read replica. In sharded
+mode the notification handlers read the caller's home shard (the region in
+their token), and the artisan reads, which span every shard, are left to the
+Flask routes.
+
+Requires the packages in requirements-async.txt. Run with:
+    uvicorn asgi:app --workers 4
+"""
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
+from app import create_app
+from app.models import User, Review, Notification
+from app.services.ratelimit import limiter
+from app.services.sync import next_watermark
+from config import ProductionConfig
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    """Map a sync DATABASE_URL onto the matching async driver"""
+    scheme, rest = url.split('://', 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+class HTTPError(Exception):
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+
+class AsyncAPI:
+    """Minimal ASGI router in front of the Flask app"""
+    
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        config = flask_app.config
+        url = config.get('ASYNC_DATABASE_URL') or async_database_url(config['SQLALCHEMY_DATABASE_URI'])
+        # Async engines keyed by shard region; None is the primary, the only one when unsharded
+        self.engines = {None: create_async_engine(url, pool_pre_ping=True)}
+        for region, shard_url in config['SHARD_DATABASE_URLS'].items():
+            self.engines[region] = create_async_engine(async_database_url(shard_url), pool_pre_ping=True)
+        self._sessions = {
+            region: async_sessionmaker(engine, expire_on_commit=False) for region, engine in self.engines.items()
+        }
+        self.routes = []
+        if not config['SHARD_DATABASE_URLS']:
+            # Artisans are spread over every shard; sharded, the Flask routes gather them
+            self.routes += [
+                (re.compile(r'^/v1/artisan/?$'), self.list_artisans),
+                (re.compile(r'^/v1/artisan/(\d+)$'), self.get_artisan),
+                (re.compile(r'^/v1/artisan/(\d+)/reviews$'), self.get_artisan_reviews),
+            ]
+        self.routes += [
+            (re.compile(r'^/v1/notifications$'), self.get_notifications),
+            (re.compile(r'^/v1/notifications/unread$'), self.get_unread_count),
+            (re.compile(r'^/v1/notifications/wait$'), self.wait_for_notifications),
+        ]
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    request = AsyncRequest(scope)
+                    # The SQLite bucket backend blocks, so admission runs on a worker thread
+                    rejected = await asyncio.get_running_loop().run_in_executor(None, self._admit, scope, request)
+                    if rejected is not None:
+                        await self._send_json(send, *rejected)
+                        return
+                    try:
+                        result = await handler(request, *match.groups())
+                    except HTTPError as e:
+                        result = (e.body, e.status)
+                    if result is not None:
+                        await self._send_json(send, *result)
+                        return
+                    break
+        
+        await self.wsgi(scope, receive, send)
+    
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for engine in self.engines.values():
+                    await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    def _admit(self, scope, request):
+        """Rate-limit a native request in a Flask request context; (body, status, headers) to reject it, or None"""
+        with self.flask_app.test_request_context(
+            scope['path'],
+            query_string=scope.get('query_string', b'').decode(),
+            headers=request.headers,
+            environ_base={'REMOTE_ADDR': (scope.get('client') or ('', 0))[0]},
+        ):
+            # Coroutines are cheap, so only the token buckets apply, not the in-flight caps
+            rejected = limiter.admit(concurrency=False)
+            if rejected is None:
+                return None
+            return rejected.get_json(), rejected.status_code, {'retry-after': rejected.headers['Retry-After']}
+    
+    def sessions(self, region=None):
+        """Async session on the primary, or on region's shard in sharded mode"""
+        return self._sessions[region if self.flask_app.config['SHARD_DATABASE_URLS'] else None]()
+    
+    async def _send_json(self, send, body, status, headers=None):
+        payload = json.dumps(body).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(payload)).encode()),
+                (b'access-control-allow-origin', b'*'),
+            ] + [(key.encode(), value.encode()) for key, value in (headers or {}).items()],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+    
+    def identity(self, request):
+        """(user id, home region) from the bearer token, decoded the same way flask_jwt_extended does"""
+        header = request.headers.get('authorization', '')
+        if not header.startswith('Bearer '):
+            raise HTTPError(401, {'msg': 'Missing Authorization Header'})
+        try:
+            with self.flask_app.app_context():
+                claims = decode_token(header[len('Bearer '):])
+        except Exception as e:
+            raise HTTPError(422, {'msg': str(e)})
+        region = claims.get('region')
+        if self.flask_app.config['SHARD_DATABASE_URLS'] and region not in self.engines:
+            raise HTTPError(422, {'msg': 'Token has no home region'})
+        return claims['sub'], region
+    
+    # Artisan blueprint
+    
+    async def list_artisans(self, request):
+        sort = request.args.get('sort')
+        statement = select(User).filter_by(user_type='artisan', is_verified=True).options(
+            selectinload(User.skills), selectinload(User.languages), selectinload(User.availability_slots)
+        )
+        if sort == 'rating':
+            statement = statement.order_by(User.rating.desc(), User.rating_count.desc())
+        elif sort == 'completed_jobs':
+            statement = statement.order_by(User.completed_jobs.desc())
+        async with self.sessions() as session:
+            artisans = (await session.scalars(statement)).all()
+            return {'success': True, 'data': [artisan.to_dict() for artisan in artisans]}, 200
+    
+    async def get_artisan(self, request, artisan_id):
+        statement = select(User).filter_by(id=int(artisan_id), user_type='artisan').options(
+            selectinload(User.skills), selectinload(User.languages), selectinload(User.availability_slots)
+        )
+        async with self.sessions() as session:
+            artisan = (await session.scalars(statement)).first()
+            if not artisan:
+                return {'success': False, 'message': 'Artisan not found'}, 404
+            return {'success': True, 'data': artisan.to_dict()}, 200
+    
+    async def get_artisan_reviews(self, request, artisan_id):
+        limit = min(request.int_arg('limit', 20), 100)
+        statement = select(Review).filter_by(artisan_id=int(artisan_id))
+        before = request.int_arg('before')
+        if before:
+            statement = statement.where(Review.id < before)
+        statement = statement.order_by(Review.id.desc()).limit(limit)
+        async with self.sessions() as session:
+            reviews = (await session.scalars(statement)).all()
+            return {
+                'success': True,
+                'data': [review.to_dict() for review in reviews],
+                'next_before': reviews[-1].id if len(reviews) == limit else None,
+            }, 200
+    
+    # Notification blueprint
+    
+    async def get_notifications(self, request):
+        if 'since' in request.args:
+            return None  # Delta sync is served by the Flask route
+        user_id, region = self.identity(request)
+        with self.flask_app.app_context():
+            watermark = next_watermark()
+        statement = select(Notification).filter_by(user_id=user_id).order_by(
+            Notification.is_read.asc(), Notification.created_at.desc()
+        ).limit(self.flask_app.config['NOTIFICATION_HOT_LIMIT'])
+        async with self.sessions(region) as session:
+            notifications = (await session.scalars(statement)).all()
+            return {
+                'success': True,
+                'data': [n.to_dict() for n in notifications],
+                'unread_count': await self._unread_count(session, user_id),
+                'watermark': watermark,
+            }, 200
+    
+    async def _unread_count(self, session, user_id):
+        return await session.scalar(
+            select(func.count(Notification.id)).filter_by(user_id=user_id, is_read=False)
+        )
+    
+    async def get_unread_count(self, request):
+        user_id, region = self.identity(request)
+        async with self.sessions(region) as session:
+            return {'success': True, 'data': {'count': await self._unread_count(session, user_id)}}, 200
+    
+    async def wait_for_notifications(self, request):
+        """Long poll: return as soon as the unread count differs from ?count=, or after ?timeout= seconds.
+        
+        A waiting client only costs a coroutine and one indexed COUNT per
+        NOTIFICATION_POLL_SECONDS, instead of a sync worker.
+        """
+        user_id, region = self.identity(request)
+        known = request.int_arg('count', 0)
+        timeout = min(request.int_arg('timeout', 25), self.flask_app.config['LONG_POLL_MAX_SECONDS'])
+        interval = self.flask_app.config['NOTIFICATION_POLL_SECONDS']
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            async with self.sessions(region) as session:
+                count = await self._unread_count(session, user_id)
+            if count != known or loop.time() >= deadline:
+                return {'success': True, 'data': {'count': count, 'changed': count != known}}, 200
+            await asyncio.sleep(interval)
+
+
+class AsyncRequest:
+    def __init__(self, scope):
+        self.headers = {key.decode().lower(): value.decode() for key, value in scope.get('headers', [])}
+        self.args = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+    
+    def int_arg(self, name, default=None):
+        try:
+            return int(self.args[name])
+        except (KeyError, ValueError):
+            return default
+
+
+def create_asgi_app(config_class=ProductionConfig):
+    return AsyncAPI(create_app(config_class))
@@ -0,0 +1,230 @@
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+from app import db
+from app.models import User
+from app.services.ratings import rebuild_aggregates
+from app.services.stats import rebuild_stats
+from app.services.analytics import rebuild_rollups
+from app.services.payments import reconcile, write_stub_settlement
+from app.services.retention import compact_notifications, compact_requests, schedule_request_compaction
+from app.services.sync import prune_tombstones
+from app.services.jobs import runner
+from app.services.dispatch import run_batch_assignment, schedule_batch_assignment
+from app.services.replicas import beat
+from app.services.schema import upgrade_schema
+from app.services.sharding import shard_router, each_shard
+
+
+def register_commands(app):
+    """Attach maintenance commands to the Flask CLI"""
+    app.cli.add_command(init_db)
+    app.cli.add_command(normalize_profiles)
+    app.cli.add_command(rebuild_ratings)
+    app.cli.add_command(rebuild_dashboard_stats)
+    app.cli.add_command(rebuild_analytics)
+    app.cli.add_command(reconcile_payments)
+    app.cli.add_command(stub_settlement)
+    app.cli.add_command(compact_notifications_command)
+    app.cli.add_command(compact_requests_command)
+    app.cli.add_command(prune_tombstones_command)
+    app.cli.add_command(assign_requests)
+    app.cli.add_command(jobs_status)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(retry_dead_jobs)
+    app.cli.add_command(replica_heartbeat)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create missing tables and add columns and indexes missing from existing ones (run once per deploy)"""
+    db.create_all()
+    shard_router.create_tables(db)
+    added, messages = upgrade_schema()
+    for table, column in added:
+        click.echo(f'Added {table}.{column}')
+    for message in messages:
+        click.echo(message)
+    click.echo('Database tables created.')
+
+
+@click.command('normalize-profiles')
+@with_appcontext
+@each_shard
+def normalize_profiles():
+    """Copy legacy text skills/availability/languages columns into the normalized tables"""
+    legacy = {'skills', 'availability', 'languages'}
+    columns = {column['name'] for column in inspect(db.session.connection()).get_columns('users')}
+    if not legacy <= columns:
+        click.echo('No legacy profile columns found, nothing to do.')
+        return
+    
+    rows = db.session.execute(text(
+        "SELECT id, skills, availability, languages FROM users WHERE user_type = 'artisan'"
+    )).all()
+    migrated = 0
+    for row in rows:
+        user = db.session.get(User, row.id)
+        fields = (
+            ('skills', user.skills, user.set_skills),
+            ('languages', user.languages, user.set_languages),
+            ('availability', user.availability_slots, user.set_availability),
+        )
+        for field, current, setter in fields:
+            value = getattr(row, field)
+            if not value or current:
+                continue
+            # A savepoint per field: a bad value leaves nothing half-set and doesn't stop the others
+            try:
+                with db.session.begin_nested():
+                    setter(value)
+            except (ValueError, KeyError, TypeError) as e:
+                click.echo(f'Skipping {field} for user {row.id}: {e}')
+        migrated += 1
+    
+    db.session.commit()
+    click.echo(f'Normalized profiles for {migrated} artisans.')
+
+
+@click.command('rebuild-ratings')
+@with_appcontext
+@each_shard
+def rebuild_ratings():
+    """Recompute rating and completed-job aggregates for every artisan"""
+    count = rebuild_aggregates()
+    click.echo(f'Rebuilt rating aggregates for {count} artisans.')
+
+
+@click.command('rebuild-stats')
+@with_appcontext
+@each_shard
+def rebuild_dashboard_stats():
+    """Recompute every artisan's dashboard counters"""
+    count = rebuild_stats()
+    db.session.commit()
+    click.echo(f'Rebuilt dashboard stats for {count} artisans.')
+
+
+@click.command('rebuild-analytics')
+@click.option('--chunk-size', type=int, default=50000, help='Requests read per batch')
+@with_appcontext
+@each_shard
+def rebuild_analytics(chunk_size):
+    """Recompute the hourly demand and earnings rollups from request history"""
+    demand, earnings = rebuild_rollups(chunk_size)
+    db.session.commit()
+    click.echo(f'Rebuilt {demand} demand and {earnings} earnings rollup rows.')
+
+
+@click.command('reconcile-payments')
+@click.argument('settlement_file', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option('--batch-size', type=int, default=None)
+@with_appcontext
+@each_shard
+def reconcile_payments(settlement_file, fmt, batch_size):
+    """Settle payments from a provider settlement file, streamed in batches"""
+    settlement_file.seek(0)  # Read again for each shard
+    totals = reconcile(settlement_file, fmt, batch_size)
+    click.echo(', '.join(f'{key}: {value}' for key, value in totals.items()))
+
+
+@click.command('stub-settlement')
+@click.argument('output', type=click.File('w'))
+@click.option('--status', default='completed')
+@with_appcontext
+@each_shard
+def stub_settlement(output, status):
+    """Write a settlement file for pending stub-provider payments"""
+    count = write_stub_settlement(output, status)
+    click.echo(f'Wrote {count} settlement rows.')
+
+
+@click.command('compact-notifications')
+@click.option('--days', type=int, default=None, help='Archive read notifications older than this (default NOTIFICATION_RETENTION_DAYS)')
+@click.option('--hot-limit', type=int, default=None, help='Notifications kept per user (default NOTIFICATION_HOT_LIMIT)')
+@with_appcontext
+@each_shard
+def compact_notifications_command(days, hot_limit):
+    """Move old read notifications into compressed per-user archives"""
+    users, archived = compact_notifications(days, hot_limit)
+    click.echo(f'Archived {archived} notifications for {users} users.')
+
+
+@click.command('compact-requests')
+@click.option('--days', type=int, default=None, help='Archive finished requests not updated for this long (default REQUEST_RETENTION_DAYS)')
+@with_appcontext
+@each_shard
+def compact_requests_command(days):
+    """Move old completed and cancelled requests into service_request_archive"""
+    click.echo(f'Archived {compact_requests(days)} requests.')
+
+
+@click.command('prune-tombstones')
+@with_appcontext
+@each_shard
+def prune_tombstones_command():
+    """Delete delta-sync tombstones older than SYNC_MAX_WATERMARK_AGE_DAYS (the compactor job also does this)"""
+    click.echo(f'Pruned {prune_tombstones()} tombstones.')
+
+
+@click.command('assign-requests')
+@click.option('--mode', type=click.Choice(['dry-run', 'propose', 'assign']), default='dry-run')
+@with_appcontext
+@each_shard
+def assign_requests(mode):
+    """Run one batch dispatch cycle, matching open requests to free artisans"""
+    start = time.perf_counter()
+    plans = run_batch_assignment(mode)
+    for service_request, artisan_id, score in plans:
+        click.echo(f'request {service_request.id} -> artisan {artisan_id} (score {score:.2f})')
+    click.echo(f'{len(plans)} matches ({mode}) in {time.perf_counter() - start:.1f}s.')
+
+
+@click.command('jobs-status')
+@with_appcontext
+def jobs_status():
+    """Show background job queue depth"""
+    for key, value in runner.queue().stats().items():
+        click.echo(f'{key}: {value}')
+
+
+@click.command('run-jobs')
+@click.option('--workers', type=int, default=None, help='Worker threads (default JOB_WORKERS)')
+@click.option('--drain', is_flag=True, help='Run due jobs once and exit')
+@with_appcontext
+def run_jobs(workers, drain):
+    """Run background job workers in a dedicated process"""
+    app = current_app._get_current_object()
+    if drain:
+        click.echo(f'Ran {runner.drain(app)} jobs.')
+        return
+    schedule_request_compaction(delay=0)
+    schedule_batch_assignment(delay=0)
+    runner.start(app, workers)
+    click.echo('Job workers running, press Ctrl+C to stop.')
+    while True:
+        time.sleep(60)
+
+
+@click.command('retry-dead-jobs')
+@with_appcontext
+def retry_dead_jobs():
+    """Requeue jobs that exhausted their retries"""
+    click.echo(f'Requeued {runner.queue().retry_dead()} jobs.')
+
+
+@click.command('replica-heartbeat')
+@click.option('--once', is_flag=True, help='Stamp the heartbeat once and exit')
+@with_appcontext
+def replica_heartbeat(once):
+    """Stamp the primary's heartbeat row every REPLICA_HEARTBEAT_SECONDS so replicas can measure their lag"""
+    interval = current_app.config['REPLICA_HEARTBEAT_SECONDS']
+    while True:
+        beat()
+        if once:
+            break
+        time.sleep(interval)
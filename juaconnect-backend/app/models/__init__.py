@@ -1,4 +1,12 @@
 # Models package
-from app.models.models import User, ServiceRequest, Booking, Review, Payment, Notification
+from app.models.models import (
+    User, Skill, ArtisanLanguage, AvailabilitySlot, ServiceRequest, ServiceRequestArchive, Booking, Review,
+    Payment, LedgerEntry, Notification, NotificationArchive, FeedTombstone, ArtisanStats,
+    DemandRollup, EarningsRollup, ReplicaHeartbeat, UserDirectory
+)
 
-__all__ = ['User', 'ServiceRequest', 'Booking', 'Review', 'Payment', 'Notification']
+__all__ = [
+    'User', 'Skill', 'ArtisanLanguage', 'AvailabilitySlot', 'ServiceRequest', 'ServiceRequestArchive', 'Booking', 'Review',
+    'Payment', 'LedgerEntry', 'Notification', 'NotificationArchive', 'FeedTombstone',
+    'ArtisanStats', 'DemandRollup', 'EarningsRollup', 'ReplicaHeartbeat', 'UserDirectory'
+]
@@ -1,9 +1,55 @@
 from app import db
-from datetime import datetime
+from datetime import datetime, time
+import json
+import zlib
 from werkzeug.security import generate_password_hash, check_password_hash
 
+DAYS_OF_WEEK = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Association table between artisans and the skills they offer
+artisan_skills = db.Table(
+    'artisan_skills',
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Column('skill_id', db.Integer, db.ForeignKey('skills.id'), primary_key=True),
+    db.Index('ix_artisan_skills_skill_user', 'skill_id', 'user_id'),
+)
+
+def split_list(value):
+    """Accept a list, a JSON array string or a comma-separated string"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            value = json.loads(value)
+        else:
+            value = value.split(',')
+    return [' '.join(str(item).split()) for item in value if str(item).strip()]
+
+def parse_day(value):
+    """Convert a day name ('saturday', 'Sat') or number (0=Monday) to 0-6"""
+    if isinstance(value, int) or str(value).isdigit():
+        day = int(value)
+    else:
+        names = [d[:3] for d in DAYS_OF_WEEK]
+        key = str(value).strip().lower()[:3]
+        day = names.index(key) if key in names else -1
+    if not 0 <= day <= 6:
+        raise ValueError(f'Invalid day: {value}')
+    return day
+
+def parse_time(value):
+    """Convert 'HH:MM' to a time object"""
+    if isinstance(value, time):
+        return value
+    hours, minutes = str(value).strip().split(':')[:2]
+    return time(int(hours), int(minutes))
+
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_type_rating', 'user_type', 'rating'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -17,23 +63,29 @@ class User(db.Model):
     # Relationships
     client_requests = db.relationship('ServiceRequest', backref='client', lazy=True, foreign_keys='ServiceRequest.client_id')
     artisan_requests = db.relationship('ServiceRequest', backref='artisan', lazy=True, foreign_keys='ServiceRequest.artisan_id')
-    reviews = db.relationship('Review', backref='reviewer', lazy=True)
+    reviews = db.relationship('Review', backref='reviewer', lazy=True, foreign_keys='Review.reviewer_id')
+    skills = db.relationship('Skill', secondary=artisan_skills, lazy=True)
+    languages = db.relationship('ArtisanLanguage', lazy=True, cascade='all, delete-orphan')
+    availability_slots = db.relationship('AvailabilitySlot', lazy=True, cascade='all, delete-orphan',
+                                         order_by='(AvailabilitySlot.day_of_week, AvailabilitySlot.start_time)')
     
     # Artisan-specific fields
     service_category = db.Column(db.String(100))
     experience_years = db.Column(db.Integer)
     bio = db.Column(db.Text)
-    rating = db.Column(db.Float, default=0.0)
+    rating = db.Column(db.Float, default=0.0)  # Bayesian average, see app/services/ratings.py
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_jobs = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     is_verified = db.Column(db.Boolean, default=False)
     
     # Additional artisan fields for profile management
     profile_photo = db.Column(db.String(500))  # URL to profile photo
-    skills = db.Column(db.Text)  # JSON array of skills stored as text
     hourly_rate = db.Column(db.Float)  # Hourly rate in Ksh
-    availability = db.Column(db.Text)  # JSON object with availability schedule
-    portfolio_urls = db.Column(db.Text)  # JSON array of portfolio image URLs
-    languages = db.Column(db.String(200))  # Comma-separated list of languages
+    portfolio_urls = db.Column(db.JSON)  # List of portfolio image URLs
     service_area = db.Column(db.String(255))  # Areas where the artisan provides service
+    latitude = db.Column(db.Float)  # Optional coordinates used for distance ranking
+    longitude = db.Column(db.Float)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -41,6 +93,55 @@ class User(db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def set_skills(self, value):
+        """Replace the artisan's skills, creating unknown skills on the fly"""
+        skills = []
+        for name in split_list(value):
+            slug = name.lower()
+            skill = Skill.query.filter_by(slug=slug).first()
+            if not skill:
+                skill = Skill(name=name, slug=slug)
+                db.session.add(skill)
+            if skill not in skills:
+                skills.append(skill)
+        self.skills = skills
+    
+    def set_languages(self, value):
+        """Replace the artisan's languages"""
+        languages = dict.fromkeys(name.lower() for name in split_list(value))
+        self.languages = [ArtisanLanguage(language=name) for name in languages]
+    
+    def set_availability(self, value):
+        """Replace the weekly schedule.
+        
+        Accepts {day: [{'start': 'HH:MM', 'end': 'HH:MM'}, ...]}, where each
+        entry may also be a single {'start', 'end'} object or an 'HH:MM-HH:MM' string.
+        """
+        if isinstance(value, str):
+            value = json.loads(value) if value.strip() else {}
+        slots = []
+        for day, entries in (value or {}).items():
+            if isinstance(entries, (dict, str)):
+                entries = [entries]
+            for entry in entries:
+                if isinstance(entry, str):
+                    start, end = entry.split('-')
+                else:
+                    start, end = entry['start'], entry['end']
+                slot = AvailabilitySlot(day_of_week=parse_day(day),
+                                        start_time=parse_time(start),
+                                        end_time=parse_time(end))
+                if slot.end_time <= slot.start_time:
+                    raise ValueError(f'Availability slot on {day} must end after it starts')
+                slots.append(slot)
+        self.availability_slots = slots
+    
+    def availability_dict(self):
+        schedule = {}
+        for slot in self.availability_slots:
+            schedule.setdefault(DAYS_OF_WEEK[slot.day_of_week], []).append(slot.to_dict())
+        return schedule
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -54,19 +155,75 @@ class User(db.Model):
             'experience_years': self.experience_years,
             'bio': self.bio,
             'rating': self.rating,
+            'rating_count': self.rating_count,
+            'completed_jobs': self.completed_jobs,
             'is_verified': self.is_verified,
             # Additional artisan fields
             'profile_photo': self.profile_photo,
-            'skills': self.skills,
+            'skills': ','.join(skill.name for skill in self.skills),
             'hourly_rate': self.hourly_rate,
-            'availability': self.availability,
-            'portfolio_urls': self.portfolio_urls,
-            'languages': self.languages,
+            'availability': self.availability_dict(),
+            'portfolio_urls': self.portfolio_urls or [],
+            'languages': ','.join(lang.language.title() for lang in self.languages),
             'service_area': self.service_area,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
         }
 
+class Skill(db.Model):
+    __tablename__ = 'skills'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(100), unique=True, nullable=False, index=True)  # Lowercased name for lookups
+
+class ArtisanLanguage(db.Model):
+    __tablename__ = 'artisan_languages'
+    __table_args__ = (
+        db.Index('ix_artisan_languages_language_user', 'language', 'user_id'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    language = db.Column(db.String(50), primary_key=True)  # Stored lowercased
+
+class AvailabilitySlot(db.Model):
+    __tablename__ = 'availability_slots'
+    __table_args__ = (
+        db.Index('ix_availability_slots_day_user', 'day_of_week', 'user_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    day_of_week = db.Column(db.Integer, nullable=False)  # 0 = Monday ... 6 = Sunday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'start': self.start_time.strftime('%H:%M'),
+            'end': self.end_time.strftime('%H:%M'),
+        }
+
+ACTIVE_STATUSES = ('pending', 'accepted', 'in_progress')
+TERMINAL_STATUSES = ('completed', 'cancelled')
+
+# WHERE clauses of the partial indexes that keep the working set small however much history
+# piles up. Queries must repeat them with literal values (not bound parameters) for SQLite
+# to pick the index, see ServiceRequest.is_open()/is_active().
+OPEN_REQUESTS = "status = 'pending' AND artisan_id IS NULL"
+ACTIVE_ASSIGNMENTS = "status IN ('accepted', 'in_progress')"
+
 class ServiceRequest(db.Model):
+    """A request in any state; terminal ones move to service_request_archive once old enough"""
     __tablename__ = 'service_requests'
+    __table_args__ = (
+        db.Index('ix_service_requests_open', 'service_category', 'created_at',
+                 sqlite_where=db.text(OPEN_REQUESTS), postgresql_where=db.text(OPEN_REQUESTS)),
+        db.Index('ix_service_requests_active_artisan', 'artisan_id', 'created_at',
+                 sqlite_where=db.text(ACTIVE_ASSIGNMENTS), postgresql_where=db.text(ACTIVE_ASSIGNMENTS)),
+        db.Index('ix_service_requests_client', 'client_id', 'created_at'),
+        db.UniqueConstraint('client_id', 'idempotency_key', name='uq_service_requests_client_key'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -75,12 +232,27 @@ class ServiceRequest(db.Model):
     description = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, accepted, in_progress, completed, cancelled
     location = db.Column(db.String(255), nullable=False)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     budget = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    accepted_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    idempotency_key = db.Column(db.String(100))  # Client-supplied, makes resubmits safe; not kept in the archive
     
     # Relationships
-    bookings = db.relationship('Booking', backref='request', lazy=True)
+    bookings = db.relationship('Booking', backref='request', lazy=True,
+                               primaryjoin='ServiceRequest.id == foreign(Booking.request_id)')
+    
+    @classmethod
+    def is_open(cls):
+        """Pending and unassigned, phrased to match ix_service_requests_open"""
+        return db.and_(cls.status == db.literal_column("'pending'"), cls.artisan_id.is_(None))
+    
+    @classmethod
+    def is_active(cls):
+        """Accepted or in progress, phrased to match ix_service_requests_active_artisan"""
+        return cls.status.in_([db.literal_column("'accepted'"), db.literal_column("'in_progress'")])
     
     def to_dict(self):
         return {
@@ -93,16 +265,54 @@ class ServiceRequest(db.Model):
             'description': self.description,
             'status': self.status,
             'location': self.location,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
             'budget': self.budget,
             'created_at': self.created_at.isoformat(),
+            'accepted_at': self.accepted_at.isoformat() if self.accepted_at else None,
             'updated_at': self.updated_at.isoformat(),
         }
 
+class ServiceRequestArchive(db.Model):
+    """Completed and cancelled requests moved out of service_requests, keeping their ids"""
+    __tablename__ = 'service_request_archive'
+    __table_args__ = (
+        db.Index('ix_service_request_archive_client', 'client_id', 'created_at'),
+        db.Index('ix_service_request_archive_artisan', 'artisan_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    artisan_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    service_category = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # completed, cancelled
+    location = db.Column(db.String(255), nullable=False)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    budget = db.Column(db.Float)
+    created_at = db.Column(db.DateTime)
+    accepted_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    client = db.relationship('User', foreign_keys=[client_id], lazy=True)
+    artisan = db.relationship('User', foreign_keys=[artisan_id], lazy=True)
+    bookings = db.relationship('Booking', lazy=True, viewonly=True,
+                               primaryjoin='ServiceRequestArchive.id == foreign(Booking.request_id)')
+    
+    to_dict = ServiceRequest.to_dict
+
 class Booking(db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        db.Index('ix_bookings_artisan_start', 'artisan_id', 'start_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    request_id = db.Column(db.Integer, db.ForeignKey('service_requests.id'), nullable=False)
+    # service_requests.id, or service_request_archive.id once compacted, so no foreign key
+    request_id = db.Column(db.Integer, nullable=False, index=True)
+    artisan_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # Denormalized from the request for schedule lookups
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime)
     total_amount = db.Column(db.Float)
@@ -113,19 +323,31 @@ class Booking(db.Model):
         return {
             'id': self.id,
             'request_id': self.request_id,
+            'artisan_id': self.artisan_id,
             'start_date': self.start_date.isoformat(),
             'end_date': self.end_date.isoformat() if self.end_date else None,
             'total_amount': self.total_amount,
             'status': self.status,
             'created_at': self.created_at.isoformat(),
         }
+    
+    def service_request(self):
+        """The booking's request, from the hot table or the archive"""
+        return self.request or db.session.get(ServiceRequestArchive, self.request_id)
 
 class Review(db.Model):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        db.UniqueConstraint('booking_id', 'reviewer_id', name='uq_reviews_booking_reviewer'),
+        # An artisan's review page is a range scan on this index, newest first
+        db.Index('ix_reviews_artisan_id', 'artisan_id', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
     reviewer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    artisan_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # Denormalized from booking -> request
+    reviewer_name = db.Column(db.String(80))  # Denormalized reviewer username for listings
     rating = db.Column(db.Integer, nullable=False)  # 1-5
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -134,22 +356,37 @@ class Review(db.Model):
         return {
             'id': self.id,
             'booking_id': self.booking_id,
+            'artisan_id': self.artisan_id,
             'reviewer_id': self.reviewer_id,
-            'reviewer': self.reviewer.to_dict() if self.reviewer else None,
+            'reviewer': {'id': self.reviewer_id, 'username': self.reviewer_name},
             'rating': self.rating,
             'comment': self.comment,
             'created_at': self.created_at.isoformat(),
         }
 
+# Payments that block another payment for the same booking; failed ones can be retried
+LIVE_PAYMENTS = "status IN ('pending', 'completed')"
+
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.UniqueConstraint('client_id', 'idempotency_key', name='uq_payments_client_key'),
+        db.Index('uq_payments_live_booking', 'booking_id', unique=True,
+                 sqlite_where=db.text(LIVE_PAYMENTS), postgresql_where=db.text(LIVE_PAYMENTS)),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # Payer; scopes idempotency keys
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed
     payment_method = db.Column(db.String(50))
+    idempotency_key = db.Column(db.String(100))  # Client-supplied, makes retries safe
+    provider_reference = db.Column(db.String(100), unique=True)  # Provider's id, used to match callbacks
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    settled_at = db.Column(db.DateTime)
+    
+    booking = db.relationship('Booking', backref='payments', lazy=True)
     
     def to_dict(self):
         return {
@@ -159,10 +396,42 @@ class Payment(db.Model):
             'status': self.status,
             'payment_method': self.payment_method,
             'created_at': self.created_at.isoformat(),
+            'settled_at': self.settled_at.isoformat() if self.settled_at else None,
+        }
+
+class LedgerEntry(db.Model):
+    """Append-only record of money credited to an artisan, with the running balance after it"""
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (
+        db.UniqueConstraint('payment_id', 'entry_type', name='uq_ledger_entries_payment_type'),
+        db.Index('ix_ledger_entries_artisan_id', 'artisan_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    artisan_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'))
+    entry_type = db.Column(db.String(20), nullable=False, default='payment')  # payment
+    amount = db.Column(db.Float, nullable=False)
+    balance_after = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'artisan_id': self.artisan_id,
+            'payment_id': self.payment_id,
+            'entry_type': self.entry_type,
+            'amount': self.amount,
+            'balance_after': self.balance_after,
+            'created_at': self.created_at.isoformat(),
         }
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_updated', 'user_id', 'updated_at'),
+        db.Index('ix_notifications_user_read', 'user_id', 'is_read', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -172,6 +441,7 @@ class Notification(db.Model):
     related_id = db.Column(db.Integer)  # ID of related request/booking
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship
     user = db.relationship('User', backref='notifications', lazy=True)
@@ -187,3 +457,141 @@ class Notification(db.Model):
             'is_read': self.is_read,
             'created_at': self.created_at.isoformat(),
         }
+
+class NotificationArchive(db.Model):
+    """A chunk of a user's read notifications compacted out of the notifications table"""
+    __tablename__ = 'notification_archives'
+    __table_args__ = (
+        db.Index('ix_notification_archives_user_id', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    oldest_at = db.Column(db.DateTime, nullable=False)
+    newest_at = db.Column(db.DateTime, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON list of Notification.to_dict()
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @staticmethod
+    def pack(notifications):
+        return zlib.compress(json.dumps(notifications, separators=(',', ':')).encode(), 9)
+    
+    def notifications(self):
+        return json.loads(zlib.decompress(self.payload))
+
+class FeedTombstone(db.Model):
+    """Marks a row that left a user's feed in a way its updated_at cannot show (deleted or reassigned)"""
+    __tablename__ = 'feed_tombstones'
+    __table_args__ = (
+        db.Index('ix_feed_tombstones_feed_user_removed', 'feed', 'user_id', 'removed_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    feed = db.Column(db.String(30), nullable=False)  # notifications, accepted_requests
+    user_id = db.Column(db.Integer, nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    removed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class ArtisanStats(db.Model):
+    """Per-artisan dashboard counters, updated on every request state transition"""
+    __tablename__ = 'artisan_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    accepted_count = db.Column(db.Integer, nullable=False, default=0)
+    in_progress_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+    earnings_total = db.Column(db.Float, nullable=False, default=0.0)  # Sum of completed Booking.total_amount
+    paid_total = db.Column(db.Float, nullable=False, default=0.0)  # Sum of completed Payment.amount
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'requests': {
+                'pending': self.pending_count,
+                'accepted': self.accepted_count,
+                'in_progress': self.in_progress_count,
+                'completed': self.completed_count,
+                'cancelled': self.cancelled_count,
+            },
+            'earnings': {
+                'total': self.earnings_total,
+                'paid': self.paid_total,
+            },
+            'unread_notifications': self.unread_notifications,
+        }
+
+class DemandRollup(db.Model):
+    """Request activity per hour, category and area, counted as each transition happens"""
+    __tablename__ = 'demand_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'service_category', 'area', name='uq_demand_rollups_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the UTC hour
+    service_category = db.Column(db.String(100), nullable=False)
+    area = db.Column(db.String(100), nullable=False)
+    created_count = db.Column(db.Integer, nullable=False, default=0)
+    accepted_count = db.Column(db.Integer, nullable=False, default=0)
+    accept_seconds_total = db.Column(db.Float, nullable=False, default=0.0)  # Sum of created_at -> accepted_at
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+    earnings_total = db.Column(db.Float, nullable=False, default=0.0)  # Completed booking amounts
+    
+    def to_dict(self):
+        return {
+            'bucket': self.bucket.isoformat(),
+            'service_category': self.service_category,
+            'area': self.area,
+            'created_count': self.created_count,
+            'accepted_count': self.accepted_count,
+            'accept_seconds_total': self.accept_seconds_total,
+            'completed_count': self.completed_count,
+            'cancelled_count': self.cancelled_count,
+            'earnings_total': self.earnings_total,
+        }
+
+class EarningsRollup(db.Model):
+    """Completed jobs and earnings per artisan per hour"""
+    __tablename__ = 'earnings_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('artisan_id', 'bucket', name='uq_earnings_rollups_key'),
+        db.Index('ix_earnings_rollups_bucket', 'bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the UTC hour
+    artisan_id = db.Column(db.Integer, nullable=False)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    earnings_total = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def to_dict(self):
+        return {
+            'bucket': self.bucket.isoformat(),
+            'artisan_id': self.artisan_id,
+            'completed_count': self.completed_count,
+            'earnings_total': self.earnings_total,
+        }
+
+class ReplicaHeartbeat(db.Model):
+    """Single row stamped on the primary by `flask replica-heartbeat`; replicas measure their lag with it"""
+    __tablename__ = 'replica_heartbeat'
+    __table_args__ = {'info': {'global': True}}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.Float, nullable=False)  # Unix time on the primary
+
+class UserDirectory(db.Model):
+    """In sharded mode: every user's global id, email, username and home region"""
+    __tablename__ = 'user_directory'
+    __table_args__ = {'info': {'global': True}}  # Kept in DATABASE_URL, never sharded
+    
+    id = db.Column(db.Integer, primary_key=True)  # Used as users.id in the home shard
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    region = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
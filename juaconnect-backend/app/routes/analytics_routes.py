@@ -0,0 +1,80 @@
+import hmac
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Blueprint, request, jsonify, current_app
+from app.services.analytics import (
+    demand_rows, earnings_rows, merge_rows, hour_bucket, DEMAND_COUNTERS, EARNINGS_COUNTERS
+)
+from app.services.scheduling import parse_datetime
+from app.services.replicas import replica_read
+from app.services.sharding import shard_router
+
+bp = Blueprint('analytics', __name__, url_prefix='/v1/analytics')
+
+def analytics_key_required(view):
+    """Reports are for ops dashboards, which send ANALYTICS_API_KEY in X-Analytics-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = current_app.config['ANALYTICS_API_KEY']
+        if not key or not hmac.compare_digest(key, request.headers.get('X-Analytics-Key', '')):
+            return jsonify({'success': False, 'message': 'A valid X-Analytics-Key is required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def parse_window():
+    """(start, end, granularity) from ?from=, ?to= and ?granularity=; raises ValueError"""
+    end = parse_datetime(request.args['to']) if request.args.get('to') else datetime.utcnow()
+    start = parse_datetime(request.args['from']) if request.args.get('from') else end - timedelta(days=7)
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ('hour', 'day'):
+        raise ValueError('granularity must be hour or day')
+    if start >= end:
+        raise ValueError('from must be before to')
+    if end - start > timedelta(days=current_app.config['ANALYTICS_MAX_DAYS']):
+        raise ValueError(f"At most {current_app.config['ANALYTICS_MAX_DAYS']} days per report")
+    return hour_bucket(start), end, granularity
+
+@bp.route('/demand', methods=['GET'])
+@analytics_key_required
+@replica_read
+def get_demand():
+    """Requests created, accepted, completed and cancelled per hour (or day), category and area.
+    
+    Optional filters: service_category, area. Includes the average seconds from
+    creation to acceptance and the earnings of completed jobs.
+    """
+    try:
+        start, end, granularity = parse_window()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    category, area = request.args.get('service_category'), request.args.get('area')
+    rows = shard_router.gather(
+        lambda: demand_rows(start, end, category, area), region=shard_router.requested_region()
+    )
+    return jsonify({
+        'success': True,
+        'data': merge_rows(
+            [row for shard in rows for row in shard], ('service_category', 'area'), DEMAND_COUNTERS, granularity
+        ),
+    }), 200
+
+@bp.route('/earnings', methods=['GET'])
+@analytics_key_required
+@replica_read
+def get_earnings():
+    """Completed jobs and earnings per hour (or day) and artisan, optionally for one artisan_id"""
+    try:
+        start, end, granularity = parse_window()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    artisan_id = request.args.get('artisan_id', type=int)
+    region = shard_router.home_region(user_id=artisan_id) if artisan_id and shard_router.enabled() else None
+    rows = shard_router.gather(
+        lambda: earnings_rows(start, end, artisan_id), region=region or shard_router.requested_region()
+    )
+    return jsonify({
+        'success': True,
+        'data': merge_rows([row for shard in rows for row in shard], ('artisan_id',), EARNINGS_COUNTERS, granularity),
+    }), 200
@@ -1,49 +1,164 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import selectinload
+from datetime import datetime
 from app import db
-from app.models import User, ServiceRequest
-from app.routes.notification_routes import create_notification
+from app.models import User, ServiceRequest, Booking, Review, Skill, ArtisanLanguage, AvailabilitySlot
+from app.models.models import split_list, parse_day, parse_time
+from app.routes.notification_routes import notify
+from app.services.scheduling import parse_datetime, find_free_artisans, release_bookings, schedule_index
+from app.services.ratings import record_completed_job
+from app.services.dispatch import category_index
+from app.services.stats import record_transition, add_earnings, get_stats
+from app.services.analytics import record_request_event
+from app.services.sync import (
+    WatermarkExpired, SHARED_FEED, parse_since, next_watermark, record_tombstone, tombstones_since, delta_response
+)
+from app.services.replicas import replica_read
+from app.services.sharding import shard_router
 
 bp = Blueprint('artisan', __name__, url_prefix='/v1/artisan')
 
+def sort_artisans(query, sort):
+    """Apply the ?sort= param; ratings are precomputed so no joins are needed"""
+    if sort == 'rating':
+        return query.order_by(User.rating.desc(), User.rating_count.desc())
+    if sort == 'completed_jobs':
+        return query.order_by(User.completed_jobs.desc())
+    return query
+
+def merge_artisans(results):
+    """Join per-shard artisan lists, keeping the ?sort= order across shards"""
+    artisans = [artisan for shard in results for artisan in shard]
+    if len(results) > 1:
+        sort = request.args.get('sort')
+        if sort == 'rating':
+            artisans.sort(key=lambda a: (a['rating'] or 0, a['rating_count']), reverse=True)
+        elif sort == 'completed_jobs':
+            artisans.sort(key=lambda a: a['completed_jobs'], reverse=True)
+    return artisans
+
+def with_profile():
+    """Query options that batch-load the normalized profile collections"""
+    return (
+        selectinload(User.skills),
+        selectinload(User.languages),
+        selectinload(User.availability_slots),
+    )
+
 @bp.route('/search', methods=['GET'])
+@replica_read
 def search_artisans():
-    """Search for artisans by service category and/or location"""
+    """Search for artisans by service category, location, skills, languages and availability.
+    
+    Query params:
+    - skill / language: comma-separated, artisans must have all of them
+    - day: day of week the artisan must be available ('saturday', 'sat' or 0-6)
+    - time: 'HH:MM' the artisan must be available at (requires day)
+    - sort: 'rating' or 'completed_jobs'
+    """
     service_category = request.args.get('service_category')
     location = request.args.get('location')
+    sort = request.args.get('sort')
     
-    # Base query - only return verified artisans
-    query = User.query.filter_by(user_type='artisan', is_verified=True)
+    try:
+        skills = [name.lower() for name in split_list(request.args.get('skill'))]
+        languages = [name.lower() for name in split_list(request.args.get('language'))]
+        day = request.args.get('day')
+        day = parse_day(day) if day else None
+        at_time = request.args.get('time')
+        at_time = parse_time(at_time) if at_time else None
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    def search():
+        # Base query - only return verified artisans
+        query = User.query.filter_by(user_type='artisan', is_verified=True).options(*with_profile())
+        
+        # Filter by service category
+        if service_category:
+            query = query.filter(User.service_category.ilike(f'%{service_category}%'))
+        
+        # Filter by location or service area
+        if location:
+            query = query.filter(
+                (User.location.ilike(f'%{location}%')) | 
+                (User.service_area.ilike(f'%{location}%'))
+            )
+        
+        # Each filter is an indexed EXISTS lookup on the normalized tables
+        for slug in skills:
+            query = query.filter(User.skills.any(Skill.slug == slug))
+        
+        for language in languages:
+            query = query.filter(User.languages.any(ArtisanLanguage.language == language))
+        
+        if day is not None:
+            slot_filter = AvailabilitySlot.day_of_week == day
+            if at_time is not None:
+                slot_filter = slot_filter & (AvailabilitySlot.start_time <= at_time) & (AvailabilitySlot.end_time > at_time)
+            query = query.filter(User.availability_slots.any(slot_filter))
+        
+        return [artisan.to_dict() for artisan in sort_artisans(query, sort).all()]
     
-    # Filter by service category
-    if service_category:
-        query = query.filter(User.service_category.ilike(f'%{service_category}%'))
+    # In sharded mode a search without a location covers every region
+    artisans = merge_artisans(shard_router.gather(search, region=shard_router.requested_region()))
     
-    # Filter by location or service area
-    if location:
-        query = query.filter(
-            (User.location.ilike(f'%{location}%')) | 
-            (User.service_area.ilike(f'%{location}%'))
-        )
+    return jsonify({
+        'success': True,
+        'data': artisans
+    }), 200
+
+@bp.route('/free', methods=['GET'])
+@replica_read
+def get_free_artisans():
+    """Get verified artisans in a category who are free between start and end (ISO 8601)"""
+    service_category = request.args.get('service_category')
     
-    artisans = query.all()
+    try:
+        start = parse_datetime(request.args['start'])
+        end = parse_datetime(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'start and end are required ISO 8601 datetimes'
+        }), 400
+    
+    if end <= start:
+        return jsonify({
+            'success': False,
+            'message': 'end must be after start'
+        }), 400
+    
+    artisans = merge_artisans(shard_router.gather(
+        lambda: [artisan.to_dict() for artisan in find_free_artisans(service_category, start, end)],
+        region=shard_router.requested_region()
+    ))
     
     return jsonify({
         'success': True,
-        'data': [artisan.to_dict() for artisan in artisans]
+        'data': artisans
     }), 200
 
 @bp.route('/', methods=['GET'])
+@replica_read
 def get_all_artisans():
-    """Get all verified artisans"""
-    artisans = User.query.filter_by(user_type='artisan', is_verified=True).all()
+    """Get all verified artisans, optionally sorted with ?sort=rating"""
+    sort = request.args.get('sort')
+    
+    def list_artisans():
+        query = User.query.filter_by(user_type='artisan', is_verified=True).options(*with_profile())
+        return [artisan.to_dict() for artisan in sort_artisans(query, sort).all()]
+    
+    artisans = merge_artisans(shard_router.gather(list_artisans, region=shard_router.requested_region()))
     
     return jsonify({
         'success': True,
-        'data': [artisan.to_dict() for artisan in artisans]
+        'data': artisans
     }), 200
 
 @bp.route('/<int:artisan_id>', methods=['GET'])
+@replica_read
 def get_artisan(artisan_id):
     """Get artisan details by ID"""
     artisan = User.query.filter_by(id=artisan_id, user_type='artisan').first()
@@ -59,6 +174,61 @@ def get_artisan(artisan_id):
         'data': artisan.to_dict()
     }), 200
 
+@bp.route('/<int:artisan_id>/reviews', methods=['GET'])
+@replica_read
+def get_artisan_reviews(artisan_id):
+    """Get an artisan's reviews, newest first.
+    
+    Page with ?before=<review id>&limit=N; next_before in the response is the
+    cursor for the following page.
+    """
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    query = Review.query.filter_by(artisan_id=artisan_id)
+    
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(Review.id < before)
+    
+    reviews = query.order_by(Review.id.desc()).limit(limit).all()
+    
+    return jsonify({
+        'success': True,
+        'data': [review.to_dict() for review in reviews],
+        'next_before': reviews[-1].id if len(reviews) == limit else None
+    }), 200
+
+@bp.route('/<int:artisan_id>/dashboard', methods=['GET'])
+@jwt_required()
+def get_dashboard(artisan_id):
+    """Get the artisan's dashboard summary from precomputed counters"""
+    user_id = get_jwt_identity()
+    
+    if user_id != artisan_id:
+        return jsonify({
+            'success': False,
+            'message': 'Unauthorized'
+        }), 403
+    
+    user = User.query.get(user_id)
+    
+    if not user or user.user_type != 'artisan':
+        return jsonify({
+            'success': False,
+            'message': 'Artisan not found'
+        }), 404
+    
+    data = get_stats(user_id).to_dict()
+    data.update({
+        'rating': user.rating,
+        'rating_count': user.rating_count,
+        'completed_jobs': user.completed_jobs,
+    })
+    
+    return jsonify({
+        'success': True,
+        'data': data
+    }), 200
+
 @bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_artisan_profile():
@@ -102,13 +272,22 @@ def update_artisan_profile():
         
         # Update additional profile fields
         user.profile_photo = data.get('profile_photo', user.profile_photo)
-        user.skills = data.get('skills', user.skills)
         user.hourly_rate = data.get('hourly_rate', user.hourly_rate)
-        user.availability = data.get('availability', user.availability)
-        user.languages = data.get('languages', user.languages)
+        user.portfolio_urls = data.get('portfolio_urls', user.portfolio_urls)
         user.service_area = data.get('service_area', user.service_area)
+        user.latitude = data.get('latitude', user.latitude)
+        user.longitude = data.get('longitude', user.longitude)
+        
+        # Normalized profile collections
+        if 'skills' in data:
+            user.set_skills(data['skills'])
+        if 'languages' in data:
+            user.set_languages(data['languages'])
+        if 'availability' in data:
+            user.set_availability(data['availability'])
         
         db.session.commit()
+        category_index.update(user)
         
         return jsonify({
             'success': True,
@@ -116,6 +295,13 @@ def update_artisan_profile():
             'message': 'Profile updated successfully'
         }), 200
     
+    except (ValueError, KeyError) as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Invalid profile data: {e}'
+        }), 400
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -138,6 +324,9 @@ def get_available_requests():
     - Have status 'pending'
     - Are not already assigned to an artisan (artisan_id is NULL)
     - Optionally filtered by the artisan's service category
+    
+    With ?since=<watermark> only requests changed after the watermark are returned,
+    plus the ids of requests that left the feed under 'removed'.
     """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
@@ -149,18 +338,38 @@ def get_available_requests():
         }), 403
     
     try:
+        since = parse_since()
+    except WatermarkExpired:
+        return jsonify({
+            'success': False,
+            'message': 'Watermark expired, fetch the full feed'
+        }), 410
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid since watermark'
+        }), 400
+    watermark = next_watermark()
+    
+    try:
+        if since is not None:
+            # Requests that left the pool are tombstoned; other closed requests were never in the feed
+            changed = ServiceRequest.query.filter(ServiceRequest.is_open(), ServiceRequest.updated_at > since).all()
+            return jsonify(delta_response(
+                changed, lambda req: True, watermark,
+                removed=tombstones_since('available_requests', SHARED_FEED, since)
+            )), 200
+        
         # Get all pending requests that are not yet assigned to any artisan
         # Optionally filter by matching service category if artisan has one
-        query = ServiceRequest.query.filter_by(status='pending', artisan_id=None)
+        query = ServiceRequest.query.filter(ServiceRequest.is_open())
         
         if user.service_category:
             # Also show requests that match the artisan's service category
             # Using OR to include both: requests without specific artisan preference
             # OR requests that match the artisan's specialty
-            matching_requests = ServiceRequest.query.filter_by(
-                status='pending',
-                artisan_id=None,
-                service_category=user.service_category
+            matching_requests = query.filter(
+                ServiceRequest.service_category == user.service_category
             ).all()
             
             all_requests = query.all()
@@ -175,14 +384,16 @@ def get_available_requests():
             
             return jsonify({
                 'success': True,
-                'data': [req.to_dict() for req in combined_requests]
+                'data': [req.to_dict() for req in combined_requests],
+                'watermark': watermark
             }), 200
         
         requests = query.all()
         
         return jsonify({
             'success': True,
-            'data': [req.to_dict() for req in requests]
+            'data': [req.to_dict() for req in requests],
+            'watermark': watermark
         }), 200
     
     except Exception as e:
@@ -200,6 +411,8 @@ def get_accepted_requests():
     Returns requests where:
     - artisan_id matches the current user's ID
     - Status is 'accepted' or 'in_progress'
+    
+    Supports ?since=<watermark> like get_available_requests.
     """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
@@ -211,15 +424,42 @@ def get_accepted_requests():
         }), 403
     
     try:
+        since = parse_since()
+    except WatermarkExpired:
+        return jsonify({
+            'success': False,
+            'message': 'Watermark expired, fetch the full feed'
+        }), 410
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid since watermark'
+        }), 400
+    watermark = next_watermark()
+    
+    try:
+        if since is not None:
+            changed = ServiceRequest.query.filter(
+                ServiceRequest.artisan_id == user_id,
+                ServiceRequest.updated_at > since
+            ).all()
+            return jsonify(delta_response(
+                changed,
+                lambda req: req.status in ('accepted', 'in_progress'),
+                watermark,
+                removed=tombstones_since('accepted_requests', user_id, since)
+            )), 200
+        
         # Get requests accepted by this artisan
         requests = ServiceRequest.query.filter(
             ServiceRequest.artisan_id == user_id,
-            ServiceRequest.status.in_(['accepted', 'in_progress'])
+            ServiceRequest.is_active()
         ).order_by(ServiceRequest.created_at.desc()).all()
         
         return jsonify({
             'success': True,
-            'data': [req.to_dict() for req in requests]
+            'data': [req.to_dict() for req in requests],
+            'watermark': watermark
         }), 200
     
     except Exception as e:
@@ -269,11 +509,14 @@ def accept_request(request_id):
     try:
         service_request.artisan_id = user_id
         service_request.status = 'accepted'
+        record_tombstone('available_requests', SHARED_FEED, service_request.id)
+        record_transition(user_id, None, 'accepted')
+        record_request_event(service_request, 'accepted')
         db.session.commit()
         
         # Notify the client that their request has been accepted
         if service_request.client:
-            create_notification(
+            notify(
                 user_id=service_request.client_id,
                 title='Request Accepted',
                 message=f'{user.username} has accepted your {service_request.service_category} request!',
@@ -338,18 +581,27 @@ def reject_request(request_id):
         }), 403
     
     try:
-        if service_request.status in ['pending', 'accepted']:
+        old_status = service_request.status
+        if old_status in ['pending', 'accepted']:
             service_request.status = 'cancelled'
+            record_request_event(service_request, 'cancelled')
             service_request.artisan_id = None
-        elif service_request.status == 'in_progress':
+            record_transition(user_id, old_status, None)
+            # The row no longer matches this artisan, so tell delta-sync clients explicitly
+            record_tombstone('accepted_requests', user_id, service_request.id)
+        elif old_status == 'in_progress':
             # If work already started, mark as cancelled but keep record
             service_request.status = 'cancelled'
+            record_request_event(service_request, 'cancelled')
+            record_transition(user_id, 'in_progress', 'cancelled')
         
+        released = release_bookings(service_request, 'cancelled')
         db.session.commit()
+        schedule_index.remove(released)
         
         # Notify the client
         if service_request.client:
-            create_notification(
+            notify(
                 user_id=service_request.client_id,
                 title='Request Declined',
                 message=f'Sorry, the artisan was unable to take on your {service_request.service_category} request.',
@@ -410,11 +662,12 @@ def start_work(request_id):
     
     try:
         service_request.status = 'in_progress'
+        record_transition(user_id, 'accepted', 'in_progress')
         db.session.commit()
         
         # Notify the client that work has started
         if service_request.client:
-            create_notification(
+            notify(
                 user_id=service_request.client_id,
                 title='Work Started',
                 message=f'{user.username} has started working on your {service_request.service_category} request.',
@@ -444,6 +697,7 @@ def complete_work(request_id):
     Only the assigned artisan can mark work as completed.
     Status must be 'in_progress' before completing.
     After completion, the client will be notified to make payment.
+    An optional total_amount sets the amount due when no booking exists yet.
     """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
@@ -476,11 +730,36 @@ def complete_work(request_id):
     
     try:
         service_request.status = 'completed'
+        released = release_bookings(service_request, 'completed')
+        if not service_request.bookings:
+            # Record the job as a completed booking so it can be paid
+            data = request.get_json(silent=True) or {}
+            now = datetime.utcnow()
+            booking = Booking(
+                request=service_request,
+                artisan_id=user_id,
+                start_date=now,
+                end_date=now,
+                total_amount=data.get('total_amount', service_request.budget),
+                status='completed'
+            )
+            db.session.add(booking)
+            released = [booking]
+        record_completed_job(user)
+        earned = sum(booking.total_amount or 0 for booking in released)
+        record_transition(user_id, 'in_progress', 'completed')
+        add_earnings(user_id, earned)
+        record_request_event(service_request, 'completed', earned)
         db.session.commit()
+        schedule_index.remove(released)
+        
+        # Count the price in this process's estimate histograms (imported here to keep numpy out of startup)
+        from app.services.pricing import record_price
+        record_price(service_request, earned)
         
         # Notify the client that work is complete and payment is due
         if service_request.client:
-            create_notification(
+            notify(
                 user_id=service_request.client_id,
                 title='Work Completed - Payment Required',
                 message=f'{user.username} has completed your {service_request.service_category} request. Please proceed with payment.',
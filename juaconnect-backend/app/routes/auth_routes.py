@@ -1,7 +1,10 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from app import db
 from app.models import User
+from app.services.dispatch import category_index
+from app.services.stats import create_stats
+from app.services.sharding import shard_router
 
 bp = Blueprint('auth', __name__, url_prefix='/v1/auth')
 
@@ -13,6 +16,10 @@ def signup():
     if not data or not data.get('email') or not data.get('password') or not data.get('username'):
         return jsonify({'success': False, 'message': 'Missing required fields'}), 400
     
+    # In sharded mode the user's home shard follows their location
+    if shard_router.enabled():
+        shard_router.select_shard(shard_router.region_for(data.get('location')))
+    
     # Check if user already exists
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'success': False, 'message': 'Email already registered'}), 400
@@ -20,10 +27,18 @@ def signup():
     if User.query.filter_by(username=data['username']).first():
         return jsonify({'success': False, 'message': 'Username already taken'}), 400
     
+    # Reserve a global id (and the email and username across all shards) in the directory
+    user_id = None
+    if shard_router.enabled():
+        user_id = shard_router.claim_user_id(data['email'], data['username'], g.shard)
+        if user_id is None:
+            return jsonify({'success': False, 'message': 'Email or username already registered'}), 400
+    
     try:
         user_type = data.get('user_type', 'client')  # default to client
         
         user = User(
+            id=user_id,
             username=data['username'],
             email=data['email'],
             user_type=user_type,
@@ -37,10 +52,14 @@ def signup():
         user.set_password(data['password'])
         
         db.session.add(user)
+        if user_type == 'artisan':
+            db.session.flush()
+            create_stats(user.id)
         db.session.commit()
+        category_index.update(user)
         
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(identity=user.id, additional_claims=shard_router.token_claims())
         
         return jsonify({
             'success': True,
@@ -52,6 +71,8 @@ def signup():
     
     except Exception as e:
         db.session.rollback()
+        if user_id is not None:
+            shard_router.release_user_id(user_id)
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @bp.route('/signin', methods=['POST'])
@@ -62,13 +83,19 @@ def signin():
     if not data or not data.get('email') or not data.get('password'):
         return jsonify({'success': False, 'message': 'Missing email or password'}), 400
     
+    if shard_router.enabled():
+        region = shard_router.home_region(email=data['email'])
+        if region is None:
+            return jsonify({'success': False, 'message': 'Invalid email or password'}), 401
+        shard_router.select_shard(region)
+    
     user = User.query.filter_by(email=data['email']).first()
     
     if not user or not user.check_password(data['password']):
         return jsonify({'success': False, 'message': 'Invalid email or password'}), 401
     
     try:
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(identity=user.id, additional_claims=shard_router.token_claims())
         
         return jsonify({
             'success': True,
@@ -118,6 +145,7 @@ def update_profile():
             user.experience_years = data.get('experience_years', user.experience_years)
         
         db.session.commit()
+        category_index.update(user)
         
         return jsonify({
             'success': True,
@@ -0,0 +1,74 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from app.services.replicas import WRITE_HEADER, last_write
+
+bp = Blueprint('batch', __name__, url_prefix='/v1/batch')
+
+ALLOWED_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+
+
+@bp.route('', methods=['POST'])
+@jwt_required()
+def run_batch():
+    """Run several API calls in one HTTP round trip.
+    
+    Body: {"requests": [{"method": "GET", "path": "/v1/auth/profile", "body": {...}}, ...]}
+    
+    Sub-requests run in order inside this request's app context, so they share
+    the database session (the user row is loaded once and then served from the
+    session's identity map), the caller's Authorization header and the time of
+    their last write (see app/services/replicas.py). The token is decoded once
+    for the whole batch (see app/services/tokens.py). Each result
+    is {"status": <http status>, "body": <json>} in the same order.
+    """
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+    
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'success': False, 'message': 'requests must be a non-empty list'}), 400
+    
+    if len(sub_requests) > current_app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({
+            'success': False,
+            'message': f"At most {current_app.config['BATCH_MAX_REQUESTS']} requests per batch"
+        }), 400
+    
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    written_at = last_write()
+    if written_at is not None:
+        headers[WRITE_HEADER] = f'{written_at:.6f}'
+    results = []
+    
+    for sub in sub_requests:
+        method = str(sub.get('method', 'GET')).upper() if isinstance(sub, dict) else None
+        path = sub.get('path', '') if isinstance(sub, dict) else ''
+        
+        if method not in ALLOWED_METHODS or not path.startswith('/v1/') or path.startswith(bp.url_prefix):
+            results.append({'status': 400, 'body': {'success': False, 'message': 'Invalid sub-request'}})
+            continue
+        
+        results.append(_dispatch(method, path, sub.get('body'), headers))
+    
+    return jsonify({
+        'success': True,
+        'data': results
+    }), 200
+
+
+def _dispatch(method, path, body, headers):
+    """Run one sub-request through the normal routing and error handling"""
+    app = current_app._get_current_object()
+    kwargs = {'method': method, 'headers': headers}
+    if body is not None:
+        kwargs['json'] = body
+    
+    # Pushing a request context while our app context is active reuses it, so
+    # the db session and g are shared with the outer request.
+    with app.test_request_context(path, **kwargs):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            app.logger.exception(f'Batch sub-request {method} {path} failed')
+            return {'status': 500, 'body': {'success': False, 'message': str(e)}}
+    
+    return {'status': response.status_code, 'body': response.get_json(silent=True)}
@@ -1,16 +1,41 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from app import db
-from app.models import ServiceRequest, User, Booking
-from app.routes.notification_routes import create_notification
-from datetime import datetime
+from app.models import ServiceRequest, User, Booking, Review
+from app.routes.notification_routes import notify
+from app.routes.artisan_routes import with_profile
+from app.services.scheduling import parse_datetime, book_slot, release_bookings, schedule_index, ScheduleConflict
+from app.services.jobs import enqueue
+from app.services.stats import record_transition
+from app.services.analytics import record_request_event
+from app.services.dedupe import find_resubmission, remember_request, request_for_key
+from app.services.ratings import record_review
+from app.services.sync import WatermarkExpired, SHARED_FEED, parse_since, next_watermark, record_tombstone, delta_response
+from app.services.retention import all_requests, client_requests, find_request
+from app.services.replicas import replica_read
+from datetime import datetime, timedelta
 
 bp = Blueprint('client', __name__, url_prefix='/v1/client')
 
+def resubmitted(existing):
+    """Response for a repeated submission: the original request, with nothing new created or sent"""
+    return jsonify({
+        'success': True,
+        'data': existing.to_dict(),
+        'duplicate_of': existing.id,
+        'message': 'This repeats an earlier request, which was returned instead of creating a new one.'
+    }), 200
+
 @bp.route('/requests', methods=['POST'])
 @jwt_required()
 def create_request():
-    """Create a new service request"""
+    """Create a new service request.
+    
+    Resubmits are answered with the original request: same Idempotency-Key header
+    (or idempotency_key), or a near-duplicate of a pending request from the last
+    DEDUPE_WINDOW_SECONDS unless allow_duplicate is true.
+    """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     
@@ -22,43 +47,108 @@ def create_request():
     if not data or not data.get('service_category') or not data.get('description') or not data.get('location'):
         return jsonify({'success': False, 'message': 'Missing required fields'}), 400
     
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    existing = find_resubmission(
+        user_id, idempotency_key, data['service_category'], data['description'], data['location'],
+        similar=not data.get('allow_duplicate')
+    )
+    if existing:
+        return resubmitted(existing)
+    
     try:
         service_request = ServiceRequest(
             client_id=user_id,
             service_category=data['service_category'],
             description=data['description'],
             location=data['location'],
+            latitude=data.get('latitude'),
+            longitude=data.get('longitude'),
             budget=data.get('budget'),
+            idempotency_key=idempotency_key,
             status='pending'
         )
         
         db.session.add(service_request)
+        record_request_event(service_request, 'created')
         db.session.commit()
+        remember_request(service_request)
+        
+        # Notify matching artisans in the background
+        if current_app.config['DISPATCH_ENABLED']:
+            enqueue('fan_out_request', request_id=service_request.id)
+        
+        # Imported here so numpy is only loaded once prices are first needed, not at startup
+        from app.services.pricing import estimate_price
         
         return jsonify({
             'success': True,
-            'data': service_request.to_dict()
+            'data': service_request.to_dict(),
+            'price_estimate': estimate_price(service_request.service_category, service_request.location)
         }), 201
     
+    except IntegrityError as e:
+        # A concurrent retry with the same idempotency key got there first
+        db.session.rollback()
+        existing = request_for_key(user_id, idempotency_key)
+        if existing:
+            return resubmitted(existing)
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@bp.route('/price-estimate', methods=['GET'])
+@jwt_required()
+def get_price_estimate():
+    """Suggested budget range for a new request from the prices of completed jobs.
+    
+    Uses the request's category and area (?location=), falling back to the whole
+    category and then to artisans' hourly rates. data is null without enough history.
+    """
+    service_category = request.args.get('service_category')
+    if not service_category:
+        return jsonify({'success': False, 'message': 'service_category is required'}), 400
+    
+    from app.services.pricing import estimate_price
+    
+    return jsonify({
+        'success': True,
+        'data': estimate_price(service_category, request.args.get('location'))
+    }), 200
+
 @bp.route('/requests', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_my_requests():
-    """Get all service requests made by the client"""
+    """Get all service requests made by the client.
+    
+    With ?since=<watermark> only requests changed after the watermark are returned.
+    """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     
     if not user or user.user_type != 'client':
         return jsonify({'success': False, 'message': 'Only clients can view requests'}), 403
     
-    requests = ServiceRequest.query.filter_by(client_id=user_id).all()
+    try:
+        since = parse_since()
+    except WatermarkExpired:
+        return jsonify({'success': False, 'message': 'Watermark expired, fetch the full feed'}), 410
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid since watermark'}), 400
+    watermark = next_watermark()
+    
+    if since is not None:
+        changed = client_requests(user_id, since)
+        return jsonify(delta_response(changed, lambda req: True, watermark)), 200
+    
+    requests = client_requests(user_id)
     
     return jsonify({
         'success': True,
-        'data': [req.to_dict() for req in requests]
+        'data': [req.to_dict() for req in requests],
+        'watermark': watermark
     }), 200
 
 @bp.route('/requests/<int:request_id>', methods=['GET'])
@@ -66,7 +156,7 @@ def get_my_requests():
 def get_request_detail(request_id):
     """Get details of a specific service request"""
     user_id = get_jwt_identity()
-    service_request = ServiceRequest.query.get(request_id)
+    service_request = find_request(request_id)
     
     if not service_request:
         return jsonify({'success': False, 'message': 'Request not found'}), 404
@@ -79,8 +169,44 @@ def get_request_detail(request_id):
         'data': service_request.to_dict()
     }), 200
 
+@bp.route('/requests/<int:request_id>/recommendations', methods=['GET'])
+@jwt_required()
+def get_recommendations(request_id):
+    """Get the best matching artisans for a service request.
+    
+    Artisans are ranked on category match, distance, rating, completion rate,
+    hourly rate against the budget and current workload.
+    """
+    user_id = get_jwt_identity()
+    service_request = ServiceRequest.query.get(request_id)
+    
+    if not service_request:
+        return jsonify({'success': False, 'message': 'Request not found'}), 404
+    
+    if service_request.client_id != user_id:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    # Imported here so numpy is only loaded by the first recommendation request, not at startup
+    from app.services.recommendations import recommend_artisans
+    
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    ranked = recommend_artisans(service_request, limit)
+    
+    ranked_ids = [artisan_id for artisan_id, _ in ranked]
+    artisans = {a.id: a for a in User.query.filter(User.id.in_(ranked_ids)).options(*with_profile())}
+    data = []
+    for artisan_id, score in ranked:
+        if artisan_id in artisans:
+            data.append(dict(artisans[artisan_id].to_dict(), score=round(score, 4)))
+    
+    return jsonify({
+        'success': True,
+        'data': data
+    }), 200
+
 @bp.route('/bookings', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_my_bookings():
     """Get all bookings for a client"""
     user_id = get_jwt_identity()
@@ -89,9 +215,9 @@ def get_my_bookings():
     if not user or user.user_type != 'client':
         return jsonify({'success': False, 'message': 'Only clients can view bookings'}), 403
     
-    # Get all requests made by this client
-    requests = ServiceRequest.query.filter_by(client_id=user_id).all()
-    request_ids = [req.id for req in requests]
+    # Get all requests made by this client, archived ones included
+    requests = all_requests('id', 'client_id')
+    request_ids = db.select(requests.c.id).where(requests.c.client_id == user_id)
     
     # Get all bookings for these requests
     bookings = Booking.query.filter(Booking.request_id.in_(request_ids)).all()
@@ -101,6 +227,77 @@ def get_my_bookings():
         'data': [booking.to_dict() for booking in bookings]
     }), 200
 
+@bp.route('/bookings/<int:booking_id>/review', methods=['POST'])
+@jwt_required()
+def create_review(booking_id):
+    """Review the artisan for a completed booking (one review per booking)"""
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    
+    if not user or user.user_type != 'client':
+        return jsonify({'success': False, 'message': 'Only clients can leave reviews'}), 403
+    
+    booking = Booking.query.get(booking_id)
+    
+    if not booking:
+        return jsonify({'success': False, 'message': 'Booking not found'}), 404
+    
+    service_request = booking.service_request()
+    
+    if not service_request:
+        # The request row is gone from both tables, so ownership cannot be checked
+        return jsonify({'success': False, 'message': 'Booking not found'}), 404
+    
+    if service_request.client_id != user_id:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    if booking.status != 'completed':
+        return jsonify({'success': False, 'message': 'Only completed bookings can be reviewed'}), 400
+    
+    data = request.get_json() or {}
+    rating = data.get('rating')
+    
+    if not isinstance(rating, int) or not 1 <= rating <= 5:
+        return jsonify({'success': False, 'message': 'Rating must be a whole number from 1 to 5'}), 400
+    
+    if Review.query.filter_by(booking_id=booking_id, reviewer_id=user_id).first():
+        return jsonify({'success': False, 'message': 'You have already reviewed this booking'}), 400
+    
+    artisan = User.query.get(booking.artisan_id or service_request.artisan_id)
+    
+    if not artisan:
+        return jsonify({'success': False, 'message': 'Booking has no artisan to review'}), 400
+    
+    try:
+        review = Review(
+            booking_id=booking_id,
+            reviewer_id=user_id,
+            artisan_id=artisan.id,
+            reviewer_name=user.username,
+            rating=rating,
+            comment=data.get('comment')
+        )
+        db.session.add(review)
+        record_review(artisan, rating)
+        db.session.commit()
+        
+        notify(
+            user_id=artisan.id,
+            title='New Review',
+            message=f'{user.username} rated your work {rating}/5.',
+            notification_type='system',
+            related_id=booking_id
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': review.to_dict()
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @bp.route('/requests/<int:request_id>', methods=['PUT'])
 @jwt_required()
 def cancel_request(request_id):
@@ -114,9 +311,21 @@ def cancel_request(request_id):
     if service_request.client_id != user_id:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
+    if service_request.status == 'completed':
+        # The job counts toward the artisan's completed_jobs and earnings; it cannot be undone
+        return jsonify({'success': False, 'message': 'Completed requests cannot be cancelled'}), 400
+    
     try:
+        old_status = service_request.status
+        if old_status == 'pending' and service_request.artisan_id is None:
+            record_tombstone('available_requests', SHARED_FEED, service_request.id)
         service_request.status = 'cancelled'
+        if old_status != 'cancelled':
+            record_request_event(service_request, 'cancelled')
+        record_transition(service_request.artisan_id, old_status, 'cancelled')
+        released = release_bookings(service_request, 'cancelled')
         db.session.commit()
+        schedule_index.remove(released)
         
         return jsonify({
             'success': True,
@@ -130,7 +339,10 @@ def cancel_request(request_id):
 @bp.route('/book-artisan', methods=['POST'])
 @jwt_required()
 def book_artisan_direct():
-    """Book a specific artisan directly (with artisan_id specified)"""
+    """Book a specific artisan directly (with artisan_id specified).
+    
+    Resubmits are answered with the original booking request, as for create_request.
+    """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     
@@ -157,6 +369,28 @@ def book_artisan_direct():
     if not artisan or artisan.user_type != 'artisan':
         return jsonify({'success': False, 'message': 'Artisan not found'}), 404
     
+    start = end = None
+    if preferred_date:
+        try:
+            start = parse_datetime(preferred_date)
+            if data.get('end_date'):
+                end = parse_datetime(data['end_date'])
+            else:
+                end = start + timedelta(hours=current_app.config['DEFAULT_BOOKING_HOURS'])
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Invalid preferred_date or end_date'}), 400
+        
+        if end <= start:
+            return jsonify({'success': False, 'message': 'end_date must be after preferred_date'}), 400
+    
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    existing = find_resubmission(
+        user_id, idempotency_key, service_category, description, location, artisan_id=artisan.id,
+        similar=not data.get('allow_duplicate')
+    )
+    if existing:
+        return resubmitted(existing)
+    
     try:
         service_request = ServiceRequest(
             client_id=user_id,
@@ -165,14 +399,27 @@ def book_artisan_direct():
             description=description,
             location=location,
             budget=budget,
+            idempotency_key=idempotency_key,
             status='pending'
         )
         
         db.session.add(service_request)
+        record_transition(artisan_id, None, 'pending')
+        record_request_event(service_request, 'created')
+        
+        # Reserve the time slot, rejecting double bookings
+        booking = None
+        if start:
+            booking = book_slot(service_request, start, end, total_amount=budget)
+        
         db.session.commit()
+        remember_request(service_request)
+        
+        if booking:
+            schedule_index.add(booking)
         
         # Create notification for the artisan
-        create_notification(
+        notify(
             user_id=artisan_id,
             title='New Booking Request',
             message=f'{user.username} has requested your services for {service_category}.',
@@ -186,6 +433,17 @@ def book_artisan_direct():
             'message': 'Booking request sent successfully!'
         }), 201
     
+    except ScheduleConflict as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
+    
+    except IntegrityError as e:
+        db.session.rollback()
+        existing = request_for_key(user_id, idempotency_key)
+        if existing:
+            return resubmitted(existing)
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
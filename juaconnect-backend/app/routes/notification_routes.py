@@ -1,34 +1,88 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import Notification, User
+from app.services.stats import adjust_unread, reset_unread
+from app.services.jobs import job, enqueue
+from app.services.retention import archived_notifications
+from app.services.sync import (
+    WatermarkExpired, parse_since, next_watermark, record_tombstone, tombstones_since, delta_response
+)
+from app.services.replicas import replica_read
+from datetime import datetime
 
 bp = Blueprint('notification', __name__, url_prefix='/v1/notifications')
 
 @bp.route('', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_notifications():
-    """Get all notifications for the current user"""
+    """Get all notifications for the current user.
+    
+    With ?since=<watermark> only notifications created, read or deleted after the
+    watermark are returned.
+    """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     
     if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
     
-    # Get unread first, then read, ordered by created_at descending
+    try:
+        since = parse_since()
+    except WatermarkExpired:
+        return jsonify({'success': False, 'message': 'Watermark expired, fetch the full feed'}), 410
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid since watermark'}), 400
+    watermark = next_watermark()
+    
+    if since is not None:
+        changed = Notification.query.filter(
+            Notification.user_id == user_id,
+            Notification.updated_at > since
+        ).order_by(Notification.created_at.desc()).all()
+        response = delta_response(
+            changed, lambda n: True, watermark,
+            removed=tombstones_since('notifications', user_id, since)
+        )
+        response['unread_count'] = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+        return jsonify(response), 200
+    
+    # Get unread first, then read, ordered by created_at descending. Older read
+    # notifications are compacted into the archive, so this stays a bounded hot set.
     notifications = Notification.query.filter_by(user_id=user_id).order_by(
         Notification.is_read.asc(),  # Unread first
         Notification.created_at.desc()
-    ).all()
+    ).limit(current_app.config['NOTIFICATION_HOT_LIMIT']).all()
     
     return jsonify({
         'success': True,
         'data': [n.to_dict() for n in notifications],
-        'unread_count': len([n for n in notifications if not n.is_read])
+        'unread_count': Notification.query.filter_by(user_id=user_id, is_read=False).count(),
+        'watermark': watermark
+    }), 200
+
+@bp.route('/archive', methods=['GET'])
+@jwt_required()
+@replica_read
+def get_archived_notifications():
+    """Get compacted (older, read) notifications, newest first.
+    
+    Page with ?before=<next_before from the previous page>.
+    """
+    user_id = get_jwt_identity()
+    limit = min(request.args.get('limit', 5, type=int), 20)
+    notifications, next_before = archived_notifications(user_id, request.args.get('before', type=int), limit)
+    
+    return jsonify({
+        'success': True,
+        'data': notifications,
+        'next_before': next_before
     }), 200
 
 @bp.route('/unread', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_unread_count():
     """Get count of unread notifications"""
     user_id = get_jwt_identity()
@@ -55,6 +109,8 @@ def mark_as_read(notification_id):
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
     try:
+        if not notification.is_read:
+            adjust_unread(user_id, -1)
         notification.is_read = True
         db.session.commit()
         
@@ -75,8 +131,9 @@ def mark_all_read():
     
     try:
         Notification.query.filter_by(user_id=user_id, is_read=False).update(
-            {'is_read': True}
+            {'is_read': True, 'updated_at': datetime.utcnow()}
         )
+        reset_unread(user_id)
         db.session.commit()
         
         return jsonify({
@@ -103,7 +160,10 @@ def delete_notification(notification_id):
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
     try:
+        if not notification.is_read:
+            adjust_unread(user_id, -1)
         db.session.delete(notification)
+        record_tombstone('notifications', user_id, notification_id)
         db.session.commit()
         
         return jsonify({
@@ -127,6 +187,7 @@ def create_notification(user_id, title, message, notification_type='booking', re
             related_id=related_id
         )
         db.session.add(notification)
+        adjust_unread(user_id, 1)
         db.session.commit()
         return notification
     except Exception as e:
@@ -134,3 +195,20 @@ def create_notification(user_id, title, message, notification_type='booking', re
         print(f"Error creating notification: {e}")
         return None
 
+
+@job('create_notification')
+def create_notification_job(**kwargs):
+    if create_notification(**kwargs) is None:
+        raise RuntimeError('Could not create notification')
+
+
+def notify(user_id, title, message, notification_type='booking', related_id=None):
+    """Queue a notification to be written by the background job runner"""
+    enqueue(
+        'create_notification',
+        user_id=user_id,
+        title=title,
+        message=message,
+        notification_type=notification_type,
+        related_id=related_id
+    )
@@ -0,0 +1,137 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app import db
+from app.models import User, Payment, LedgerEntry
+from app.services.payments import create_payment, settle_batch, verify_signature, PaymentError, PaymentConflict
+from app.services.retention import find_request
+from app.services.sharding import shard_router
+
+bp = Blueprint('payment', __name__, url_prefix='/v1/payments')
+
+@bp.route('', methods=['POST'])
+@jwt_required()
+def start_payment():
+    """Pay for a completed service request.
+    
+    Requires an Idempotency-Key header (or idempotency_key in the body); retries
+    with the same key return the original payment.
+    """
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    
+    if not user or user.user_type != 'client':
+        return jsonify({'success': False, 'message': 'Only clients can make payments'}), 403
+    
+    if not current_app.config['PAYMENT_PROVIDER']:
+        return jsonify({'success': False, 'message': 'Payments are not available'}), 503
+    
+    data = request.get_json() or {}
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    
+    if not idempotency_key or not data.get('request_id'):
+        return jsonify({'success': False, 'message': 'request_id and an Idempotency-Key are required'}), 400
+    
+    service_request = find_request(data['request_id'])
+    
+    if not service_request:
+        return jsonify({'success': False, 'message': 'Request not found'}), 404
+    
+    if service_request.client_id != user_id:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    try:
+        payment, created = create_payment(service_request, idempotency_key, data.get('payment_method'))
+    except PaymentConflict as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
+    except PaymentError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': payment.to_dict()
+    }), 201 if created else 200
+
+@bp.route('/<int:payment_id>', methods=['GET'])
+@jwt_required()
+def get_payment(payment_id):
+    """Get a payment for the paying client or the paid artisan"""
+    user_id = get_jwt_identity()
+    payment = Payment.query.get(payment_id)
+    
+    if not payment:
+        return jsonify({'success': False, 'message': 'Payment not found'}), 404
+    
+    # The payer can always see it; the request, while it still exists, also lets its artisan
+    allowed = {payment.client_id}
+    service_request = payment.booking.service_request() if payment.booking else None
+    if service_request:
+        allowed |= {service_request.client_id, service_request.artisan_id}
+    if user_id not in allowed:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'success': True,
+        'data': payment.to_dict()
+    }), 200
+
+@bp.route('/callback', methods=['POST'])
+def payment_callback():
+    """Provider callback with one settlement row or a list of them.
+    
+    Each row is {"reference", "status", "amount"}. Large settlement files are
+    reconciled offline with `flask reconcile-payments`.
+    """
+    if not verify_signature(request.get_data(), request.headers.get('X-Signature')):
+        return jsonify({'success': False, 'message': 'Invalid signature'}), 401
+    
+    data = request.get_json(silent=True)
+    rows = data if isinstance(data, list) else [data]
+    
+    if not all(isinstance(row, dict) and row.get('reference') for row in rows):
+        return jsonify({'success': False, 'message': 'Each row needs a reference'}), 400
+    
+    try:
+        # The provider doesn't know our regions, so each shard settles the rows it has
+        results = shard_router.gather(lambda: settle_batch(rows))
+        result = {key: sum(r[key] for r in results) for key in results[0]}
+        # A row is unmatched on every shard but the one holding its payment
+        result['unmatched'] -= (len(results) - 1) * len(rows)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': result
+    }), 200
+
+@bp.route('/ledger', methods=['GET'])
+@jwt_required()
+def get_ledger():
+    """Get the artisan's ledger, newest first. Page with ?before=<entry id>&limit=N."""
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    
+    if not user or user.user_type != 'artisan':
+        return jsonify({'success': False, 'message': 'Only artisans have a ledger'}), 403
+    
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    query = LedgerEntry.query.filter_by(artisan_id=user_id)
+    
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(LedgerEntry.id < before)
+    
+    entries = query.order_by(LedgerEntry.id.desc()).limit(limit).all()
+    
+    return jsonify({
+        'success': True,
+        'data': [entry.to_dict() for entry in entries],
+        'balance': entries[0].balance_after if entries and not before else None,
+        'next_before': entries[-1].id if len(entries) == limit else None
+    }), 200
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, insert, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Booking, DemandRollup, EarningsRollup
+from app.services.retention import all_requests
+
+EPOCH = datetime(1970, 1, 1)
+DEMAND_COUNTERS = (
+    'created_count', 'accepted_count', 'accept_seconds_total', 'completed_count', 'cancelled_count', 'earnings_total',
+)
+EARNINGS_COUNTERS = ('completed_count', 'earnings_total')
+
+
+def hour_bucket(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def category_of(service_category):
+    return ' '.join((service_category or '').split()).lower()[:100]
+
+
+def area_of(location):
+    """The first part of a location ('Westlands, Nairobi' -> 'westlands'), the area demand is counted under"""
+    area = ' '.join((location or '').split(',')[0].split()).lower()
+    return area[:100] or 'unknown'
+
+
+def _bump(model, key, deltas):
+    """Add deltas to the rollup row for key, creating it for the bucket's first event"""
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items() if delta}
+    if not values:
+        return
+    statement = update(model).where(*(getattr(model, name) == value for name, value in key.items())).values(**values)
+    options = {'synchronize_session': False}
+    if db.session.execute(statement, execution_options=options).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**key, **deltas))
+    except IntegrityError:
+        # Another transaction created the row since our update
+        db.session.execute(statement, execution_options=options)
+
+
+def record_request_event(service_request, event, amount=0.0):
+    """Count a request transition in the hourly rollups, in the transition's own transaction.
+    
+    event is 'created', 'accepted', 'completed' (amount is what the artisan
+    earned) or 'cancelled'. Accepting also stamps the request's accepted_at.
+    """
+    now = datetime.utcnow()
+    key = {
+        'bucket': hour_bucket(now),
+        'service_category': category_of(service_request.service_category),
+        'area': area_of(service_request.location),
+    }
+    if event == 'created':
+        deltas = {'created_count': 1}
+    elif event == 'accepted':
+        service_request.accepted_at = now
+        waited = (now - (service_request.created_at or now)).total_seconds()
+        deltas = {'accepted_count': 1, 'accept_seconds_total': waited}
+    elif event == 'completed':
+        deltas = {'completed_count': 1, 'earnings_total': amount or 0.0}
+        if service_request.artisan_id is not None:
+            _bump(EarningsRollup, {'bucket': key['bucket'], 'artisan_id': service_request.artisan_id}, deltas)
+    elif event == 'cancelled':
+        deltas = {'cancelled_count': 1}
+    else:
+        raise ValueError(f'Unknown request event: {event}')
+    _bump(DemandRollup, key, deltas)
+
+
+def demand_rows(start, end, service_category=None, area=None):
+    """Demand rollup rows with start <= bucket < end, as plain dicts"""
+    query = DemandRollup.query.filter(DemandRollup.bucket >= start, DemandRollup.bucket < end)
+    if service_category:
+        query = query.filter(DemandRollup.service_category == category_of(service_category))
+    if area:
+        query = query.filter(DemandRollup.area == area_of(area))
+    return [row.to_dict() for row in query]
+
+
+def earnings_rows(start, end, artisan_id=None):
+    """Earnings rollup rows with start <= bucket < end, as plain dicts"""
+    query = EarningsRollup.query.filter(EarningsRollup.bucket >= start, EarningsRollup.bucket < end)
+    if artisan_id is not None:
+        query = query.filter(EarningsRollup.artisan_id == artisan_id)
+    return [row.to_dict() for row in query]
+
+
+def merge_rows(rows, keys, counters, granularity='hour'):
+    """Sum rollup rows (from one or several shards) per key, in hour or day buckets, oldest first"""
+    merged = {}
+    for row in rows:
+        bucket = row['bucket'][:10] + 'T00:00:00' if granularity == 'day' else row['bucket']
+        group = (bucket,) + tuple(row[name] for name in keys)
+        total = merged.setdefault(group, dict(zip(('bucket',) + keys, group), **{name: 0 for name in counters}))
+        for name in counters:
+            total[name] += row[name]
+    report = [merged[group] for group in sorted(merged)]
+    for row in report:
+        if 'accept_seconds_total' in row:
+            row['avg_accept_seconds'] = row['accept_seconds_total'] / row['accepted_count'] if row['accepted_count'] else None
+    return report
+
+
+def _hours(np, values):
+    """Hours since the epoch for a sequence of datetimes, plus a mask of the non-null ones"""
+    stamps = np.array(values, dtype='datetime64[s]')
+    valid = ~np.isnat(stamps)
+    return np.where(valid, stamps.astype(np.int64) // 3600, 0), valid
+
+
+def _accumulate(np, totals, hours, groups, mask, columns):
+    """Add per-(hour, group) sums of columns over the rows where mask holds into totals"""
+    if not mask.any():
+        return
+    keys, inverse = np.unique(np.stack([hours[mask], groups[mask]], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = {name: np.bincount(inverse, weights=values[mask], minlength=len(keys)) for name, values in columns.items()}
+    for i, (hour, group) in enumerate(keys.tolist()):
+        total = totals.setdefault((hour, group), {})
+        for name, values in sums.items():
+            value = values[i].item()
+            total[name] = total.get(name, 0) + (round(value) if name.endswith('_count') else value)
+
+
+def rebuild_rollups(chunk_size=50000):
+    """Recompute every rollup row from service_requests, the archive and bookings.
+    
+    Rows are streamed in chunks and bucketed with NumPy. Creations count at
+    created_at, acceptances at accepted_at (requests accepted before it was
+    recorded have none), completions and cancellations at updated_at. Returns
+    (demand rows, earnings rows) written. Run it while traffic is quiet:
+    transitions committed during the rebuild may be counted twice or lost.
+    """
+    # Imported here so web workers, which only record events, never load numpy
+    import numpy as np
+    
+    db.session.flush()
+    requests = all_requests(
+        'id', 'artisan_id', 'service_category', 'location', 'status', 'created_at', 'accepted_at', 'updated_at'
+    )
+    earned = select(Booking.request_id, func.sum(Booking.total_amount).label('amount')).where(
+        Booking.status == 'completed'
+    ).group_by(Booking.request_id).subquery()
+    query = select(
+        requests.c.service_category, requests.c.location, requests.c.artisan_id, requests.c.status,
+        requests.c.created_at, requests.c.accepted_at, requests.c.updated_at, earned.c.amount,
+    ).outerjoin(earned, earned.c.request_id == requests.c.id)
+    
+    group_codes = {}
+    demand, earnings = {}, {}
+    result = db.session.execute(query.execution_options(yield_per=chunk_size))
+    for chunk in result.partitions():
+        category, location, artisan, status, created, accepted, updated, amount = zip(*chunk)
+        groups = np.fromiter(
+            (group_codes.setdefault((category_of(c), area_of(l)), len(group_codes)) for c, l in zip(category, location)),
+            dtype=np.int64, count=len(chunk),
+        )
+        status = np.array(status, dtype=object)
+        artisan = np.array([-1 if a is None else a for a in artisan], dtype=np.int64)
+        amount = np.nan_to_num(np.array(amount, dtype=float))
+        ones = np.ones(len(chunk))
+        created_hours, has_created = _hours(np, created)
+        accepted_hours, has_accepted = _hours(np, accepted)
+        updated_hours, has_updated = _hours(np, updated)
+        waited = (np.array(accepted, dtype='datetime64[us]') - np.array(created, dtype='datetime64[us]')) / np.timedelta64(1, 's')
+        completed = (status == 'completed') & has_updated
+        
+        _accumulate(np, demand, created_hours, groups, has_created, {'created_count': ones})
+        _accumulate(np, demand, accepted_hours, groups, has_accepted & has_created, {
+            'accepted_count': ones, 'accept_seconds_total': waited,
+        })
+        _accumulate(np, demand, updated_hours, groups, completed, {'completed_count': ones, 'earnings_total': amount})
+        _accumulate(np, demand, updated_hours, groups, (status == 'cancelled') & has_updated, {'cancelled_count': ones})
+        _accumulate(np, earnings, updated_hours, artisan, completed & (artisan >= 0), {
+            'completed_count': ones, 'earnings_total': amount,
+        })
+    
+    keys = {code: key for key, code in group_codes.items()}
+    demand_values = [
+        dict({name: 0 for name in DEMAND_COUNTERS}, **totals, bucket=EPOCH + timedelta(hours=hour),
+             service_category=keys[group][0], area=keys[group][1])
+        for (hour, group), totals in demand.items()
+    ]
+    earnings_values = [
+        dict({name: 0 for name in EARNINGS_COUNTERS}, **totals, bucket=EPOCH + timedelta(hours=hour), artisan_id=artisan_id)
+        for (hour, artisan_id), totals in earnings.items()
+    ]
+    
+    db.session.execute(delete(DemandRollup), execution_options={'synchronize_session': False})
+    db.session.execute(delete(EarningsRollup), execution_options={'synchronize_session': False})
+    if demand_values:
+        db.session.execute(insert(DemandRollup), demand_values)
+    if earnings_values:
+        db.session.execute(insert(EarningsRollup), earnings_values)
+    db.session.flush()
+    return len(demand_values), len(earnings_values)
@@ -0,0 +1,175 @@
+import random
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from app.models import ServiceRequest
+from app.services.analytics import area_of, category_of
+from app.services.sharding import ShardLocal
+
+MERSENNE_PRIME = (1 << 61) - 1
+WORD = re.compile(r'\w+')
+# Filler that resubmits add or drop ("leaky pipe in kitchen" / "leaky pipe in the kitchen")
+STOP_WORDS = frozenset(
+    'a an and are as at be for from has have i in is it its me my of on or our please s some that the this '
+    'to was we with'.split()
+)
+GRAM_SIZES = (3, 4, 5)
+
+
+def shingles(description):
+    """Character 3-5-grams of the description's words, ignoring filler words, case and punctuation.
+    
+    Grams are taken within each word, so reordered or reworded descriptions
+    ("broken door lock" / "the door lock is broken") still match.
+    """
+    words = WORD.findall((description or '').lower())
+    features = set()
+    for word in [word for word in words if word not in STOP_WORDS] or words:
+        word = f' {word} '
+        features.update(word[i:i + size] for size in GRAM_SIZES for i in range(len(word) - size + 1))
+    return [zlib.crc32(feature.encode()) for feature in features or {''}]
+
+
+def scope_of(client_id, artisan_id, service_category, location):
+    """Requests are only compared within one client, artisan, category and area"""
+    return client_id, artisan_id, category_of(service_category), area_of(location)
+
+
+class DuplicateIndex:
+    """MinHash signatures of recent requests, bucketed by LSH bands.
+    
+    Each signature is split into DEDUPE_BANDS bands of DEDUPE_ROWS values. Two
+    requests from the same client, category and artisan that share any band are
+    candidates (see scope_of), so a lookup touches a handful of buckets however many requests
+    are pending. Candidates count as duplicates when the fraction of equal
+    signature values (an estimate of their Jaccard similarity) is at least
+    DEDUPE_SIMILARITY. Requests created by other workers are picked up by
+    reading new service_requests rows by id before each lookup.
+    """
+    
+    def __init__(self):
+        config = current_app.config
+        self.bands, self.rows = config['DEDUPE_BANDS'], config['DEDUPE_ROWS']
+        rng = random.Random(0)
+        self.permutations = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME)) for _ in range(self.bands * self.rows)
+        ]
+        self._entries = OrderedDict()  # request id -> (created_at, scope, signature), oldest first
+        self._buckets = {}  # (scope, band, values) -> set of request ids
+        self._last_id = None
+        self._lock = threading.Lock()
+    
+    def signature(self, description):
+        hashes = shingles(description)
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.permutations)
+    
+    def _band_keys(self, scope, signature):
+        for band in range(self.bands):
+            yield scope, band, signature[band * self.rows:(band + 1) * self.rows]
+    
+    def _add(self, request_id, created_at, scope, description):
+        if request_id in self._entries:
+            return
+        signature = self.signature(description)
+        self._entries[request_id] = (created_at, scope, signature)
+        for key in self._band_keys(scope, signature):
+            self._buckets.setdefault(key, set()).add(request_id)
+    
+    def _expire(self, cutoff):
+        while self._entries:
+            request_id, (created_at, scope, signature) = next(iter(self._entries.items()))
+            if created_at >= cutoff:
+                break
+            del self._entries[request_id]
+            for key in self._band_keys(scope, signature):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(request_id)
+                    if not bucket:
+                        del self._buckets[key]
+    
+    def _catch_up(self, cutoff):
+        """Index requests created since the last lookup, by this or any other process"""
+        columns = select(
+            ServiceRequest.id, ServiceRequest.client_id, ServiceRequest.artisan_id, ServiceRequest.service_category,
+            ServiceRequest.description, ServiceRequest.location, ServiceRequest.created_at,
+        )
+        if self._last_id is None:
+            # Warm up from the newest rows; the id index makes this cheap however big the table is
+            query = columns.order_by(ServiceRequest.id.desc()).limit(current_app.config['DEDUPE_WARM_LIMIT'])
+            rows = reversed(db.session.execute(query).all())
+        else:
+            rows = db.session.execute(columns.where(ServiceRequest.id > self._last_id).order_by(ServiceRequest.id)).all()
+        for row in rows:
+            self._last_id = max(self._last_id or 0, row.id)
+            if row.created_at is not None and row.created_at >= cutoff:
+                scope = scope_of(row.client_id, row.artisan_id, row.service_category, row.location)
+                self._add(row.id, row.created_at, scope, row.description)
+        if self._last_id is None:
+            self._last_id = 0
+    
+    def candidates(self, client_id, artisan_id, service_category, description, location):
+        """Ids of indexed requests at least DEDUPE_SIMILARITY alike, most similar first"""
+        config = current_app.config
+        cutoff = datetime.utcnow() - timedelta(seconds=config['DEDUPE_WINDOW_SECONDS'])
+        scope = scope_of(client_id, artisan_id, service_category, location)
+        signature = self.signature(description)
+        with self._lock:
+            self._catch_up(cutoff)
+            self._expire(cutoff)
+            found = set()
+            for key in self._band_keys(scope, signature):
+                found |= self._buckets.get(key, set())
+            scored = []
+            for request_id in found:
+                other = self._entries[request_id][2]
+                similarity = sum(x == y for x, y in zip(signature, other)) / len(signature)
+                if similarity >= config['DEDUPE_SIMILARITY']:
+                    scored.append((similarity, request_id))
+        return [request_id for _, request_id in sorted(scored, reverse=True)]
+    
+    def add(self, service_request):
+        scope = scope_of(
+            service_request.client_id, service_request.artisan_id, service_request.service_category,
+            service_request.location
+        )
+        with self._lock:
+            self._add(service_request.id, service_request.created_at, scope, service_request.description)
+
+
+duplicate_index = ShardLocal(DuplicateIndex)
+
+
+def request_for_key(client_id, idempotency_key):
+    if not idempotency_key:
+        return None
+    return ServiceRequest.query.filter_by(client_id=client_id, idempotency_key=idempotency_key).first()
+
+
+def find_resubmission(client_id, idempotency_key, service_category, description, location, artisan_id=None,
+                      similar=True):
+    """The request this submission repeats, or None.
+    
+    A request made earlier with the same idempotency key always matches. With
+    similar, so does a still-pending near-duplicate from the same client (and
+    for direct bookings, to the same artisan) made within DEDUPE_WINDOW_SECONDS.
+    """
+    existing = request_for_key(client_id, idempotency_key)
+    if existing is not None or not similar or not current_app.config['DEDUPE_ENABLED']:
+        return existing
+    for request_id in duplicate_index.candidates(client_id, artisan_id, service_category, description, location):
+        existing = db.session.get(ServiceRequest, request_id)
+        if existing is not None and existing.status == 'pending' and existing.artisan_id == artisan_id:
+            return existing
+    return None
+
+
+def remember_request(service_request):
+    """Index a just-created request so this process catches its duplicates without a catch-up read"""
+    if current_app.config['DEDUPE_ENABLED']:
+        duplicate_index.add(service_request)
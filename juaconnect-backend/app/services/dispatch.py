@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, update
+from app import db
+from app.models import User, ServiceRequest, Notification, ArtisanStats
+from app.services.stats import adjust_unread, record_transition
+from app.services.analytics import record_request_event
+from app.services.sync import SHARED_FEED, record_tombstone
+from app.services.jobs import job, runner
+from app.services.sharding import ShardLocal, shard_router
+
+
+class CategoryIndex:
+    """In-memory map of service category -> verified artisan ids.
+    
+    Rebuilt from the database every DISPATCH_INDEX_REFRESH_SECONDS and patched
+    in place when an artisan in this process signs up or changes category.
+    """
+    
+    def __init__(self):
+        self._artisans = None
+        self._categories = {}  # artisan_id -> category, to move artisans between sets
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(category):
+        return (category or '').strip().lower()
+    
+    def _rebuild(self):
+        artisans, categories = {}, {}
+        rows = db.session.query(User.id, User.service_category).filter_by(
+            user_type='artisan', is_verified=True
+        )
+        for artisan_id, category in rows:
+            key = self._key(category)
+            artisans.setdefault(key, set()).add(artisan_id)
+            categories[artisan_id] = key
+        self._artisans, self._categories = artisans, categories
+        self._built_at = time.monotonic()
+    
+    def artisans_for(self, category):
+        max_age = current_app.config['DISPATCH_INDEX_REFRESH_SECONDS']
+        with self._lock:
+            if self._artisans is None or time.monotonic() - self._built_at > max_age:
+                self._rebuild()
+            return set(self._artisans.get(self._key(category), ()))
+    
+    def update(self, user):
+        """Reflect a signup or profile change without a rebuild"""
+        with self._lock:
+            if self._artisans is None:
+                return
+            old = self._categories.pop(user.id, None)
+            if old is not None:
+                self._artisans.get(old, set()).discard(user.id)
+            if user.user_type == 'artisan' and user.is_verified:
+                key = self._key(user.service_category)
+                self._artisans.setdefault(key, set()).add(user.id)
+                self._categories[user.id] = key
+    
+    def clear(self):
+        with self._lock:
+            self._artisans = None
+
+
+category_index = ShardLocal(CategoryIndex)
+
+
+@job('fan_out_request')
+def fan_out_request(request_id):
+    """Notify every matching artisan about an open request with one bulk insert"""
+    service_request = db.session.get(ServiceRequest, request_id)
+    if not service_request or service_request.status != 'pending' or service_request.artisan_id is not None:
+        return 0
+    
+    artisan_ids = category_index.artisans_for(service_request.service_category)
+    artisan_ids.discard(service_request.client_id)
+    if not artisan_ids:
+        return 0
+    
+    rows = [{
+        'user_id': artisan_id,
+        'title': 'New Service Request',
+        'message': f'New {service_request.service_category} request in {service_request.location}.',
+        'notification_type': 'booking',
+        'related_id': service_request.id,
+    } for artisan_id in artisan_ids]
+    db.session.execute(insert(Notification), rows)
+    adjust_unread(list(artisan_ids), 1)
+    db.session.commit()
+    return len(rows)
+
+
+def _notify_all(rows):
+    """Bulk insert notifications and bump each recipient's unread counter"""
+    if not rows:
+        return
+    db.session.execute(insert(Notification), rows)
+    for user_id, count in Counter(row['user_id'] for row in rows).items():
+        adjust_unread(user_id, count)
+
+
+def assign_request(service_request, artisan_id):
+    """Give an open request to an artisan, unless someone accepted it since it was planned"""
+    result = db.session.execute(
+        update(ServiceRequest).where(ServiceRequest.id == service_request.id, ServiceRequest.is_open()).values(
+            artisan_id=artisan_id, status='accepted', updated_at=datetime.utcnow()
+        ),
+        execution_options={'synchronize_session': False},
+    )
+    if not result.rowcount:
+        return False
+    db.session.refresh(service_request)
+    record_tombstone('available_requests', SHARED_FEED, service_request.id)
+    record_transition(artisan_id, None, 'accepted')
+    record_request_event(service_request, 'accepted')
+    return True
+
+
+def run_batch_assignment(mode=None):
+    """One batch dispatch cycle over the oldest ASSIGNMENT_MAX_REQUESTS open requests.
+    
+    Matches them one-to-one to verified artisans with fewer than
+    ASSIGNMENT_MAX_ACTIVE accepted or in-progress jobs, maximizing the total
+    recommendation score. mode 'assign' gives each request to its match,
+    'propose' notifies the matched artisan (once per pair) who may then accept
+    it as usual, and 'dry-run' changes nothing. Returns the [(request,
+    artisan_id, score)] plans, for 'assign' only those that were applied.
+    """
+    config = current_app.config
+    mode = mode or config['ASSIGNMENT_MODE']
+    requests = ServiceRequest.query.filter(ServiceRequest.is_open()).order_by(
+        ServiceRequest.created_at
+    ).limit(config['ASSIGNMENT_MAX_REQUESTS']).all()
+    if not requests:
+        return []
+    busy = {user_id for (user_id,) in db.session.query(ArtisanStats.user_id).filter(
+        ArtisanStats.accepted_count + ArtisanStats.in_progress_count >= config['ASSIGNMENT_MAX_ACTIVE']
+    )}
+    
+    # Imported here so numpy is only loaded by processes that run the dispatcher
+    from app.services.recommendations import plan_assignments
+    plans = plan_assignments(requests, busy, config['ASSIGNMENT_MIN_SCORE'])
+    
+    if mode == 'assign':
+        plans = [plan for plan in plans if assign_request(plan[0], plan[1])]
+        rows = []
+        for service_request, artisan_id, _ in plans:
+            rows.append({
+                'user_id': artisan_id,
+                'title': 'New Job Assigned',
+                'message': f'You have been assigned a {service_request.service_category} request in {service_request.location}.',
+                'notification_type': 'booking',
+                'related_id': service_request.id,
+            })
+            rows.append({
+                'user_id': service_request.client_id,
+                'title': 'Request Accepted',
+                'message': f'An artisan has been assigned to your {service_request.service_category} request!',
+                'notification_type': 'booking',
+                'related_id': service_request.id,
+            })
+        _notify_all(rows)
+    elif mode == 'propose':
+        proposed = set(db.session.query(Notification.user_id, Notification.related_id).filter(
+            Notification.notification_type == 'proposal',
+            Notification.related_id.in_([service_request.id for service_request, _, _ in plans]),
+        ))
+        _notify_all([{
+            'user_id': artisan_id,
+            'title': 'Suggested Request',
+            'message': f'A {service_request.service_category} request in {service_request.location} is a good match for you.',
+            'notification_type': 'proposal',
+            'related_id': service_request.id,
+        } for service_request, artisan_id, _ in plans if (artisan_id, service_request.id) not in proposed])
+    else:
+        return plans
+    db.session.commit()
+    return plans
+
+
+@job('batch_assign')
+def batch_assign_job():
+    """Periodic batch dispatcher; each successful run queues the next one, like the request compactor"""
+    shard_router.gather(lambda: len(run_batch_assignment()))
+    schedule_batch_assignment(chained=True)
+
+
+def schedule_batch_assignment(delay=None, chained=False):
+    """Queue a dispatcher run in ASSIGNMENT_INTERVAL_SECONDS (or delay) seconds, when ASSIGNMENT_MODE is on"""
+    config = current_app.config
+    interval = config['ASSIGNMENT_INTERVAL_SECONDS']
+    if config['ASSIGNMENT_MODE'] not in ('propose', 'assign') or not interval or not config['JOBS_ASYNC']:
+        return None
+    queue = runner.queue()
+    if not chained and queue.pending('batch_assign'):
+        return None
+    return queue.put('batch_assign', {}, config['JOB_MAX_ATTEMPTS'], delay=interval if delay is None else delay)
@@ -0,0 +1,242 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from flask import current_app, g
+
+_registry = {}
+
+
+def job(name):
+    """Register a function as a background job under name"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+class JobQueue:
+    """Persistent job queue in a local SQLite file.
+    
+    Every process on the host shares the file, so jobs survive restarts and any
+    worker can pick them up. A claimed job holds a lease; if its worker dies the
+    lease expires and the job is claimed again, until it runs out of attempts.
+    The lease's expiry time identifies the claim: complete() and fail() only
+    touch the job while the caller still holds it, so a runner that outlived its
+    lease can't delete or reschedule the job under the runner that reclaimed it.
+    """
+    
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
+    '''
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+    
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def put(self, name, payload, max_attempts, delay=0.0):
+        now = time.time()
+        cursor = self._conn().execute(
+            'INSERT INTO jobs (name, payload, max_attempts, run_at, created_at) VALUES (?, ?, ?, ?, ?)',
+            (name, json.dumps(payload), max_attempts, now + delay, now),
+        )
+        return cursor.lastrowid
+    
+    def claim(self, lease_seconds):
+        """Take the next due job, or None. Returns (id, name, payload, attempts, max_attempts, lease)."""
+        conn = self._conn()
+        now = time.time()
+        lease = now + lease_seconds
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # A job whose worker died on its last attempt is not run again
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', last_error = 'Lease expired', locked_until = NULL "
+                "WHERE status = 'running' AND locked_until < ? AND attempts >= max_attempts",
+                (now,),
+            )
+            row = conn.execute(
+                "SELECT id, name, payload, attempts, max_attempts FROM jobs "
+                "WHERE (status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_until < ?) "
+                "ORDER BY run_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                    (lease, row[0]),
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]), row[3] + 1, row[4], lease
+    
+    def complete(self, job_id, lease):
+        """Delete the job; False if the lease was lost to another claim"""
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE id = ? AND status = 'running' AND locked_until = ?", (job_id, lease)
+        )
+        return cursor.rowcount == 1
+    
+    def fail(self, job_id, lease, error, retry_in=None):
+        """Reschedule after retry_in seconds, or mark the job dead when retry_in is None.
+        
+        False if the lease was lost to another claim.
+        """
+        if retry_in is None:
+            cursor = self._conn().execute(
+                "UPDATE jobs SET status = 'dead', last_error = ?, locked_until = NULL "
+                "WHERE id = ? AND status = 'running' AND locked_until = ?",
+                (error, job_id, lease),
+            )
+        else:
+            cursor = self._conn().execute(
+                "UPDATE jobs SET status = 'queued', last_error = ?, run_at = ?, locked_until = NULL "
+                "WHERE id = ? AND status = 'running' AND locked_until = ?",
+                (error, time.time() + retry_in, job_id, lease),
+            )
+        return cursor.rowcount == 1
+    
+    def pending(self, name):
+        """Number of queued or running jobs called name"""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE name = ? AND status IN ('queued', 'running')", (name,)
+        ).fetchone()[0]
+    
+    def stats(self):
+        """Queue depth by status and the age of the oldest due job"""
+        conn = self._conn()
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        oldest = conn.execute(
+            "SELECT MIN(run_at) FROM jobs WHERE status = 'queued' AND run_at <= ?", (time.time(),)
+        ).fetchone()[0]
+        return {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_due_seconds': round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+    
+    def retry_dead(self):
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ? WHERE status = 'dead'", (time.time(),)
+        )
+        return cursor.rowcount
+
+
+class JobRunner:
+    """Enqueues jobs and runs them on a pool of worker threads.
+    
+    Threads start lazily on the first enqueue so each gunicorn worker process
+    gets its own pool after forking. With JOBS_ASYNC off (tests) jobs run inline.
+    """
+    
+    def __init__(self):
+        self._queue = None
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+    
+    def queue(self, app=None):
+        app = app or current_app
+        with self._lock:
+            if self._queue is None or self._queue.path != app.config['JOB_QUEUE_PATH']:
+                self._queue = JobQueue(app.config['JOB_QUEUE_PATH'])
+            return self._queue
+    
+    def enqueue(self, name, **payload):
+        app = current_app._get_current_object()
+        if name not in _registry:
+            raise KeyError(f'Unknown job: {name}')
+        if not app.config['JOBS_ASYNC']:
+            _registry[name](**payload)
+            return None
+        if app.config['SHARD_DATABASE_URLS']:
+            # Run the job against the shard it was queued from
+            payload['_shard'] = g.get('shard')
+        job_id = self.queue(app).put(name, payload, app.config['JOB_MAX_ATTEMPTS'])
+        self.start(app)
+        self._wakeup.set()
+        return job_id
+    
+    def start(self, app, workers=None):
+        workers = workers or app.config['JOB_WORKERS']
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for _ in range(workers - len(self._threads)):
+                thread = threading.Thread(target=self._work, args=(app,), daemon=True, name='job-worker')
+                thread.start()
+                self._threads.append(thread)
+    
+    def _work(self, app):
+        queue = self.queue(app)
+        while True:
+            claimed = queue.claim(app.config['JOB_LEASE_SECONDS'])
+            if claimed is None:
+                self._wakeup.wait(app.config['JOB_POLL_SECONDS'])
+                self._wakeup.clear()
+                continue
+            self.run_claimed(app, queue, claimed)
+    
+    def run_claimed(self, app, queue, claimed):
+        job_id, name, payload, attempts, max_attempts, lease = claimed
+        shard = payload.pop('_shard', None)
+        try:
+            with app.app_context():
+                g.shard = shard
+                _registry[name](**payload)
+        except Exception as e:
+            if attempts >= max_attempts:
+                app.logger.error(f'Job {name} ({job_id}) failed permanently: {e}')
+                held = queue.fail(job_id, lease, repr(e))
+            else:
+                # Exponential backoff with jitter
+                delay = app.config['JOB_BACKOFF_SECONDS'] * 2 ** (attempts - 1)
+                held = queue.fail(job_id, lease, repr(e), retry_in=delay * random.uniform(0.8, 1.2))
+        else:
+            held = queue.complete(job_id, lease)
+        if not held:
+            app.logger.warning(f'Job {name} ({job_id}) outlived its lease and was claimed again')
+    
+    def drain(self, app):
+        """Run due jobs on the calling thread until none are left"""
+        queue = self.queue(app)
+        count = 0
+        while (claimed := queue.claim(app.config['JOB_LEASE_SECONDS'])) is not None:
+            self.run_claimed(app, queue, claimed)
+            count += 1
+        return count
+
+
+runner = JobRunner()
+
+
+def enqueue(name, **payload):
+    """Queue a registered job; payload must be JSON serializable"""
+    return runner.enqueue(name, **payload)
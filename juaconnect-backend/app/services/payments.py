@@ -0,0 +1,295 @@
+import csv
+import hashlib
+import hmac
+import json
+import math
+import uuid
+from datetime import datetime
+from itertools import islice
+from flask import current_app
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.models import LIVE_PAYMENTS
+from app.models import Payment, Booking, ServiceRequest, ServiceRequestArchive, LedgerEntry, Notification
+from app.services.scheduling import lock_artisans
+from app.services.stats import add_earnings, adjust_unread
+
+RESULT_KEYS = ('settled', 'failed', 'duplicate', 'unmatched', 'mismatched', 'invalid')
+SUCCESS_STATUSES = {'completed', 'success', 'succeeded', 'paid'}
+FAILURE_STATUSES = {'failed', 'failure', 'declined', 'cancelled'}
+
+
+class PaymentError(Exception):
+    """Raised when a payment cannot be created for a request"""
+
+
+class PaymentConflict(PaymentError):
+    """Raised when the request already has a pending or completed payment"""
+
+
+class StubProvider:
+    """Local stand-in for the payment provider.
+    
+    charge() hands out references without moving money; settlements for them
+    are produced with write_stub_settlement() and fed through the same
+    reconciliation path as a real provider's callback file.
+    """
+    
+    name = 'stub'
+    
+    def charge(self, payment):
+        return f'STUB-{uuid.uuid4().hex[:20]}'
+
+
+PROVIDERS = {'stub': StubProvider}
+
+
+def get_provider():
+    name = current_app.config['PAYMENT_PROVIDER']
+    if not name:
+        raise PaymentError('Payments are not configured')
+    return PROVIDERS[name]()
+
+
+def check_config(app):
+    """Refuse to start outside development and testing with settings that let anyone mark payments paid"""
+    if app.debug or app.testing:
+        return
+    if app.config['PAYMENT_PROVIDER'] == 'stub':
+        raise RuntimeError('PAYMENT_PROVIDER=stub only charges pretend money; set a real provider or leave it unset')
+    if app.config['PAYMENT_PROVIDER'] and not app.config['PAYMENT_CALLBACK_SECRET']:
+        raise RuntimeError('PAYMENT_CALLBACK_SECRET is required to verify payment callbacks')
+
+
+def verify_signature(body, signature):
+    """Check the provider's HMAC-SHA256 signature of the raw callback body"""
+    secret = current_app.config['PAYMENT_CALLBACK_SECRET']
+    if not secret:
+        # Unsigned callbacks (from the local stub) are only accepted by development and test apps
+        return current_app.debug or current_app.testing
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+def payment_for_key(client_id, idempotency_key):
+    return Payment.query.filter_by(client_id=client_id, idempotency_key=idempotency_key).first()
+
+
+def live_payment(booking_id):
+    return Payment.query.filter(Payment.booking_id == booking_id, db.text(LIVE_PAYMENTS)).first()
+
+
+def create_payment(service_request, idempotency_key, payment_method=None):
+    """Start a payment for a completed request.
+    
+    Returns (payment, created). Repeating a call with the same idempotency key
+    (per client) returns the original payment instead of charging again. A
+    request with a pending or completed payment raises PaymentConflict, so a
+    new key cannot charge twice; failed payments can be retried.
+    """
+    existing = payment_for_key(service_request.client_id, idempotency_key)
+    if existing:
+        return existing, False
+    
+    if service_request.status != 'completed':
+        raise PaymentError('Only completed requests can be paid')
+    
+    booking = next((b for b in service_request.bookings if b.status == 'completed'), None)
+    if booking is None:
+        raise PaymentError('No completed booking found for this request')
+    
+    amount = booking.total_amount or service_request.budget
+    if not amount:
+        raise PaymentError('Booking has no amount to pay')
+    
+    if live_payment(booking.id):
+        raise PaymentConflict('This request already has a pending or completed payment')
+    
+    payment = Payment(
+        booking_id=booking.id,
+        client_id=service_request.client_id,
+        amount=amount,
+        status='pending',
+        payment_method=payment_method,
+        idempotency_key=idempotency_key,
+    )
+    payment.provider_reference = get_provider().charge(payment)
+    db.session.add(payment)
+    
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key, or a payment with another key, won the race
+        db.session.rollback()
+        existing = payment_for_key(service_request.client_id, idempotency_key)
+        if existing is None:
+            raise PaymentConflict('This request already has a pending or completed payment')
+        return existing, False
+    
+    return payment, True
+
+
+def _last_balances(artisan_ids):
+    latest = db.session.query(func.max(LedgerEntry.id)).filter(
+        LedgerEntry.artisan_id.in_(artisan_ids)
+    ).group_by(LedgerEntry.artisan_id)
+    rows = db.session.query(LedgerEntry.artisan_id, LedgerEntry.balance_after).filter(
+        LedgerEntry.id.in_(latest.scalar_subquery())
+    )
+    balances = {artisan_id: 0.0 for artisan_id in artisan_ids}
+    balances.update(dict(rows))
+    return balances
+
+
+def row_amount(row, default):
+    """A settlement row's amount (default when it has none), or None when it is not a number"""
+    if 'amount' not in row:
+        return default
+    try:
+        value = float(row['amount'])
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _match_payments(references):
+    """(id, reference, amount, status, artisan_id) per reference, keyed by reference"""
+    matches = db.session.query(
+        Payment.id, Payment.provider_reference, Payment.amount, Payment.status,
+        func.coalesce(Booking.artisan_id, ServiceRequest.artisan_id, ServiceRequestArchive.artisan_id)
+    ).join(Booking, Booking.id == Payment.booking_id).join(
+        ServiceRequest, ServiceRequest.id == Booking.request_id, isouter=True
+    ).join(
+        ServiceRequestArchive, ServiceRequestArchive.id == Booking.request_id, isouter=True
+    ).filter(Payment.provider_reference.in_(references)).all()
+    return {match[1]: match for match in matches}
+
+
+def settle_batch(rows):
+    """Apply a batch of settlement rows ({'reference', 'status', 'amount'}) in one transaction.
+    
+    Payments are matched with a single IN query, updated with one bulk UPDATE
+    and credited with one bulk ledger INSERT. Rows for payments that are no
+    longer pending are counted as duplicates, so replaying a file is harmless.
+    Successful rows whose amount is not a number are counted as invalid and
+    skipped; the rest of the batch is still applied.
+    """
+    result = dict.fromkeys(RESULT_KEYS, 0)
+    references = [row['reference'] for row in rows]
+    payments = _match_payments(references)
+    artisan_ids = [match[4] for match in payments.values() if match[3] == 'pending' and match[4] is not None]
+    if artisan_ids:
+        # Serialize settlements for the same artisans, then re-read the payments under the lock:
+        # another settlement may have settled them, and running balances must follow its entries
+        lock_artisans(artisan_ids)
+        payments = _match_payments(references)
+    
+    now = datetime.utcnow()
+    updates, credits, seen = [], [], set()
+    for row in rows:
+        match = payments.get(row['reference'])
+        if match is None:
+            result['unmatched'] += 1
+            continue
+        payment_id, _, amount, status, artisan_id = match
+        if status != 'pending' or payment_id in seen:
+            result['duplicate'] += 1
+            continue
+        
+        outcome = str(row.get('status', '')).lower()
+        if outcome in SUCCESS_STATUSES:
+            paid = row_amount(row, amount)
+            if paid is None:
+                result['invalid'] += 1
+                continue
+            if abs(paid - amount) > 0.005:
+                result['mismatched'] += 1
+                continue
+            updates.append({'id': payment_id, 'status': 'completed', 'settled_at': now})
+            credits.append((payment_id, artisan_id, amount))
+            result['settled'] += 1
+        elif outcome in FAILURE_STATUSES:
+            updates.append({'id': payment_id, 'status': 'failed', 'settled_at': now})
+            result['failed'] += 1
+        else:
+            result['unmatched'] += 1
+            continue
+        seen.add(payment_id)
+    
+    if not updates:
+        # Ends the transaction, releasing the artisans' lock
+        db.session.commit()
+        return result
+    
+    artisan_ids = sorted({artisan_id for _, artisan_id, _ in credits})
+    balances = _last_balances(artisan_ids) if artisan_ids else {}
+    
+    entries, paid = [], {}
+    for payment_id, artisan_id, amount in credits:
+        balances[artisan_id] += amount
+        paid[artisan_id] = paid.get(artisan_id, 0.0) + amount
+        entries.append({
+            'artisan_id': artisan_id,
+            'payment_id': payment_id,
+            'entry_type': 'payment',
+            'amount': amount,
+            'balance_after': balances[artisan_id],
+            'created_at': now,
+        })
+    
+    db.session.execute(update(Payment), updates)
+    if entries:
+        db.session.execute(insert(LedgerEntry), entries)
+        db.session.execute(insert(Notification), [{
+            'user_id': artisan_id,
+            'title': 'Payment Received',
+            'message': f'You received a payment of Ksh {total:,.2f}.',
+            'notification_type': 'payment',
+        } for artisan_id, total in paid.items()])
+        for artisan_id, total in paid.items():
+            add_earnings(artisan_id, paid=total)
+        adjust_unread(list(paid), 1)
+    db.session.commit()
+    return result
+
+
+def read_settlement_rows(stream, fmt='csv'):
+    """Yield settlement rows from a text stream without loading it all.
+    
+    csv: header with reference,status,amount. jsonl: one JSON object per line.
+    """
+    if fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)
+
+
+def reconcile(stream, fmt='csv', batch_size=None):
+    """Stream a settlement file through settle_batch in chunks, returning totals"""
+    batch_size = batch_size or current_app.config['PAYMENT_SETTLEMENT_BATCH_SIZE']
+    rows = read_settlement_rows(stream, fmt)
+    totals = dict.fromkeys(RESULT_KEYS, 0)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return totals
+        for key, value in settle_batch(chunk).items():
+            totals[key] += value
+
+
+def write_stub_settlement(stream, status='completed'):
+    """Write a CSV settlement for every pending stub payment, as the stub provider would send"""
+    writer = csv.writer(stream)
+    writer.writerow(['reference', 'status', 'amount'])
+    count = 0
+    pending = db.session.query(Payment.provider_reference, Payment.amount).filter(
+        Payment.status == 'pending', Payment.provider_reference.like('STUB-%')
+    ).yield_per(1000)
+    for reference, amount in pending:
+        writer.writerow([reference, status, amount])
+        count += 1
+    return count
@@ -0,0 +1,188 @@
+import time
+from threading import Lock, Thread
+import numpy as np
+from flask import current_app, g
+from sqlalchemy import func, select
+from app import db
+from app.models import Booking, User
+from app.services.analytics import area_of, category_of
+from app.services.retention import all_requests
+from app.services.sharding import ShardLocal
+
+QUANTILES = np.array([0.25, 0.5, 0.75])  # low, median, high
+
+
+class BudgetHistograms:
+    """Histograms of completed job prices, one NumPy row per (category, area) and per category.
+    
+    Bins are log-spaced between PRICE_MIN and PRICE_MAX, so small and large jobs
+    are resolved to the same few percent. Counting a completed job is two
+    increments and an estimate is a cumulative sum over one row, both under
+    the table's lock since counting can reallocate the counts array. Categories
+    without enough history fall back to artisans' hourly rates for a
+    DEFAULT_BOOKING_HOURS job.
+    """
+    
+    def __init__(self, low, high, bins):
+        self.edges = np.geomspace(low, high, bins + 1)
+        self.log_edges = np.log(self.edges)
+        self.rows = {}  # ('area', category, area) / ('category', category) / ('rates', category) -> row
+        self.counts = np.zeros((0, bins), dtype=np.int64)
+        self._lock = Lock()
+        self.built_at = time.monotonic()
+    
+    def _row(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.rows)
+            if row >= len(self.counts):
+                grown = np.zeros((max(16, 2 * len(self.counts)), self.counts.shape[1]), dtype=np.int64)
+                grown[:len(self.counts)] = self.counts
+                self.counts = grown
+        return row
+    
+    def _bins(self, prices):
+        """Bin index per price, and a mask of prices that can be counted"""
+        prices = np.asarray(prices, dtype=float)
+        valid = np.isfinite(prices) & (prices > 0)
+        bins = np.searchsorted(self.edges, np.where(valid, prices, 1.0), side='right') - 1
+        return np.clip(bins, 0, self.counts.shape[1] - 1), valid
+    
+    def _count(self, keys, prices):
+        bins, valid = self._bins(prices)
+        rows = np.fromiter((self._row(key) for key in keys), dtype=np.int64, count=len(keys))
+        np.add.at(self.counts, (rows[valid], bins[valid]), 1)
+    
+    @classmethod
+    def build(cls, chunk_size=50000):
+        config = current_app.config
+        table = cls(config['PRICE_MIN'], config['PRICE_MAX'], config['PRICE_BINS'])
+        
+        requests = all_requests('id', 'service_category', 'location', 'status', 'budget')
+        earned = select(Booking.request_id, func.sum(Booking.total_amount).label('amount')).where(
+            Booking.status == 'completed'
+        ).group_by(Booking.request_id).subquery()
+        query = select(
+            requests.c.service_category, requests.c.location, func.coalesce(earned.c.amount, requests.c.budget)
+        ).outerjoin(earned, earned.c.request_id == requests.c.id).where(requests.c.status == 'completed')
+        
+        result = db.session.execute(query.execution_options(yield_per=chunk_size))
+        for chunk in result.partitions():
+            categories = [category_of(category) for category, _, _ in chunk]
+            prices = [price for _, _, price in chunk]
+            table._count([('area', category, area_of(row[1])) for category, row in zip(categories, chunk)], prices)
+            table._count([('category', category) for category in categories], prices)
+        
+        rates = db.session.query(User.service_category, User.hourly_rate).filter(
+            User.user_type == 'artisan', User.is_verified == True, User.hourly_rate > 0  # noqa: E712
+        ).all()
+        if rates:
+            table._count(
+                [('rates', category_of(category)) for category, _ in rates],
+                np.array([rate for _, rate in rates], dtype=float) * config['DEFAULT_BOOKING_HOURS'],
+            )
+        return table
+    
+    def add(self, service_category, location, price):
+        """Count one completed job"""
+        category = category_of(service_category)
+        with self._lock:
+            self._count([('area', category, area_of(location)), ('category', category)], [price, price])
+    
+    def quantiles(self, row):
+        """(low, median, high) of one row, interpolated in log space within the bin"""
+        counts = self.counts[row]
+        cumulative = np.cumsum(counts)
+        targets = QUANTILES * cumulative[-1]
+        bins = np.searchsorted(cumulative, targets, side='left')
+        before = np.where(bins > 0, cumulative[bins - 1], 0)
+        fraction = (targets - before) / counts[bins]
+        logs = self.log_edges[bins] + fraction * (self.log_edges[bins + 1] - self.log_edges[bins])
+        return np.exp(logs)
+    
+    def estimate(self, service_category, location, min_samples):
+        """Suggested budget range, from the narrowest histogram with min_samples jobs, or None"""
+        category = category_of(service_category)
+        candidates = (
+            ('area', ('area', category, area_of(location))),
+            ('category', ('category', category)),
+            ('hourly_rate', ('rates', category)),
+        )
+        with self._lock:
+            for source, key in candidates:
+                row = self.rows.get(key)
+                if row is None:
+                    continue
+                samples = int(self.counts[row].sum())
+                if samples >= max(min_samples, 1):
+                    low, median, high = (round(float(value)) for value in self.quantiles(row))
+                    return {'low': low, 'median': median, 'high': high, 'samples': samples, 'source': source}
+        return None
+
+
+class PriceTableCache:
+    """Holds the current histograms, counts completions into them, and rebuilds them after PRICE_REFRESH_SECONDS.
+    
+    A build scans every completed job, so it runs on a background thread (inline
+    with JOBS_ASYNC off) while lookups keep using the previous table. Until the
+    first build finishes there are no estimates. The rebuild picks up jobs
+    completed by other processes.
+    """
+    
+    def __init__(self):
+        self._table = None
+        self._building = None  # the build thread while one runs
+        self._lock = Lock()
+    
+    def get(self):
+        """The current histograms, or None before the first build has finished"""
+        table = self._table
+        max_age = current_app.config['PRICE_REFRESH_SECONDS']
+        if table is None or time.monotonic() - table.built_at > max_age:
+            self.refresh()
+            table = self._table
+        return table
+    
+    def refresh(self):
+        """Start a rebuild unless one is already running"""
+        app = current_app._get_current_object()
+        if not app.config['JOBS_ASYNC']:
+            self._table = BudgetHistograms.build()
+            return
+        with self._lock:
+            if self._building is not None:
+                return
+            self._building = Thread(target=self._build, args=(app, g.get('shard')), daemon=True, name='price-tables')
+            self._building.start()
+    
+    def _build(self, app, shard):
+        try:
+            with app.app_context():
+                g.shard = shard
+                self._table = BudgetHistograms.build()
+        except Exception as e:
+            app.logger.error(f'Building price histograms failed: {e}')
+        finally:
+            with self._lock:
+                self._building = None
+    
+    def record(self, service_category, location, price):
+        table = self._table
+        if table is not None:
+            table.add(service_category, location, price)
+
+
+price_tables = ShardLocal(PriceTableCache)
+
+
+def estimate_price(service_category, location=None):
+    """{'low', 'median', 'high', 'samples', 'source'} for a new request, or None without enough history"""
+    table = price_tables.get()
+    if table is None:
+        return None
+    return table.estimate(service_category, location, current_app.config['PRICE_MIN_SAMPLES'])
+
+
+def record_price(service_request, price):
+    """Count a just-completed job in this process's histograms"""
+    price_tables.record(service_request.service_category, service_request.location, price)
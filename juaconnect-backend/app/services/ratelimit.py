@@ -0,0 +1,236 @@
+import math
+import sqlite3
+import threading
+import time
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+
+
+class MemoryBuckets:
+    """Token buckets held in this process; limits are per worker"""
+    
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def take(self, limits, cost):
+        """Take cost tokens from every (key, burst, rate) bucket, or none of them.
+        
+        Returns 0 when admitted, otherwise the seconds until the request would fit.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, burst, rate in limits:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                levels.append(min(burst, tokens + (now - updated) * rate))
+            wait = _wait_time(limits, levels, cost)
+            if wait == 0:
+                for (key, _, _), tokens in zip(limits, levels):
+                    self._buckets[key] = (tokens - cost, now)
+                if len(self._buckets) > self.max_keys:
+                    self._prune(now)
+            return wait
+    
+    def _prune(self, now):
+        # Buckets idle for over a minute are treated as refilled; dropping them loses nothing
+        # for any realistic rate
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated > 60]
+        for key in stale:
+            del self._buckets[key]
+
+
+class SQLiteBuckets:
+    """Token buckets in a local SQLite file shared by every worker on the host"""
+    
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID;
+    '''
+    
+    def __init__(self, path, prune_every=1000):
+        self.path = path
+        self.prune_every = prune_every
+        self._calls = 0
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+    
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+    
+    def take(self, limits, cost):
+        now = time.time()
+        conn = self._conn()
+        keys = [key for key, _, _ in limits]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = dict(
+                (key, (tokens, updated)) for key, tokens, updated in conn.execute(
+                    f"SELECT key, tokens, updated FROM buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+                )
+            )
+            levels = []
+            for key, burst, rate in limits:
+                tokens, updated = rows.get(key, (burst, now))
+                levels.append(min(burst, tokens + max(0.0, now - updated) * rate))
+            wait = _wait_time(limits, levels, cost)
+            if wait == 0:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                    [(key, tokens - cost, now) for key, tokens in zip(keys, levels)]
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._calls += 1
+        if self._calls % self.prune_every == 0:
+            self.prune()
+        return wait
+    
+    def prune(self, idle_seconds=60):
+        """Drop buckets idle long enough to have refilled"""
+        return self._conn().execute('DELETE FROM buckets WHERE updated < ?', (time.time() - idle_seconds,)).rowcount
+
+
+def _wait_time(limits, levels, cost):
+    wait = 0.0
+    for (_, burst, rate), tokens in zip(limits, levels):
+        if cost > burst:
+            return math.inf
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / rate)
+    return wait
+
+
+class Limiter:
+    """Admission control: token buckets per IP and per user, plus in-flight caps.
+    
+    Every request costs RATE_LIMIT_COSTS[endpoint] tokens (default 1, 0 exempts
+    the endpoint) from the caller's IP bucket and, with a valid token, their user
+    bucket. An empty bucket is answered with 429 and Retry-After straight away.
+    In-flight requests are capped per process (MAX_CONCURRENT_REQUESTS and
+    CONCURRENCY_LIMITS per endpoint); a request over the cap is shed with 503
+    rather than queued behind slow ones.
+    """
+    
+    def __init__(self):
+        self._buckets = None
+        self._backend = None
+        self._slots = {}
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+    
+    def buckets(self, app=None):
+        app = app or current_app
+        backend = (app.config['RATE_LIMIT_BACKEND'], app.config['RATE_LIMIT_PATH'])
+        with self._lock:
+            if self._buckets is None or self._backend != backend:
+                if backend[0] == 'sqlite':
+                    self._buckets = SQLiteBuckets(backend[1])
+                else:
+                    self._buckets = MemoryBuckets()
+                self._backend = backend
+            return self._buckets
+    
+    def _semaphore(self, name, size):
+        with self._lock:
+            if (name, size) not in self._slots:
+                self._slots[name, size] = threading.BoundedSemaphore(size)
+            return self._slots[name, size]
+    
+    def admit(self, concurrency=True):
+        """Admit the current request, or return the 429/503 response to send instead"""
+        if not current_app.config['RATE_LIMIT_ENABLED'] or request.method == 'OPTIONS':
+            return None
+        
+        costs = current_app.config['RATE_LIMIT_COSTS']
+        cost = costs.get(request.endpoint, costs.get('default', 1))
+        if cost <= 0:
+            return None
+        
+        limits = [(
+            f'ip:{client_ip()}',
+            current_app.config['RATE_LIMIT_IP_BURST'],
+            current_app.config['RATE_LIMIT_IP_PER_SECOND'],
+        )]
+        user_id = current_user_id()
+        if user_id is not None:
+            limits.append((
+                f'user:{user_id}',
+                current_app.config['RATE_LIMIT_USER_BURST'],
+                current_app.config['RATE_LIMIT_USER_PER_SECOND'],
+            ))
+        
+        try:
+            wait = self.buckets().take(limits, cost)
+        except sqlite3.OperationalError as e:
+            # Fail open: a locked or missing bucket file must not take the API down
+            current_app.logger.warning(f'Rate limit backend unavailable: {e}')
+            wait = 0
+        if wait:
+            retry_after = 3600 if math.isinf(wait) else max(1, math.ceil(wait))
+            return _reject(429, 'Too many requests, please slow down', retry_after)
+        
+        # Batch sub-requests share g with the batch request, which already holds a slot
+        if not concurrency or g.get('admitted'):
+            return None
+        
+        acquired = []
+        caps = [('*', current_app.config['MAX_CONCURRENT_REQUESTS'])]
+        if request.endpoint in current_app.config['CONCURRENCY_LIMITS']:
+            caps.append((request.endpoint, current_app.config['CONCURRENCY_LIMITS'][request.endpoint]))
+        for name, size in caps:
+            semaphore = self._semaphore(name, size)
+            if not semaphore.acquire(blocking=False):
+                for held in acquired:
+                    held.release()
+                return _reject(503, 'Server busy, please retry shortly', 1)
+            acquired.append(semaphore)
+        
+        g.admitted = True
+        request.environ['juaconnect.admission_slots'] = acquired
+        return None
+    
+    def release(self, exc=None):
+        for semaphore in request.environ.pop('juaconnect.admission_slots', ()):
+            semaphore.release()
+
+
+def client_ip():
+    """The caller's address; ProxyFix (PROXY_HOPS) has already taken it from X-Forwarded-For behind a proxy"""
+    return request.remote_addr or 'unknown'
+
+
+def current_user_id():
+    """Identity from a valid bearer token, or None; bad tokens are left to @jwt_required"""
+    if not request.headers.get('Authorization'):
+        return None
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def _reject(status, message, retry_after):
+    response = jsonify({'success': False, 'message': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+limiter = Limiter()
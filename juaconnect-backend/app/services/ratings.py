@@ -0,0 +1,70 @@
+from flask import current_app
+from sqlalchemy import func, update
+from app import db
+from app.models import User, Booking, Review
+from app.services.retention import all_requests
+
+
+def bayesian_average(rating_sum, rating_count):
+    """(sum + m * C) / (count + m) where C is the prior mean and m its weight.
+    
+    Artisans without reviews keep a rating of 0 so they sort as unrated.
+    """
+    if not rating_count:
+        return 0.0
+    mean = current_app.config['RATING_PRIOR_MEAN']
+    weight = current_app.config['RATING_PRIOR_WEIGHT']
+    return (rating_sum + mean * weight) / (rating_count + weight)
+
+
+def record_review(artisan, rating):
+    """Add a review to the artisan's aggregates.
+    
+    The columns are updated with SQL expressions, so concurrent reviews cannot
+    lose an increment. Call before committing the transaction that adds the review.
+    """
+    mean = current_app.config['RATING_PRIOR_MEAN']
+    weight = current_app.config['RATING_PRIOR_WEIGHT']
+    artisan.rating = (User.rating_sum + rating + mean * weight) / (User.rating_count + 1 + weight)
+    artisan.rating_sum = User.rating_sum + rating
+    artisan.rating_count = User.rating_count + 1
+    db.session.flush()
+
+
+def record_completed_job(artisan):
+    """Count a completed request. Call before committing the status change."""
+    artisan.completed_jobs = User.completed_jobs + 1
+    db.session.flush()
+
+
+def rebuild_aggregates():
+    """Recompute every artisan's aggregates from reviews and completed requests"""
+    # Older reviews may predate the denormalized Review.artisan_id
+    requests = all_requests('id', 'artisan_id', 'status')
+    artisan_id = func.coalesce(Review.artisan_id, requests.c.artisan_id)
+    review_totals = db.session.query(
+        artisan_id, func.sum(Review.rating), func.count(Review.id)
+    ).join(Booking, Booking.id == Review.booking_id).join(
+        requests, requests.c.id == Booking.request_id
+    ).filter(artisan_id.isnot(None)).group_by(artisan_id).all()
+    reviews = {artisan_id: (total, count) for artisan_id, total, count in review_totals}
+    
+    completed = dict(db.session.query(requests.c.artisan_id, func.count(requests.c.id)).filter(
+        requests.c.status == 'completed', requests.c.artisan_id.isnot(None)
+    ).group_by(requests.c.artisan_id).all())
+    
+    rows = []
+    for (artisan_id,) in db.session.query(User.id).filter_by(user_type='artisan'):
+        total, count = reviews.get(artisan_id, (0, 0))
+        rows.append({
+            'id': artisan_id,
+            'rating_sum': float(total),
+            'rating_count': count,
+            'rating': bayesian_average(total, count),
+            'completed_jobs': completed.get(artisan_id, 0),
+        })
+    
+    if rows:
+        db.session.execute(update(User), rows)
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,278 @@
+import time
+from threading import Lock
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import User
+from app.services.retention import all_requests
+from app.services.sharding import ShardLocal
+
+EARTH_RADIUS_KM = 6371.0
+DISTANCE_SCALE_KM = 10.0  # Distance score halves roughly every 7km
+
+
+def area_tokens(*values):
+    """Split location strings like 'Westlands, Nairobi' into lowercased area names"""
+    tokens = set()
+    for value in values:
+        for part in (value or '').split(','):
+            part = ' '.join(part.split()).lower()
+            if part:
+                tokens.add(part)
+    return tokens
+
+
+class ArtisanFeatureTable:
+    """Column-oriented snapshot of the features used to rank artisans.
+    
+    One NumPy array per feature, one row per verified artisan, so scoring every
+    candidate for a request is a handful of vectorized operations.
+    """
+    
+    def __init__(self, rows, status_counts):
+        n = len(rows)
+        self.ids = np.empty(n, dtype=np.int64)
+        self.category = np.empty(n, dtype=np.int32)
+        self.latitude = np.full(n, np.nan)
+        self.longitude = np.full(n, np.nan)
+        self.rating = np.zeros(n)
+        self.hourly_rate = np.full(n, np.nan)
+        self.completion_rate = np.zeros(n)
+        self.workload = np.zeros(n)
+        self.category_codes = {}
+        areas = {}
+        
+        for i, row in enumerate(rows):
+            self.ids[i] = row.id
+            key = (row.service_category or '').strip().lower()
+            self.category[i] = self.category_codes.setdefault(key, len(self.category_codes))
+            if row.latitude is not None and row.longitude is not None:
+                self.latitude[i] = row.latitude
+                self.longitude[i] = row.longitude
+            self.rating[i] = row.rating or 0.0
+            if row.hourly_rate:
+                self.hourly_rate[i] = row.hourly_rate
+            
+            counts = status_counts.get(row.id, {})
+            finished = counts.get('completed', 0) + counts.get('cancelled', 0)
+            self.completion_rate[i] = counts.get('completed', 0) / finished if finished else 0.5
+            self.workload[i] = counts.get('accepted', 0) + counts.get('in_progress', 0)
+            
+            for token in area_tokens(row.location, row.service_area):
+                areas.setdefault(token, []).append(i)
+        
+        self.areas = {token: np.array(rows_, dtype=np.int64) for token, rows_ in areas.items()}
+        # Precomputed haversine terms
+        self.lat_rad = np.radians(self.latitude)
+        self.lon_rad = np.radians(self.longitude)
+        self.cos_lat = np.cos(self.lat_rad)
+        self.built_at = time.monotonic()
+    
+    @classmethod
+    def build(cls):
+        rows = db.session.query(
+            User.id, User.service_category, User.location, User.service_area, User.latitude,
+            User.longitude, User.rating, User.hourly_rate
+        ).filter_by(user_type='artisan', is_verified=True).all()
+        
+        status_counts = {}
+        requests = all_requests('id', 'artisan_id', 'status')
+        grouped = db.session.query(
+            requests.c.artisan_id, requests.c.status, func.count(requests.c.id)
+        ).filter(requests.c.artisan_id.isnot(None)).group_by(
+            requests.c.artisan_id, requests.c.status
+        )
+        for artisan_id, status, count in grouped:
+            status_counts.setdefault(artisan_id, {})[status] = count
+        
+        return cls(rows, status_counts)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def score(self, service_request, weights, booking_hours):
+        """Return one score per row for the given request"""
+        n = len(self)
+        
+        code = self.category_codes.get((service_request.service_category or '').strip().lower(), -1)
+        category = (self.category == code).astype(float)
+        
+        if service_request.latitude is not None and service_request.longitude is not None:
+            lat1 = np.radians(service_request.latitude)
+            dlat = self.lat_rad - lat1
+            dlon = self.lon_rad - np.radians(service_request.longitude)
+            a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * self.cos_lat * np.sin(dlon / 2) ** 2
+            km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+            distance = np.nan_to_num(np.exp(-km / DISTANCE_SCALE_KM), nan=0.0)
+        else:
+            distance = np.zeros(n)
+        # Artisans without coordinates still score when they serve the request's area
+        for token in area_tokens(service_request.location):
+            rows = self.areas.get(token)
+            if rows is not None:
+                distance[rows] = np.maximum(distance[rows], 1.0)
+        
+        if service_request.budget:
+            estimate = self.hourly_rate * booking_hours
+            price = np.where(estimate <= service_request.budget, 1.0, service_request.budget / estimate)
+            price = np.nan_to_num(price, nan=0.5)
+        else:
+            price = np.full(n, 0.5)
+        
+        return (
+            weights['category'] * category
+            + weights['distance'] * distance
+            + weights['rating'] * self.rating / 5.0
+            + weights['completion'] * self.completion_rate
+            + weights['price'] * price
+            + weights['workload'] / (1.0 + self.workload)
+        )
+    
+    def top_k(self, service_request, k, weights, booking_hours):
+        """Return [(artisan_id, score)] for the k best artisans, best first"""
+        if not len(self) or k <= 0:
+            return []
+        scores = self.score(service_request, weights, booking_hours)
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(self.ids[i]), float(scores[i])) for i in best]
+
+
+class FeatureTableCache:
+    """Holds the current feature table and rebuilds it after RECOMMENDATION_REFRESH_SECONDS"""
+    
+    def __init__(self):
+        self._table = None
+        self._lock = Lock()
+    
+    def invalidate(self):
+        self._table = None
+    
+    def get(self):
+        table = self._table
+        max_age = current_app.config['RECOMMENDATION_REFRESH_SECONDS']
+        if table is None or time.monotonic() - table.built_at > max_age:
+            with self._lock:
+                if self._table is table:
+                    self._table = ArtisanFeatureTable.build()
+                table = self._table
+        return table
+
+
+feature_tables = ShardLocal(FeatureTableCache)
+
+
+def recommend_artisans(service_request, limit=10):
+    """Rank verified artisans for a request, returning [(artisan_id, score)]"""
+    return feature_tables.get().top_k(
+        service_request,
+        limit,
+        current_app.config['RECOMMENDATION_WEIGHTS'],
+        current_app.config['DEFAULT_BOOKING_HOURS'],
+    )
+
+
+def solve_assignment(values):
+    """Maximum-total-value one-to-one matching of rows to columns; returns each row's column or -1.
+    
+    Pairs worth 0 or less (or -inf) are never matched. Uses shortest augmenting
+    paths (the Jonker-Volgenant form of the Hungarian method): each row is added
+    by a Dijkstra search whose scan of a row is one vectorized pass over the
+    columns, so thousands x thousands solves in a few seconds.
+    """
+    values = np.maximum(np.nan_to_num(np.asarray(values, dtype=float), nan=0.0, posinf=0.0, neginf=0.0), 0.0)
+    match = np.full(values.shape[0], -1)
+    # Rows and columns with nothing worth matching stay out of the search
+    rows = np.flatnonzero(values.max(axis=1, initial=0.0) > 0)
+    columns = np.flatnonzero(values.max(axis=0, initial=0.0) > 0)
+    if not rows.size or not columns.size:
+        return match
+    values = values[np.ix_(rows, columns)]
+    transposed = len(rows) > len(columns)
+    cost = values.max() - (values.T if transposed else values)
+    n, m = cost.shape
+    
+    # Feasible duals (row minima) and a greedy start on tight pairs
+    u = cost.min(axis=1)
+    v = np.zeros(m)
+    row4col = np.full(m, -1)
+    col4row = np.full(n, -1)
+    for i, j in enumerate(np.argmin(cost, axis=1)):
+        if row4col[j] < 0:
+            row4col[j], col4row[i] = i, j
+    
+    for start in np.flatnonzero(col4row < 0):
+        shortest = np.full(m, np.inf)
+        path = np.full(m, -1)
+        remaining = np.ones(m, dtype=bool)
+        scanned = [start]
+        i, reached = start, 0.0
+        while True:
+            reduced = reached + cost[i] - u[i] - v
+            better = remaining & (reduced < shortest)
+            shortest[better] = reduced[better]
+            path[better] = i
+            frontier = np.where(remaining, shortest, np.inf)
+            ties = frontier == frontier.min()
+            # Ending on a free column keeps degenerate (tied) problems from searching every column
+            free = ties & (row4col < 0)
+            j = int(np.argmax(free if free.any() else ties))
+            reached = shortest[j]
+            remaining[j] = False
+            if row4col[j] < 0:
+                break
+            i = row4col[j]
+            scanned.append(i)
+        
+        u[start] += reached
+        others = np.array(scanned[1:], dtype=np.int64)
+        u[others] += reached - shortest[col4row[others]]
+        done = ~remaining
+        v[done] -= reached - shortest[done]
+        while True:
+            i = path[j]
+            row4col[j] = i
+            col4row[i], j = j, col4row[i]
+            if i == start:
+                break
+    
+    pairs = (np.flatnonzero(row4col >= 0), row4col[row4col >= 0]) if transposed else (np.arange(n), col4row)
+    for i, j in zip(*pairs):
+        if values[i, j] > 0:
+            match[rows[i]] = columns[j]
+    return match
+
+
+def plan_assignments(requests, busy, min_score):
+    """Best one-to-one [(request, artisan_id, score)] matches for open requests.
+    
+    Pairs are scored like recommend_artisans, only within a category, and skip
+    artisans in busy and pairs scoring below min_score. Categories never share a
+    match, so each is solved as its own, smaller, assignment problem.
+    """
+    table = feature_tables.get()
+    config = current_app.config
+    weights, hours = config['RECOMMENDATION_WEIGHTS'], config['DEFAULT_BOOKING_HOURS']
+    available = ~np.isin(table.ids, np.fromiter(busy, dtype=np.int64, count=len(busy)))
+    
+    groups = {}
+    for service_request in requests:
+        code = table.category_codes.get((service_request.service_category or '').strip().lower())
+        if code is not None:
+            groups.setdefault(code, []).append(service_request)
+    
+    plans = []
+    for code, group in groups.items():
+        columns = np.flatnonzero(available & (table.category == code))
+        if not columns.size:
+            continue
+        ids = table.ids[columns]
+        scores = np.stack([table.score(service_request, weights, hours)[columns] for service_request in group])
+        for i, service_request in enumerate(group):
+            scores[i, ids == service_request.client_id] = -np.inf
+        match = solve_assignment(scores - min_score)
+        for i in np.flatnonzero(match >= 0):
+            plans.append((group[i], int(ids[match[i]]), float(scores[i, match[i]])))
+    return plans
@@ -0,0 +1,161 @@
+import math
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from app.services.sharding import shard_router
+
+# The time of the caller's last write travels with them, so any worker can keep their reads on
+# the primary until a replica has caught up: API clients echo the header, browsers the cookie.
+WRITE_HEADER = 'X-Last-Write'
+WRITE_COOKIE = 'last_write'
+
+
+class RoutingSession(Session):
+    """Session that picks the database for each statement.
+    
+    In sharded mode everything but global tables goes to the current region's
+    shard (see app/services/sharding.py). Otherwise SELECTs made by
+    @replica_read views go to a read replica, and everything else (writes,
+    flushes, reads in other views) uses the primary, as does a replica-routed
+    read when no replica is fresh enough.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            shard = shard_router.engine_for(self._db, mapper, clause)
+            if shard is not None:
+                return shard
+        if (
+            bind is None
+            and not self._flushing
+            and getattr(clause, 'is_select', False)
+            and has_app_context()
+            and g.get('read_replica')
+        ):
+            name = replica_bind()
+            if name:
+                return self._db.engines[name]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaMonitor:
+    """Tracks how far behind each replica bind is.
+    
+    The primary's replica_heartbeat row is stamped every REPLICA_HEARTBEAT_SECONDS
+    by `flask replica-heartbeat`; the stamp a replica has replayed is how fresh
+    it is. Replicas are polled at most every REPLICA_CHECK_SECONDS per process.
+    """
+    
+    def __init__(self):
+        self._fresh = {}  # bind -> (checked_at, beat_at or None)
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        app.after_request(self.remember_write)
+    
+    def fresh_at(self, app, name):
+        """Primary time the replica has caught up to, or None if it cannot be read"""
+        now = time.time()
+        with self._lock:
+            checked_at, beat_at = self._fresh.get(name, (0.0, None))
+        if now - checked_at < app.config['REPLICA_CHECK_SECONDS']:
+            return beat_at
+        
+        try:
+            with app.extensions['sqlalchemy'].engines[name].connect() as conn:
+                beat_at = conn.execute(text('SELECT beat_at FROM replica_heartbeat WHERE id = 1')).scalar()
+        except Exception as e:
+            app.logger.warning(f'Replica {name} unavailable: {e}')
+            beat_at = None
+        with self._lock:
+            self._fresh[name] = (now, beat_at)
+        return beat_at
+    
+    def choose(self, app, not_before=None):
+        """A replica bind at most REPLICA_MAX_LAG_SECONDS behind (and past not_before), or None"""
+        names = app.config['REPLICA_BINDS']
+        if not names:
+            return None
+        oldest = time.time() - app.config['REPLICA_MAX_LAG_SECONDS']
+        if not_before is not None:
+            oldest = max(oldest, not_before)
+        healthy = [name for name in names if (self.fresh_at(app, name) or 0) >= oldest]
+        return random.choice(healthy) if healthy else None
+    
+    def remember_write(self, response):
+        """after_request hook: hand the caller the time of a successful write so their next reads see it"""
+        if (
+            not current_app.config['REPLICA_BINDS']
+            or request.method in ('GET', 'HEAD', 'OPTIONS')
+            or response.status_code >= 400
+        ):
+            return response
+        now = time.time()
+        # Later sub-requests of a batch share g with this one
+        g.last_write = now
+        stamp = f'{now:.6f}'
+        response.headers[WRITE_HEADER] = stamp
+        # Writes older than the allowed lag are visible on every replica we would pick
+        max_age = math.ceil(current_app.config['REPLICA_MAX_LAG_SECONDS']) + 1
+        response.set_cookie(WRITE_COOKIE, stamp, max_age=max_age, httponly=True, samesite='Lax')
+        return response
+
+
+def replica_read(view):
+    """Let the view's queries go to a read replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        previous = g.get('read_replica')
+        g.read_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.read_replica = previous
+            if g.pop('replica_bind', None):
+                # Rows read from a replica may be stale; don't let a later write in a batch reuse them
+                current_app.extensions['sqlalchemy'].session.expire_all()
+    return wrapper
+
+
+def replica_bind():
+    """Replica serving this view's reads, picked on first use; None means the primary"""
+    if 'replica_bind' not in g:
+        g.replica_bind = monitor.choose(current_app, last_write())
+    return g.replica_bind
+
+
+def replica_fresh_at():
+    """How current the data this view reads is: the replica's heartbeat, or None on the primary"""
+    if not g.get('read_replica'):
+        return None
+    name = replica_bind()
+    return monitor.fresh_at(current_app, name) if name else None
+
+
+def last_write():
+    """When the caller last wrote, from the request or an earlier sub-request of a batch, or None"""
+    stamps = [g.get('last_write')]
+    sources = (request.headers.get(WRITE_HEADER), request.cookies.get(WRITE_COOKIE)) if has_request_context() else ()
+    for raw in sources:
+        try:
+            stamps.append(float(raw))
+        except (TypeError, ValueError):
+            pass
+    stamps = [stamp for stamp in stamps if stamp is not None and math.isfinite(stamp)]
+    # A stamp from the future could only be forged; it still means "read from the primary"
+    return min(max(stamps), time.time()) if stamps else None
+
+
+def beat():
+    """Stamp the primary's heartbeat row; a replica's lag is how old its copy of the stamp is"""
+    from app import db
+    from app.models import ReplicaHeartbeat
+    db.session.merge(ReplicaHeartbeat(id=1, beat_at=time.time()))
+    db.session.commit()
+
+
+monitor = ReplicaMonitor()
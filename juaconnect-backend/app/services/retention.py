@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+from flask import current_app
+from sqlalchemy import select, delete, insert, func, or_, union_all
+from app import db
+from app.models import Notification, NotificationArchive, ServiceRequest, ServiceRequestArchive
+from app.models.models import TERMINAL_STATUSES
+from app.services.jobs import job, runner
+from app.services.sharding import shard_router
+from app.services.sync import prune_tombstones
+
+REQUEST_COLUMNS = (
+    'id', 'client_id', 'artisan_id', 'service_category', 'description', 'status', 'location',
+    'latitude', 'longitude', 'budget', 'created_at', 'accepted_at', 'updated_at',
+)
+
+
+def compaction_candidates(cutoff, hot_limit):
+    """(user_id, notification id) of read notifications older than cutoff or outside the user's newest hot_limit"""
+    ranked = select(
+        Notification.id,
+        Notification.user_id,
+        Notification.is_read,
+        Notification.created_at,
+        func.row_number().over(
+            partition_by=Notification.user_id,
+            order_by=(Notification.created_at.desc(), Notification.id.desc())
+        ).label('rank'),
+    ).subquery()
+    
+    return db.session.execute(
+        select(ranked.c.user_id, ranked.c.id).where(
+            ranked.c.is_read.is_(True),
+            or_(ranked.c.created_at < cutoff, ranked.c.rank > hot_limit)
+        ).order_by(ranked.c.user_id, ranked.c.created_at, ranked.c.id)
+    ).all()
+
+
+def archive_user(user_id, ids, chunk_size):
+    """Move one user's notifications into compressed archive rows and delete them"""
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        notifications = Notification.query.filter(Notification.id.in_(chunk)).order_by(
+            Notification.created_at.desc(), Notification.id.desc()
+        ).all()
+        if not notifications:
+            continue
+        db.session.add(NotificationArchive(
+            user_id=user_id,
+            count=len(notifications),
+            oldest_at=notifications[-1].created_at,
+            newest_at=notifications[0].created_at,
+            payload=NotificationArchive.pack([n.to_dict() for n in notifications]),
+        ))
+        db.session.execute(
+            delete(Notification).where(Notification.id.in_([n.id for n in notifications])),
+            execution_options={'synchronize_session': False},
+        )
+
+
+def compact_notifications(retention_days=None, hot_limit=None, users_per_commit=200):
+    """Compact read notifications into notification_archives.
+    
+    Unread notifications are never touched, so unread counters stay valid.
+    Commits every users_per_commit users; returns (users, notifications) archived.
+    """
+    config = current_app.config
+    retention_days = config['NOTIFICATION_RETENTION_DAYS'] if retention_days is None else retention_days
+    hot_limit = config['NOTIFICATION_HOT_LIMIT'] if hot_limit is None else hot_limit
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    
+    users = archived = 0
+    for user_id, rows in groupby(compaction_candidates(cutoff, hot_limit), key=lambda row: row.user_id):
+        ids = [row.id for row in rows]
+        archive_user(user_id, ids, config['NOTIFICATION_ARCHIVE_CHUNK'])
+        users += 1
+        archived += len(ids)
+        if users % users_per_commit == 0:
+            db.session.commit()
+    db.session.commit()
+    return users, archived
+
+
+def archived_notifications(user_id, before=None, limit=5):
+    """Newest-first page of archive chunks for a user; returns (notifications, next_before)"""
+    query = NotificationArchive.query.filter_by(user_id=user_id)
+    if before:
+        query = query.filter(NotificationArchive.id < before)
+    archives = query.order_by(NotificationArchive.id.desc()).limit(limit).all()
+    notifications = [n for archive in archives for n in archive.notifications()]
+    next_before = archives[-1].id if len(archives) == limit else None
+    return notifications, next_before
+
+
+def compact_requests(retention_days=None, batch_size=None):
+    """Move completed/cancelled requests not updated for retention_days into service_request_archive.
+    
+    Each batch is copied and deleted in one transaction, so a request is always
+    in exactly one of the two tables. Returns the number of requests moved.
+    """
+    config = current_app.config
+    retention_days = config['REQUEST_RETENTION_DAYS'] if retention_days is None else retention_days
+    batch_size = batch_size or config['REQUEST_ARCHIVE_BATCH']
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    columns = [getattr(ServiceRequest, name) for name in REQUEST_COLUMNS]
+    
+    moved = 0
+    while True:
+        ids = db.session.scalars(
+            select(ServiceRequest.id).where(
+                ServiceRequest.status.in_(TERMINAL_STATUSES),
+                ServiceRequest.updated_at < cutoff,
+            ).order_by(ServiceRequest.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        db.session.execute(insert(ServiceRequestArchive).from_select(
+            REQUEST_COLUMNS, select(*columns).where(ServiceRequest.id.in_(ids))
+        ))
+        db.session.execute(
+            delete(ServiceRequest).where(ServiceRequest.id.in_(ids)),
+            execution_options={'synchronize_session': False},
+        )
+        db.session.commit()
+        moved += len(ids)
+    return moved
+
+
+@job('compact_requests')
+def compact_requests_job():
+    """Background compactor; each successful run queues the next one.
+    
+    Also prunes delta-sync tombstones past SYNC_MAX_WATERMARK_AGE_DAYS. A failed
+    run is retried by the job runner instead, so there is only ever one chain.
+    """
+    shard_router.gather(compact_requests)
+    shard_router.gather(prune_tombstones)
+    schedule_request_compaction(chained=True)
+
+
+def schedule_request_compaction(delay=None, chained=False):
+    """Queue a compactor run in REQUEST_COMPACT_INTERVAL_SECONDS (or delay) seconds.
+    
+    Does nothing when compaction is off or, unless chained from the running
+    compactor, when a run is already queued or running.
+    """
+    config = current_app.config
+    interval = config['REQUEST_COMPACT_INTERVAL_SECONDS']
+    if not interval or not config['JOBS_ASYNC']:
+        return None
+    queue = runner.queue()
+    if not chained and queue.pending('compact_requests'):
+        return None
+    return queue.put('compact_requests', {}, config['JOB_MAX_ATTEMPTS'], delay=interval if delay is None else delay)
+
+
+def all_requests(*names):
+    """service_requests UNION ALL service_request_archive, as a subquery of the named columns"""
+    names = names or REQUEST_COLUMNS
+    return union_all(
+        select(*(getattr(ServiceRequest, name) for name in names)),
+        select(*(getattr(ServiceRequestArchive, name) for name in names)),
+    ).subquery('all_requests')
+
+
+def find_request(request_id):
+    """A request by id from the hot table, falling back to the archive"""
+    return db.session.get(ServiceRequest, request_id) or db.session.get(ServiceRequestArchive, request_id)
+
+
+def client_requests(client_id, since=None):
+    """Every request a client has made, active ones first, then history newest first"""
+    hot = ServiceRequest.query.filter(ServiceRequest.client_id == client_id)
+    cold = ServiceRequestArchive.query.filter(ServiceRequestArchive.client_id == client_id)
+    if since is not None:
+        hot = hot.filter(ServiceRequest.updated_at > since)
+        cold = cold.filter(ServiceRequestArchive.updated_at > since)
+    return hot.all() + cold.order_by(ServiceRequestArchive.created_at.desc()).all()
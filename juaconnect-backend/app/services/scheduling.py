@@ -0,0 +1,250 @@
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from threading import Lock
+from flask import current_app
+from sqlalchemy import or_, update
+from app import db
+from app.models import User, Booking, AvailabilitySlot
+from app.services.sharding import ShardLocal
+
+
+def parse_datetime(value):
+    """Parse an ISO 8601 string into a naive UTC datetime"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class ArtisanSchedule:
+    """Sorted, non-overlapping list of booked intervals for one artisan.
+    
+    Because double bookings are rejected, the intervals never overlap and a
+    single bisect on the start times finds the only two candidates for a conflict.
+    """
+    
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._intervals = []  # (start, end, booking_id), sorted by start
+        for start, end, booking_id in sorted(intervals):
+            self.add(start, end, booking_id)
+    
+    def conflict(self, start, end):
+        """Return the booking_id overlapping [start, end), or None"""
+        i = bisect_left(self._starts, start)
+        if i > 0 and self._intervals[i - 1][1] > start:
+            return self._intervals[i - 1][2]
+        if i < len(self._intervals) and self._intervals[i][0] < end:
+            return self._intervals[i][2]
+        return None
+    
+    def add(self, start, end, booking_id):
+        i = bisect_left(self._starts, start)
+        self._starts.insert(i, start)
+        self._intervals.insert(i, (start, end, booking_id))
+    
+    def remove(self, booking_id):
+        for i, interval in enumerate(self._intervals):
+            if interval[2] == booking_id:
+                del self._starts[i]
+                del self._intervals[i]
+                return
+    
+    def __len__(self):
+        return len(self._intervals)
+
+
+class ScheduleIndex:
+    """Per-process index of scheduled bookings keyed by artisan.
+    
+    Schedules are loaded lazily from the bookings table (one indexed query per
+    artisan), kept up to date by the booking routes once their transaction
+    commits, and reloaded after SCHEDULE_INDEX_REFRESH_SECONDS. It can lag
+    bookings made through another worker, so callers re-check the database.
+    """
+    
+    def __init__(self):
+        self._schedules = {}
+        self._loaded_at = {}
+        self._lock = Lock()
+    
+    def clear(self):
+        with self._lock:
+            self._schedules = {}
+            self._loaded_at = {}
+    
+    def _load(self, artisan_ids):
+        bookings = Booking.query.filter(
+            Booking.artisan_id.in_(artisan_ids),
+            Booking.status == 'scheduled',
+            Booking.end_date >= datetime.utcnow(),
+        ).all()
+        intervals = {artisan_id: [] for artisan_id in artisan_ids}
+        for booking in bookings:
+            intervals[booking.artisan_id].append((booking.start_date, booking.end_date, booking.id))
+        return {artisan_id: ArtisanSchedule(items) for artisan_id, items in intervals.items()}
+    
+    def get(self, artisan_id):
+        return self.get_many([artisan_id])[artisan_id]
+    
+    def get_many(self, artisan_ids):
+        expired = time.monotonic() - current_app.config['SCHEDULE_INDEX_REFRESH_SECONDS']
+        with self._lock:
+            missing = [a for a in artisan_ids if self._loaded_at.get(a, expired) <= expired]
+        if missing:
+            loaded = self._load(missing)
+            now = time.monotonic()
+            with self._lock:
+                self._schedules.update(loaded)
+                self._loaded_at.update(dict.fromkeys(loaded, now))
+        with self._lock:
+            return {a: self._schedules[a] for a in artisan_ids}
+    
+    def refresh(self, artisan_id):
+        schedule = self._load([artisan_id])[artisan_id]
+        with self._lock:
+            self._schedules[artisan_id] = schedule
+            self._loaded_at[artisan_id] = time.monotonic()
+        return schedule
+    
+    def conflict(self, artisan_id, start, end):
+        return self.get(artisan_id).conflict(start, end)
+    
+    def add(self, booking):
+        with self._lock:
+            schedule = self._schedules.get(booking.artisan_id)
+            if schedule is not None:
+                schedule.add(booking.start_date, booking.end_date, booking.id)
+    
+    def remove(self, bookings):
+        with self._lock:
+            for booking in bookings:
+                schedule = self._schedules.get(booking.artisan_id)
+                if schedule is not None:
+                    schedule.remove(booking.id)
+
+
+schedule_index = ShardLocal(ScheduleIndex)
+
+
+def find_free_artisans(service_category, start, end):
+    """Return verified artisans in a category with no booking overlapping [start, end).
+    
+    Artisans who have published weekly availability must also have a slot covering
+    the interval (checked in SQL for single-day intervals). Booking conflicts are
+    then a bisect per candidate against the schedule index, and the artisans it
+    shows as free are confirmed against the bookings table in one query, since
+    the index may not have seen another worker's bookings yet.
+    """
+    query = User.query.filter_by(user_type='artisan', is_verified=True)
+    if service_category:
+        query = query.filter(User.service_category.ilike(f'%{service_category}%'))
+    
+    if start.date() == end.date():
+        covering_slot = User.availability_slots.any(
+            (AvailabilitySlot.day_of_week == start.weekday()) &
+            (AvailabilitySlot.start_time <= start.time()) &
+            (AvailabilitySlot.end_time >= end.time())
+        )
+        query = query.filter(or_(~User.availability_slots.any(), covering_slot))
+    
+    candidates = query.all()
+    schedules = schedule_index.get_many([artisan.id for artisan in candidates])
+    free = [artisan for artisan in candidates if schedules[artisan.id].conflict(start, end) is None]
+    booked = booked_artisans([artisan.id for artisan in free], start, end)
+    return [artisan for artisan in free if artisan.id not in booked]
+
+
+def lock_artisans(artisan_ids):
+    """Serialize writes for these artisans (bookings, settlements) until the transaction ends.
+    
+    PostgreSQL locks the artisans' rows, in id order. SQLite has no row locks,
+    so a no-op update of the rows takes the database write lock, as BEGIN
+    IMMEDIATE would.
+    """
+    artisan_ids = sorted(set(artisan_ids))
+    if not artisan_ids:
+        return
+    if db.session.get_bind(mapper=User.__mapper__).dialect.name == 'sqlite':
+        db.session.execute(
+            update(User).where(User.id.in_(artisan_ids)).values(id=User.id),
+            execution_options={'synchronize_session': False},
+        )
+    else:
+        db.session.query(User.id).filter(User.id.in_(artisan_ids)).order_by(User.id).with_for_update().all()
+
+
+def _overlapping(start, end):
+    return (Booking.status == 'scheduled', Booking.start_date < end, Booking.end_date > start)
+
+
+def overlapping_booking(artisan_id, start, end):
+    """Id of a scheduled booking of the artisan overlapping [start, end) in the database, or None"""
+    return db.session.query(Booking.id).filter(
+        Booking.artisan_id == artisan_id, *_overlapping(start, end)
+    ).limit(1).scalar()
+
+
+def booked_artisans(artisan_ids, start, end):
+    """Ids of the artisans with a scheduled booking overlapping [start, end) in the database"""
+    if not artisan_ids:
+        return set()
+    rows = db.session.query(Booking.artisan_id).filter(
+        Booking.artisan_id.in_(artisan_ids), *_overlapping(start, end)
+    ).distinct()
+    return {artisan_id for artisan_id, in rows}
+
+
+def book_slot(service_request, start, end, total_amount=None):
+    """Create a scheduled booking for the request's artisan, or raise ScheduleConflict.
+    
+    The schedule index only pre-filters: a slot it shows as taken is re-read
+    before refusing, since another worker may have released it. The booking
+    itself is checked against the database while holding the artisan's lock,
+    so concurrent requests in any process cannot both take the slot.
+    """
+    artisan_id = service_request.artisan_id
+    if schedule_index.conflict(artisan_id, start, end) is not None:
+        conflicting_id = schedule_index.refresh(artisan_id).conflict(start, end)
+        if conflicting_id is not None:
+            raise ScheduleConflict(conflicting_id)
+    
+    lock_artisans([artisan_id])
+    conflicting_id = overlapping_booking(artisan_id, start, end)
+    if conflicting_id is not None:
+        raise ScheduleConflict(conflicting_id)
+    
+    booking = Booking(
+        request=service_request,
+        artisan_id=service_request.artisan_id,
+        start_date=start,
+        end_date=end,
+        total_amount=total_amount,
+        status='scheduled',
+    )
+    db.session.add(booking)
+    return booking
+
+
+def release_bookings(service_request, status):
+    """Move the request's scheduled bookings to status and return them.
+    
+    The caller drops them from the index with schedule_index.remove() once
+    the transaction commits, so a rollback leaves the index as it was.
+    """
+    released = [b for b in service_request.bookings if b.status == 'scheduled']
+    for booking in released:
+        booking.status = status
+    return released
+
+
+class ScheduleConflict(Exception):
+    """Raised when a booking would overlap an existing one"""
+    
+    def __init__(self, booking_id):
+        super().__init__(f'Artisan is already booked (booking {booking_id})')
+        self.booking_id = booking_id
@@ -0,0 +1,125 @@
+from sqlalchemy import UniqueConstraint, inspect, text
+from sqlalchemy.exc import DatabaseError
+from app import db
+from app.services.ratings import rebuild_aggregates
+from app.services.sharding import shard_router
+
+# Columns added since the first release that need values for existing rows, filled in once the
+# column exists. Each statement only touches rows that are still NULL, so reruns are harmless.
+BACKFILLS = {
+    ('bookings', 'artisan_id'): (
+        "UPDATE bookings SET artisan_id = (SELECT artisan_id FROM service_requests "
+        "WHERE service_requests.id = bookings.request_id) WHERE artisan_id IS NULL",
+    ),
+    ('reviews', 'artisan_id'): (
+        "UPDATE reviews SET artisan_id = (SELECT bookings.artisan_id FROM bookings "
+        "WHERE bookings.id = reviews.booking_id) WHERE artisan_id IS NULL",
+    ),
+    ('reviews', 'reviewer_name'): (
+        "UPDATE reviews SET reviewer_name = (SELECT username FROM users "
+        "WHERE users.id = reviews.reviewer_id) WHERE reviewer_name IS NULL",
+    ),
+    ('payments', 'client_id'): (
+        "UPDATE payments SET client_id = (SELECT COALESCE(service_requests.client_id, service_request_archive.client_id) "
+        "FROM bookings LEFT JOIN service_requests ON service_requests.id = bookings.request_id "
+        "LEFT JOIN service_request_archive ON service_request_archive.id = bookings.request_id "
+        "WHERE bookings.id = payments.booking_id) WHERE client_id IS NULL",
+    ),
+    ('notifications', 'updated_at'): (
+        "UPDATE notifications SET updated_at = created_at WHERE updated_at IS NULL",
+    ),
+}
+# Denormalized user columns that `rebuild_aggregates` recomputes once they are added
+AGGREGATE_COLUMNS = {('users', 'rating_sum'), ('users', 'rating_count'), ('users', 'completed_jobs')}
+
+
+def _column_ddl(column, dialect):
+    """ADD COLUMN clause for a model column; NOT NULL only with a server default, which old rows take"""
+    ddl = f'{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect)}'
+    if column.server_default is not None:
+        ddl += f' DEFAULT {column.server_default.arg}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    foreign_keys = list(column.foreign_keys)
+    if len(foreign_keys) == 1:
+        target = foreign_keys[0].column
+        ddl += f' REFERENCES {target.table.name} ({target.name})'
+    return ddl
+
+
+def _missing_indexes(table, names):
+    """CREATE INDEX callables for the table's indexes and named unique constraints not in names"""
+    for index in table.indexes:
+        if index.name not in names:
+            yield index.name, index.create
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in names:
+            columns = ', '.join(column.name for column in constraint.columns)
+            statement = text(f'CREATE UNIQUE INDEX {constraint.name} ON {table.name} ({columns})')
+            yield constraint.name, lambda engine, statement=statement: _execute(engine, statement)
+
+
+def _execute(engine, statement):
+    with engine.begin() as conn:
+        conn.execute(statement)
+
+
+def upgrade_engine(engine, tables):
+    """Add the model columns and indexes missing from existing tables of one database.
+    
+    create_all() only creates missing tables, so databases made by an earlier
+    release lack every column added since. Returns (added columns, messages).
+    """
+    added, messages = [], []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing = set(inspector.get_table_names())
+        for table in tables:
+            if table.name not in existing:
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column, engine.dialect)}'))
+                    added.append((table.name, column.name))
+    
+    with engine.begin() as conn:
+        for key in added:
+            for statement in BACKFILLS.get(key, ()):
+                conn.execute(text(statement))
+    
+    inspector = inspect(engine)
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue
+        names = {index['name'] for index in inspector.get_indexes(table.name)}
+        names |= {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+        for name, create in _missing_indexes(table, names):
+            try:
+                create(engine)
+            except DatabaseError as e:
+                # Typically duplicate rows left from before a unique constraint existed
+                messages.append(f'Could not create {name} on {table.name}: {e.orig}')
+    return added, messages
+
+
+def upgrade_schema(app=None):
+    """Bring the primary and every shard up to the current models. Run after db.create_all()."""
+    tables = db.metadata.sorted_tables
+    if not shard_router.enabled(app):
+        engines = [(None, db.engine, tables)]
+    else:
+        # The primary only holds the global tables, each shard everything else
+        engines = [(None, db.engine, [table for table in tables if table.info.get('global')])]
+        sharded = [table for table in tables if not table.info.get('global')]
+        engines += [(region, db.engines[f'shard_{region}'], sharded) for region in shard_router.regions(app)]
+    
+    added, messages = [], []
+    for region, engine, engine_tables in engines:
+        columns, notes = upgrade_engine(engine, engine_tables)
+        added += columns
+        messages += notes
+        if AGGREGATE_COLUMNS & set(columns):
+            with shard_router.use_shard(region):
+                rebuild_aggregates()
+    return added, messages
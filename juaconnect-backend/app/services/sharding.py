@@ -0,0 +1,203 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+import click
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
+from sqlalchemy.exc import IntegrityError
+
+
+class ShardNotSelected(RuntimeError):
+    pass
+
+
+class ShardRouter:
+    """Region-sharded mode, on when SHARD_DATABASE_URLS is set.
+    
+    Users, requests, bookings, notifications and everything hanging off them
+    live in their home region's database. A request is routed to the region in
+    the caller's token, else to the artisan it names, else to its ?region= or
+    the region in its ?location=. Tables marked info={'global': True} (the user
+    directory) stay in DATABASE_URL. Cross-region reads go through gather().
+    """
+    
+    def init_app(self, app):
+        app.before_request(self.route_request)
+    
+    def enabled(self, app=None):
+        return bool((app or current_app).config['SHARD_DATABASE_URLS'])
+    
+    def regions(self, app=None):
+        return list((app or current_app).config['SHARD_DATABASE_URLS'])
+    
+    def region_for(self, location):
+        """The shard whose region name appears in location, else SHARD_DEFAULT_REGION"""
+        text = (location or '').lower()
+        for region in self.regions():
+            if region.lower() in text:
+                return region
+        return current_app.config['SHARD_DEFAULT_REGION']
+    
+    def requested_region(self):
+        """Region named by ?region= or ?location=, or None"""
+        if request.args.get('region') in self.regions():
+            return request.args['region']
+        if request.args.get('location'):
+            return self.region_for(request.args['location'])
+        return None
+    
+    def route_request(self):
+        if not self.enabled():
+            return None
+        g.shard = self._token_region()
+        if g.shard is None and request.view_args and 'artisan_id' in request.view_args:
+            g.shard = self.home_region(user_id=request.view_args['artisan_id'])
+        if g.shard is None:
+            g.shard = self.requested_region()
+        return None
+    
+    def _token_region(self):
+        if not request.headers.get('Authorization'):
+            return None
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt().get('region')
+        except Exception:
+            return None
+    
+    def engine_for(self, db, mapper=None, clause=None):
+        """The current shard's engine for a statement, or None for global tables and unsharded mode"""
+        if not has_app_context() or not self.enabled():
+            return None
+        table = mapper.persist_selectable if mapper is not None else getattr(clause, 'table', None)
+        if table is not None and table.info.get('global'):
+            return None
+        region = g.get('shard')
+        if region is None:
+            raise ShardNotSelected('No shard selected for this query; use shard_router.gather() or select_shard()')
+        return db.engines[f'shard_{region}']
+    
+    def select_shard(self, region):
+        g.shard = region
+    
+    @contextmanager
+    def use_shard(self, region):
+        previous = g.get('shard')
+        g.shard = region
+        try:
+            yield region
+        finally:
+            g.shard = previous
+    
+    def gather(self, func, region=None):
+        """Run func on one region's shard, or on every shard in parallel when region is None.
+        
+        Returns the list of results, one per shard. Each shard runs in its own
+        app context and session, so func must return plain data, not ORM objects.
+        Inside a request the shards are queried in parallel threads with a bare
+        app context, not a copy of the request context: func can't read request,
+        so the caller passes request data in. Unsharded, func just runs once.
+        """
+        if not self.enabled():
+            return [func()]
+        if region is not None:
+            with self.use_shard(region):
+                return [func()]
+        
+        from app import db
+        regions = self.regions()
+        if not has_request_context():
+            results = []
+            for each in regions:
+                with self.use_shard(each):
+                    results.append(func())
+                db.session.remove()
+            return results
+        
+        # A copied request context would run the request's teardown (and release
+        # its admission slots) when the first thread finishes
+        app = current_app._get_current_object()
+        
+        def run(each):
+            with app.app_context():
+                g.shard = each
+                try:
+                    return func()
+                finally:
+                    db.session.remove()
+        with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+            return list(pool.map(run, regions))
+    
+    def token_claims(self):
+        """Extra JWT claims: the caller's home region, so later requests route without a lookup"""
+        return {'region': g.shard} if self.enabled() else {}
+    
+    def home_region(self, user_id=None, email=None):
+        from app.models import UserDirectory
+        query = UserDirectory.query
+        entry = query.get(user_id) if user_id is not None else query.filter_by(email=email).first()
+        return entry.region if entry else None
+    
+    def claim_user_id(self, email, username, region):
+        """Reserve a globally unique user id in the directory, or None if the email or username is taken"""
+        from app import db
+        from app.models import UserDirectory
+        entry = UserDirectory(email=email, username=username, region=region)
+        db.session.add(entry)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return None
+        return entry.id
+    
+    def release_user_id(self, user_id):
+        from app import db
+        from app.models import UserDirectory
+        db.session.rollback()
+        UserDirectory.query.filter_by(id=user_id).delete()
+        db.session.commit()
+    
+    def create_tables(self, db, app=None):
+        """Create the sharded tables in every shard database"""
+        tables = [table for table in db.metadata.sorted_tables if not table.info.get('global')]
+        for region in self.regions(app):
+            db.metadata.create_all(db.engines[f'shard_{region}'], tables=tables)
+
+
+class ShardLocal:
+    """One instance of a per-process cache per shard; attribute access goes to the current shard's"""
+    
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+    
+    def current(self):
+        region = g.get('shard') if has_app_context() else None
+        with self._lock:
+            if region not in self._instances:
+                self._instances[region] = self._factory()
+            return self._instances[region]
+    
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+
+def each_shard(command):
+    """Run a maintenance command once per shard in sharded mode"""
+    @wraps(command)
+    def wrapper(*args, **kwargs):
+        if not shard_router.enabled():
+            return command(*args, **kwargs)
+        from app import db
+        for region in shard_router.regions():
+            click.echo(f'[{region}]')
+            with shard_router.use_shard(region):
+                command(*args, **kwargs)
+            db.session.remove()
+    return wrapper
+
+
+shard_router = ShardRouter()
@@ -0,0 +1,126 @@
+from sqlalchemy import func, update
+from app import db
+from app.models import ArtisanStats, Booking, Payment, Notification, User
+from app.services.retention import all_requests
+
+STATUS_COLUMNS = {
+    'pending': 'pending_count',
+    'accepted': 'accepted_count',
+    'in_progress': 'in_progress_count',
+    'completed': 'completed_count',
+    'cancelled': 'cancelled_count',
+}
+
+
+def _increment(user_id, **deltas):
+    """Atomically add deltas to a stats row. Returns False if the row does not exist."""
+    values = {name: getattr(ArtisanStats, name) + delta for name, delta in deltas.items() if delta}
+    if not values:
+        return True
+    result = db.session.execute(
+        update(ArtisanStats).where(ArtisanStats.user_id == user_id).values(**values),
+        execution_options={'synchronize_session': False},
+    )
+    return result.rowcount > 0
+
+
+def record_transition(artisan_id, old_status, new_status):
+    """Move one request between status counters.
+    
+    Pass None for old_status when the request was not counted for this artisan
+    before (newly assigned), and None for new_status when it stops belonging to them.
+    """
+    if artisan_id is None or old_status == new_status:
+        return
+    deltas = {}
+    if old_status in STATUS_COLUMNS:
+        deltas[STATUS_COLUMNS[old_status]] = -1
+    if new_status in STATUS_COLUMNS:
+        deltas[STATUS_COLUMNS[new_status]] = deltas.get(STATUS_COLUMNS[new_status], 0) + 1
+    if not _increment(artisan_id, **deltas):
+        rebuild_stats([artisan_id])
+
+
+def add_earnings(artisan_id, amount=0.0, paid=0.0):
+    if artisan_id is not None and not _increment(artisan_id, earnings_total=amount or 0.0, paid_total=paid or 0.0):
+        rebuild_stats([artisan_id])
+
+
+def adjust_unread(user_ids, delta):
+    """Change unread counters; users without a stats row (clients) are ignored"""
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    if user_ids and delta:
+        db.session.execute(
+            update(ArtisanStats).where(ArtisanStats.user_id.in_(user_ids)).values(
+                unread_notifications=ArtisanStats.unread_notifications + delta
+            ),
+            execution_options={'synchronize_session': False},
+        )
+
+
+def reset_unread(user_id):
+    db.session.execute(
+        update(ArtisanStats).where(ArtisanStats.user_id == user_id).values(unread_notifications=0),
+        execution_options={'synchronize_session': False},
+    )
+
+
+def create_stats(artisan_id):
+    """Add an empty stats row for a new artisan"""
+    db.session.add(ArtisanStats(user_id=artisan_id))
+
+
+def get_stats(artisan_id):
+    stats = db.session.get(ArtisanStats, artisan_id)
+    if stats is None:
+        rebuild_stats([artisan_id])
+        db.session.commit()
+        stats = db.session.get(ArtisanStats, artisan_id)
+    return stats
+
+
+def rebuild_stats(artisan_ids=None):
+    """Recompute stats rows from source tables, for all artisans or the given ids"""
+    db.session.flush()
+    if artisan_ids is None:
+        artisan_ids = [user_id for (user_id,) in db.session.query(User.id).filter_by(user_type='artisan')]
+    if not artisan_ids:
+        return 0
+    
+    rows = {artisan_id: {'user_id': artisan_id} for artisan_id in artisan_ids}
+    
+    requests = all_requests('id', 'artisan_id', 'status')
+    counts = db.session.query(
+        requests.c.artisan_id, requests.c.status, func.count(requests.c.id)
+    ).filter(requests.c.artisan_id.in_(artisan_ids)).group_by(requests.c.artisan_id, requests.c.status)
+    for artisan_id, status, count in counts:
+        if status in STATUS_COLUMNS:
+            rows[artisan_id][STATUS_COLUMNS[status]] = count
+    
+    earnings = db.session.query(Booking.artisan_id, func.sum(Booking.total_amount)).filter(
+        Booking.artisan_id.in_(artisan_ids), Booking.status == 'completed'
+    ).group_by(Booking.artisan_id)
+    for artisan_id, total in earnings:
+        rows[artisan_id]['earnings_total'] = float(total or 0)
+    
+    paid = db.session.query(Booking.artisan_id, func.sum(Payment.amount)).join(
+        Booking, Booking.id == Payment.booking_id
+    ).filter(Booking.artisan_id.in_(artisan_ids), Payment.status == 'completed').group_by(Booking.artisan_id)
+    for artisan_id, total in paid:
+        rows[artisan_id]['paid_total'] = float(total or 0)
+    
+    unread = db.session.query(Notification.user_id, func.count(Notification.id)).filter(
+        Notification.user_id.in_(artisan_ids), Notification.is_read == False  # noqa: E712
+    ).group_by(Notification.user_id)
+    for user_id, count in unread:
+        rows[user_id]['unread_notifications'] = count
+    
+    columns = list(STATUS_COLUMNS.values()) + ['earnings_total', 'paid_total', 'unread_notifications']
+    for row in rows.values():
+        stats = db.session.get(ArtisanStats, row['user_id']) or ArtisanStats(user_id=row['user_id'])
+        for column in columns:
+            setattr(stats, column, row.get(column, 0))
+        db.session.add(stats)
+    db.session.flush()
+    return len(rows)
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from flask import current_app, request
+from app import db
+from app.models import FeedTombstone
+from app.services.replicas import replica_fresh_at
+
+# Tombstones of feeds every user sees (the open request pool) are stored under this user_id
+SHARED_FEED = 0
+
+
+class WatermarkExpired(Exception):
+    """Raised for a ?since= older than the tombstones kept; the client must fetch the full feed (410)"""
+
+
+def max_watermark_age():
+    return timedelta(days=current_app.config['SYNC_MAX_WATERMARK_AGE_DAYS'])
+
+
+def parse_since():
+    """Read the ?since= watermark. Returns None for a full fetch.
+    
+    Raises ValueError if it is malformed and WatermarkExpired if removals since
+    then may already have been pruned.
+    """
+    since = request.args.get('since')
+    if not since:
+        return None
+    since = datetime.fromisoformat(since)
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    if since < datetime.utcnow() - max_watermark_age():
+        raise WatermarkExpired(since)
+    return since
+
+
+def next_watermark():
+    """Watermark to hand back to the client, taken before the feed query runs.
+    
+    It lags the clock by SYNC_WATERMARK_LAG_SECONDS, so a transaction that
+    commits with a slightly older updated_at is picked up on the next poll.
+    Clients may see a row twice and must upsert by id. On a replica the clock
+    is the replica's heartbeat, since later primary writes are not there yet.
+    """
+    lag = timedelta(seconds=current_app.config['SYNC_WATERMARK_LAG_SECONDS'])
+    now = datetime.utcnow()
+    fresh_at = replica_fresh_at()
+    if fresh_at is not None:
+        now = min(now, datetime.utcfromtimestamp(fresh_at))
+    return (now - lag).isoformat()
+
+
+def record_tombstone(feed, user_id, entity_id):
+    """Add a tombstone to the current transaction"""
+    db.session.add(FeedTombstone(feed=feed, user_id=user_id, entity_id=entity_id))
+
+
+def prune_tombstones():
+    """Delete tombstones older than SYNC_MAX_WATERMARK_AGE_DAYS; returns how many"""
+    cutoff = datetime.utcnow() - max_watermark_age()
+    count = FeedTombstone.query.filter(FeedTombstone.removed_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def tombstones_since(feed, user_id, since):
+    rows = db.session.query(FeedTombstone.entity_id).filter(
+        FeedTombstone.feed == feed,
+        FeedTombstone.user_id == user_id,
+        FeedTombstone.removed_at > since,
+    )
+    return [entity_id for (entity_id,) in rows]
+
+
+def delta_response(rows, in_feed, watermark, removed=()):
+    """Split rows changed since the watermark into upserts and removals"""
+    removed = set(removed)
+    changed = []
+    for row in rows:
+        if in_feed(row):
+            changed.append(row.to_dict())
+        else:
+            removed.add(row.id)
+    return {
+        'success': True,
+        'data': changed,
+        'removed': sorted(removed),
+        'watermark': watermark,
+    }
@@ -0,0 +1,24 @@
+from flask import g, has_app_context
+from flask_jwt_extended import JWTManager
+
+
+class RequestJWTManager(JWTManager):
+    """JWTManager that decodes each token once per app context.
+    
+    Batch sub-requests run inside the outer request's app context and share its
+    g, so the caller's token is verified once per batch rather than again by
+    every sub-request's @jwt_required and rate-limit check.
+    """
+    
+    # Overrides a private JWTManager method that every token decode goes through
+    # (checked against Flask-JWT-Extended 4.5.3, pinned in requirements.txt).
+    # Re-check its signature and callers before upgrading the pin.
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if not has_app_context():
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        decoded = g.setdefault('decoded_tokens', {})
+        key = (encoded_token, csrf_value, allow_expired)
+        if key not in decoded:
+            # Only valid tokens are kept: a bad one raises before this assignment
+            decoded[key] = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        return decoded[key]
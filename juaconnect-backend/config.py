@@ -10,6 +10,149 @@ class Config:
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', secrets.token_hex(32))
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=30)
     JSON_SORT_KEYS = False
+    
+    # Run db.create_all() in create_app; production schemas are managed with `flask init-db`/migrations
+    CREATE_TABLES = os.getenv('CREATE_TABLES', 'true').lower() == 'true'
+    
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto are trusted (werkzeug ProxyFix);
+    # the client IP, which rate limits are keyed on, is the one the outermost of them saw
+    PROXY_HOPS = int(os.getenv('PROXY_HOPS', 0))
+    
+    # Scheduling: an artisan's indexed bookings are reloaded after SCHEDULE_INDEX_REFRESH_SECONDS
+    # to pick up other workers' bookings and cancellations
+    DEFAULT_BOOKING_HOURS = int(os.getenv('DEFAULT_BOOKING_HOURS', 2))
+    SCHEDULE_INDEX_REFRESH_SECONDS = int(os.getenv('SCHEDULE_INDEX_REFRESH_SECONDS', 60))
+    
+    # Ratings: Bayesian average pulls artisans with few reviews towards the prior
+    RATING_PRIOR_MEAN = float(os.getenv('RATING_PRIOR_MEAN', 3.5))
+    RATING_PRIOR_WEIGHT = float(os.getenv('RATING_PRIOR_WEIGHT', 5))
+    
+    # Recommendations: feature table refresh interval and score weights
+    RECOMMENDATION_REFRESH_SECONDS = int(os.getenv('RECOMMENDATION_REFRESH_SECONDS', 300))
+    RECOMMENDATION_WEIGHTS = {
+        'category': 3.0,
+        'distance': 2.0,
+        'rating': 1.5,
+        'completion': 1.0,
+        'price': 1.0,
+        'workload': 0.5,
+    }
+    
+    # Dispatch: fan-out of new requests to matching artisans
+    DISPATCH_ENABLED = os.getenv('DISPATCH_ENABLED', 'true').lower() == 'true'
+    DISPATCH_INDEX_REFRESH_SECONDS = int(os.getenv('DISPATCH_INDEX_REFRESH_SECONDS', 300))
+    # Batch dispatch: every ASSIGNMENT_INTERVAL_SECONDS, match open requests to free artisans and
+    # 'propose' (notify the artisan) or 'assign' them; 'off' leaves matching first-come
+    ASSIGNMENT_MODE = os.getenv('ASSIGNMENT_MODE', 'off')
+    ASSIGNMENT_INTERVAL_SECONDS = int(os.getenv('ASSIGNMENT_INTERVAL_SECONDS', 60))
+    ASSIGNMENT_MAX_REQUESTS = int(os.getenv('ASSIGNMENT_MAX_REQUESTS', 3000))
+    ASSIGNMENT_MAX_ACTIVE = int(os.getenv('ASSIGNMENT_MAX_ACTIVE', 3))
+    ASSIGNMENT_MIN_SCORE = float(os.getenv('ASSIGNMENT_MIN_SCORE', 4.0))
+    
+    # Delta sync: watermarks are moved back by this much so rows committed late are not missed.
+    # Tombstones are kept for SYNC_MAX_WATERMARK_AGE_DAYS; an older ?since= gets 410 and a full fetch
+    SYNC_WATERMARK_LAG_SECONDS = int(os.getenv('SYNC_WATERMARK_LAG_SECONDS', 5))
+    SYNC_MAX_WATERMARK_AGE_DAYS = int(os.getenv('SYNC_MAX_WATERMARK_AGE_DAYS', 30))
+    
+    # Batch endpoint
+    BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+    
+    # Payments: the stub provider and unsigned callbacks are refused outside development and testing
+    PAYMENT_PROVIDER = os.getenv('PAYMENT_PROVIDER', 'stub')
+    PAYMENT_CALLBACK_SECRET = os.getenv('PAYMENT_CALLBACK_SECRET')
+    PAYMENT_SETTLEMENT_BATCH_SIZE = int(os.getenv('PAYMENT_SETTLEMENT_BATCH_SIZE', 1000))
+    
+    # Background jobs: persistent SQLite queue shared by all processes on the host
+    JOBS_ASYNC = True
+    JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'jobs.sqlite3')
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    JOB_BACKOFF_SECONDS = float(os.getenv('JOB_BACKOFF_SECONDS', 2))
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))
+    JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 1))
+    
+    # ASGI mode (asgi.py): async engine URL (derived from DATABASE_URL if unset) and long-poll limits
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+    LONG_POLL_MAX_SECONDS = int(os.getenv('LONG_POLL_MAX_SECONDS', 30))
+    NOTIFICATION_POLL_SECONDS = float(os.getenv('NOTIFICATION_POLL_SECONDS', 1))
+    
+    # Notification retention: read notifications older than RETENTION_DAYS, or beyond a user's
+    # newest HOT_LIMIT, are compacted into notification_archives by `flask compact-notifications`
+    NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', 30))
+    NOTIFICATION_HOT_LIMIT = int(os.getenv('NOTIFICATION_HOT_LIMIT', 200))
+    NOTIFICATION_ARCHIVE_CHUNK = int(os.getenv('NOTIFICATION_ARCHIVE_CHUNK', 500))
+    
+    # Request retention: completed/cancelled requests untouched for RETENTION_DAYS move to
+    # service_request_archive, from `flask compact-requests` or the compactor job `flask run-jobs` schedules
+    REQUEST_RETENTION_DAYS = int(os.getenv('REQUEST_RETENTION_DAYS', 90))
+    REQUEST_ARCHIVE_BATCH = int(os.getenv('REQUEST_ARCHIVE_BATCH', 1000))
+    REQUEST_COMPACT_INTERVAL_SECONDS = int(os.getenv('REQUEST_COMPACT_INTERVAL_SECONDS', 3600))
+    
+    # Price estimates: histograms of completed job prices on PRICE_BINS log-spaced bins between
+    # PRICE_MIN and PRICE_MAX, rebuilt every PRICE_REFRESH_SECONDS to pick up other workers' jobs
+    PRICE_MIN = float(os.getenv('PRICE_MIN', 100))
+    PRICE_MAX = float(os.getenv('PRICE_MAX', 1000000))
+    PRICE_BINS = int(os.getenv('PRICE_BINS', 120))
+    PRICE_MIN_SAMPLES = int(os.getenv('PRICE_MIN_SAMPLES', 5))
+    PRICE_REFRESH_SECONDS = int(os.getenv('PRICE_REFRESH_SECONDS', 3600))
+    
+    # Duplicate requests: a pending request from the same client (and artisan) and area whose MinHash
+    # similarity is at least DEDUPE_SIMILARITY within DEDUPE_WINDOW_SECONDS is returned instead
+    DEDUPE_ENABLED = os.getenv('DEDUPE_ENABLED', 'true').lower() == 'true'
+    DEDUPE_WINDOW_SECONDS = int(os.getenv('DEDUPE_WINDOW_SECONDS', 900))
+    DEDUPE_SIMILARITY = float(os.getenv('DEDUPE_SIMILARITY', 0.8))
+    DEDUPE_BANDS = int(os.getenv('DEDUPE_BANDS', 16))
+    DEDUPE_ROWS = int(os.getenv('DEDUPE_ROWS', 4))
+    DEDUPE_WARM_LIMIT = int(os.getenv('DEDUPE_WARM_LIMIT', 10000))
+    
+    # Analytics: hourly demand/earnings rollups, reported to requests carrying X-Analytics-Key
+    ANALYTICS_API_KEY = os.getenv('ANALYTICS_API_KEY')
+    ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', 93))
+    
+    # Read replicas: comma-separated URLs, used by @replica_read views while their heartbeat
+    # (stamped on the primary by `flask replica-heartbeat`) is at most REPLICA_MAX_LAG_SECONDS old
+    REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv('REPLICA_DATABASE_URLS', '').split(',') if url.strip()]
+    REPLICA_BINDS = [f'replica{i}' for i in range(len(REPLICA_DATABASE_URLS))]
+    SQLALCHEMY_BINDS = dict(zip(REPLICA_BINDS, REPLICA_DATABASE_URLS))
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_CHECK_SECONDS = float(os.getenv('REPLICA_CHECK_SECONDS', 1))
+    REPLICA_HEARTBEAT_SECONDS = float(os.getenv('REPLICA_HEARTBEAT_SECONDS', 1))
+    
+    # Region sharding: "region=url,region=url". Users, requests, bookings and notifications live in
+    # their home region's database; DATABASE_URL then only holds the user directory
+    SHARD_DATABASE_URLS = dict(
+        item.strip().split('=', 1) for item in os.getenv('SHARD_DATABASE_URLS', '').split(',') if item.strip()
+    )
+    SHARD_DEFAULT_REGION = os.getenv('SHARD_DEFAULT_REGION') or next(iter(SHARD_DATABASE_URLS), None)
+    SQLALCHEMY_BINDS.update({f'shard_{region}': url for region, url in SHARD_DATABASE_URLS.items()})
+    
+    # Rate limiting: token buckets per IP and per user ('memory' per worker, 'sqlite' shared on the host)
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', 'ratelimit.sqlite3')
+    RATE_LIMIT_IP_BURST = float(os.getenv('RATE_LIMIT_IP_BURST', 60))
+    RATE_LIMIT_IP_PER_SECOND = float(os.getenv('RATE_LIMIT_IP_PER_SECOND', 2))
+    RATE_LIMIT_USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', 120))
+    RATE_LIMIT_USER_PER_SECOND = float(os.getenv('RATE_LIMIT_USER_PER_SECOND', 4))
+    # Tokens per request by endpoint; 0 exempts it (payment provider callbacks)
+    RATE_LIMIT_COSTS = {
+        'default': 1,
+        'auth.signin': 10,
+        'auth.signup': 10,
+        'artisan.search_artisans': 3,
+        'artisan.get_all_artisans': 3,
+        'artisan.get_free_artisans': 3,
+        'client.get_recommendations': 5,
+        'analytics.get_demand': 3,
+        'analytics.get_earnings': 3,
+        'payment.payment_callback': 0,
+    }
+    # In-flight requests per process before new ones are shed with 503
+    MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 64))
+    CONCURRENCY_LIMITS = {
+        'auth.signin': 4,
+        'auth.signup': 4,
+    }
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -20,8 +163,15 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    JOBS_ASYNC = False
+    RATE_LIMIT_ENABLED = False
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    # No stub default: payments stay off until a real provider and PAYMENT_CALLBACK_SECRET are set
+    PAYMENT_PROVIDER = os.getenv('PAYMENT_PROVIDER')
+    CREATE_TABLES = os.getenv('CREATE_TABLES', 'false').lower() == 'true'
+    # Deployed behind the platform's router (Render/Heroku), which appends the caller to X-Forwarded-For
+    PROXY_HOPS = int(os.getenv('PROXY_HOPS', 1))
@@ -0,0 +1,24 @@
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+# Threads per worker (gthread); the run.py store is thread-safe, so one worker with
+# several threads can replace extra processes that would each hold their own copy
+threads = int(os.getenv('WEB_THREADS', 1))
+# Only one process can own a run.py MEMSTORE_DATA_DIR (the others would refuse every write),
+# so a durable run.py store always gets a single worker; scale it with WEB_THREADS instead
+if os.getenv('MEMSTORE_DATA_DIR'):
+    workers = 1
+
+# Import the app once in the master; workers fork from it copy-on-write
+# instead of each re-importing Flask, SQLAlchemy and the models.
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Drop pooled database connections inherited from the master"""
+    app = server.app.wsgi()
+    if 'sqlalchemy' in getattr(app, 'extensions', {}):
+        with app.app_context():
+            for engine in app.extensions['sqlalchemy'].engines.values():
+                engine.dispose(close=False)
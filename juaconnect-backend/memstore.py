@@ -0,0 +1,537 @@
+"""Compact in-memory store used by run.py.
+
+Records are __slots__ objects instead of dicts, so key names are not repeated
+per row. Timestamps are stored as epoch floats, repeated values such as status
+and category are interned, and related users are referenced by ID and only
+joined in when a record is serialized.
+
+With a data directory the store is durable: every mutation is appended to a
+log that is fsynced in batches, and the log is periodically folded into a
+snapshot. Startup loads the snapshot through mmap and replays the log tail.
+
+The store is safe to share between threads. Records are never changed in
+place: an update builds a new version and swaps it into the table under a
+per-record stripe lock, so readers always see a whole version of a record and
+list endpoints can work on a cheap point-in-time copy of a table.
+"""
+import atexit
+from contextlib import contextmanager
+import fcntl
+import gc
+import glob
+import marshal
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+def now():
+    return time.time()
+
+
+def isoformat(timestamp):
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    """Base for slot-based records; FIELDS order is also the serialized tuple order"""
+    __slots__ = ()
+    FIELDS = ()
+    TIMESTAMPS = ()
+    INTERNED = ()
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Slot descriptors' setters, used to rebuild records quickly on recovery
+        cls._SETTERS = tuple(getattr(cls, name).__set__ for name in cls.FIELDS)
+    
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            self._set(name, fields.get(name))
+    
+    def _set(self, name, value):
+        setattr(self, name, intern(value) if name in self.INTERNED else value)
+    
+    def update(self, **changes):
+        for name, value in changes.items():
+            self._set(name, value)
+    
+    def replace(self, **changes):
+        """New version of this record with changes applied"""
+        record = self.from_tuple(self.to_tuple())
+        record.update(**changes)
+        return record
+    
+    def to_tuple(self):
+        return tuple(getattr(self, name) for name in self.FIELDS)
+    
+    @classmethod
+    def from_tuple(cls, values):
+        """Rebuild a record from to_tuple(); marshal keeps interned strings interned"""
+        record = cls.__new__(cls)
+        for setter, value in zip(cls._SETTERS, values):
+            setter(record, value)
+        return record
+    
+    def to_dict(self):
+        return {
+            name: isoformat(getattr(self, name)) if name in self.TIMESTAMPS else getattr(self, name)
+            for name in self.FIELDS
+        }
+
+
+class User(Record):
+    KIND = 'user'
+    TABLE = 'users'
+    FIELDS = __slots__ = (
+        'id', 'username', 'email', 'user_type', 'phone', 'location', 'service_category',
+        'experience_years', 'bio', 'created_at',
+    )
+    TIMESTAMPS = ('created_at',)
+    INTERNED = ('user_type', 'service_category')
+    PROFILE_FIELDS = ('phone', 'location', 'bio', 'service_category', 'experience_years')
+
+
+class ServiceRequest(Record):
+    KIND = 'request'
+    TABLE = 'requests'
+    FIELDS = __slots__ = (
+        'id', 'client_id', 'artisan_id', 'service_category', 'description', 'status', 'location',
+        'budget', 'created_at', 'updated_at',
+    )
+    TIMESTAMPS = ('created_at', 'updated_at')
+    INTERNED = ('service_category', 'status')
+
+
+class WorkBooking(Record):
+    """Booking opened when an artisan starts work on a service request"""
+    KIND = 'work_booking'
+    TABLE = 'bookings'
+    FIELDS = __slots__ = ('id', 'request_id', 'start_date', 'end_date', 'total_amount', 'status', 'created_at')
+    TIMESTAMPS = ('start_date', 'end_date', 'created_at')
+    INTERNED = ('status',)
+    client_id = artisan_id = None
+
+
+class DirectBooking(Record):
+    """Booking made by a client directly with an artisan"""
+    KIND = 'direct_booking'
+    TABLE = 'bookings'
+    FIELDS = __slots__ = (
+        'id', 'client_id', 'artisan_id', 'service_category', 'description', 'location', 'budget',
+        'scheduled_date', 'status', 'created_at', 'updated_at',
+    )
+    TIMESTAMPS = ('created_at', 'updated_at')
+    INTERNED = ('service_category', 'status')
+    request_id = None
+
+
+class StoreReadOnly(RuntimeError):
+    """Raised before a write when another process owns the data directory"""
+
+
+RECORD_TYPES = {cls.KIND: cls for cls in (User, ServiceRequest, WorkBooking, DirectBooking)}
+ID_COUNTERS = {'users': 'user', 'requests': 'request', 'bookings': 'booking'}
+
+
+class Journal:
+    """Append-only mutation log and snapshots in data_dir.
+    
+    Log entries are length-prefixed marshal tuples (kind, record fields); the
+    latest entry for an ID wins on replay. Appends only hit the page cache; a
+    background thread fsyncs every fsync_interval seconds, so a crash loses at
+    most that window. Each snapshot starts a new log generation, and logs older
+    than the current snapshot are deleted once it is safely on disk.
+    """
+    
+    MAGIC = b'JCSNAP1' + bytes([marshal.version])
+    HEADER = struct.Struct('<I')
+    
+    def __init__(self, data_dir, fsync_interval=0.05, snapshot_every=500000):
+        self.data_dir = data_dir
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.generation = 0
+        self.appended = 0
+        self._file = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        
+        os.makedirs(data_dir, exist_ok=True)
+        self._lockfile = None
+        self._owner_error = self._acquire_directory()
+        if self._owner_error:
+            raise StoreReadOnly(self._owner_error)
+        # gunicorn --preload loads the store in the master and forks workers from it
+        os.register_at_fork(before=self._before_fork, after_in_child=self._after_fork_in_child)
+    
+    def _acquire_directory(self):
+        """Lock data_dir for this process; a second writer would interleave log entries"""
+        self._lockfile = open(os.path.join(self.data_dir, 'lock'), 'w')
+        try:
+            fcntl.flock(self._lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return f'{self.data_dir} is in use by another process; run a single worker per data directory'
+        return None
+    
+    def _before_fork(self):
+        self.sync()
+        if self._lockfile:
+            fcntl.flock(self._lockfile, fcntl.LOCK_UN)
+    
+    def _after_fork_in_child(self):
+        # The first forked worker takes over the log; any other one refuses writes with
+        # StoreReadOnly before touching its tables (gunicorn.conf.py runs one worker per data dir)
+        if self._lockfile is None:
+            return  # Closed before the fork
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._owner_error = self._acquire_directory()
+        if not self._owner_error and self._file:
+            threading.Thread(target=self._flush_loop, daemon=True, name='memstore-fsync').start()
+    
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.data_dir, 'snapshot')
+    
+    def log_path(self, generation):
+        return os.path.join(self.data_dir, f'log.{generation:08d}')
+    
+    def _log_generations(self):
+        return sorted(int(path.rsplit('.', 1)[1]) for path in glob.glob(os.path.join(self.data_dir, 'log.*')))
+    
+    # Recovery
+    
+    def load(self, store):
+        """Fill store from the snapshot and the logs written after it, then open a fresh log"""
+        # Millions of new objects would trigger many pointless collections; the loaded
+        # records are long-lived, so they are moved out of the collector's view afterwards
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._load(store)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        gc.freeze()
+        threading.Thread(target=self._flush_loop, daemon=True, name='memstore-fsync').start()
+    
+    def _load(self, store):
+        snapshot_generation = 0
+        if os.path.exists(self.snapshot_path) and os.path.getsize(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(self.MAGIC)] != self.MAGIC:
+                    raise RuntimeError(f'{self.snapshot_path} was written by an incompatible version')
+                view = memoryview(data)
+                try:
+                    snapshot_generation, counters, rows = marshal.loads(view[len(self.MAGIC):])
+                finally:
+                    view.release()
+            store._counters.update(counters)
+            store._restore_rows(rows)
+        
+        generations = [g for g in self._log_generations() if g >= snapshot_generation]
+        for generation in generations:
+            self._replay(self.log_path(generation), store)
+        self._delete_logs_before(snapshot_generation)
+        
+        self.generation = max([snapshot_generation] + generations) + 1
+        self._file = open(self.log_path(self.generation), 'ab')
+    
+    def _replay(self, path, store):
+        if not os.path.getsize(path):
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            offset, end = 0, len(data)
+            try:
+                while offset + self.HEADER.size <= end:
+                    (length,) = self.HEADER.unpack_from(data, offset)
+                    start = offset + self.HEADER.size
+                    if start + length > end:
+                        break  # Torn write at the tail from a crash; everything before it is intact
+                    kind, values = marshal.loads(view[start:start + length])
+                    store._restore(kind, values)
+                    offset = start + length
+            finally:
+                view.release()
+    
+    def _delete_logs_before(self, generation):
+        for old in self._log_generations():
+            if old < generation:
+                os.remove(self.log_path(old))
+    
+    # Writing
+    
+    def check_writable(self):
+        if self._owner_error:
+            raise StoreReadOnly(self._owner_error)
+    
+    def append(self, record):
+        self.check_writable()
+        entry = marshal.dumps((record.KIND, record.to_tuple()))
+        with self._lock:
+            self._file.write(self.HEADER.pack(len(entry)) + entry)
+            self._dirty = True
+            self.appended += 1
+    
+    def sync(self):
+        with self._lock:
+            if self._dirty and self._file:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._dirty = False
+    
+    def _flush_loop(self):
+        while not self._stopped.wait(self.fsync_interval):
+            self.sync()
+    
+    def rotate(self):
+        """Close the current log and start the next generation; returns the new generation"""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self.generation += 1
+            self._file = open(self.log_path(self.generation), 'ab')
+            self._dirty = False
+            self.appended = 0
+            return self.generation
+    
+    def write_snapshot(self, generation, counters, rows):
+        """Atomically replace the snapshot; it covers everything logged before generation"""
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(marshal.dumps((generation, counters, rows)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        dir_fd = os.open(self.data_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._delete_logs_before(generation)
+    
+    def close(self):
+        self._stopped.set()
+        self.sync()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        if self._lockfile:
+            self._lockfile.close()
+            self._lockfile = None
+
+
+class Store:
+    """Tables of records keyed by ID, plus the joins used when serializing them.
+    
+    Writers take the stripe lock of the record they change (store.lock) and
+    tables are only iterated through store.rows. Stripe locks are never nested
+    except requests before bookings, so they cannot deadlock.
+    """
+    
+    STRIPES = 64
+    TABLES = ('users', 'requests', 'bookings')
+    
+    def __init__(self, journal=None):
+        self.users = {}
+        self.requests = {}
+        self.bookings = {}
+        self.journal = journal
+        self._user_ids_by_email = {}
+        self._counters = {'user': 1, 'request': 1, 'booking': 1}
+        self._id_lock = threading.Lock()
+        # Inserts and point-in-time copies of a table
+        self._table_locks = {table: threading.Lock() for table in self.TABLES}
+        # Read-modify-write of existing records
+        self._stripes = {table: [threading.Lock() for _ in range(self.STRIPES)] for table in self.TABLES}
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_thread = None
+    
+    @classmethod
+    def open(cls, data_dir=None, **journal_options):
+        """In-memory store, durable in data_dir when one is given"""
+        if not data_dir:
+            return cls()
+        store = cls(Journal(data_dir, **journal_options))
+        store.journal.load(store)
+        atexit.register(store.close)
+        return store
+    
+    def check_writable(self):
+        """Raise StoreReadOnly before anything changes when this process may not write the journal"""
+        if self.journal:
+            self.journal.check_writable()
+    
+    def next_id(self, entity_type):
+        self.check_writable()
+        with self._id_lock:
+            self._counters[entity_type] += 1
+            return self._counters[entity_type]
+    
+    @contextmanager
+    def lock(self, table, record_id):
+        """Hold the stripe lock of one record and yield its current version (None if missing)"""
+        with self._stripes[table][hash(record_id) % self.STRIPES]:
+            yield getattr(self, table).get(record_id)
+    
+    def rows(self, table):
+        """Point-in-time list of a table's records"""
+        with self._table_locks[table]:
+            return list(getattr(self, table).values())
+    
+    def _insert(self, record):
+        self.check_writable()
+        with self._table_locks[record.TABLE]:
+            getattr(self, record.TABLE)[record.id] = record
+        return self._saved(record)
+    
+    def _swap(self, record):
+        """Publish a new version of an existing record; caller holds its stripe lock"""
+        self.check_writable()
+        getattr(self, record.TABLE)[record.id] = record
+        return self._saved(record)
+    
+    def _restore(self, kind, values):
+        record = RECORD_TYPES[kind].from_tuple(values)
+        getattr(self, record.TABLE)[record.id] = record
+        if record.KIND == 'user':
+            self._user_ids_by_email[record.email] = record.id
+        counter = ID_COUNTERS[record.TABLE]
+        self._counters[counter] = max(self._counters[counter], record.id)
+    
+    def _restore_rows(self, rows):
+        """Bulk version of _restore for snapshots, whose counters are already saved"""
+        tables = {kind: (cls.from_tuple, getattr(self, cls.TABLE)) for kind, cls in RECORD_TYPES.items()}
+        for kind, values in rows:
+            from_tuple, table = tables[kind]
+            table[values[0]] = from_tuple(values)
+        self._user_ids_by_email.update((user.email, user.id) for user in self.users.values())
+    
+    def _saved(self, record):
+        if self.journal:
+            self.journal.append(record)
+            if self.journal.appended >= self.journal.snapshot_every:
+                self.snapshot(background=True)
+        return record
+    
+    # Persistence
+    
+    def snapshot(self, background=False):
+        """Write a snapshot of every record and start a new log generation.
+        
+        The log is rotated before the rows are copied: a write logged before the
+        rotation is already in memory and gets copied, and one logged after it
+        is replayed from the new log. With background=True the copy and the
+        file write happen on a separate thread.
+        """
+        if not self.journal or not self._snapshot_lock.acquire(blocking=False):
+            return
+        try:
+            generation = self.journal.rotate()
+        except Exception:
+            self._snapshot_lock.release()
+            raise
+        if background:
+            self._snapshot_thread = threading.Thread(
+                target=self._write_snapshot, args=(generation,), name='memstore-snapshot'
+            )
+            self._snapshot_thread.start()
+        else:
+            self._write_snapshot(generation)
+    
+    def _write_snapshot(self, generation):
+        try:
+            with self._id_lock:
+                counters = dict(self._counters)
+            rows = [(record.KIND, record.to_tuple()) for table in self.TABLES for record in self.rows(table)]
+            self.journal.write_snapshot(generation, counters, rows)
+        finally:
+            self._snapshot_lock.release()
+    
+    def close(self):
+        if self.journal:
+            if self._snapshot_thread:
+                self._snapshot_thread.join()
+            self.journal.close()
+    
+    # Users
+    
+    def add_user(self, **fields):
+        """Create a user, or return None if the email is already registered"""
+        self.check_writable()
+        user = User(id=None, created_at=now(), **fields)
+        with self._table_locks['users']:
+            if user.email in self._user_ids_by_email:
+                return None
+            user.id = self.next_id('user')
+            self.users[user.id] = user
+            self._user_ids_by_email[user.email] = user.id
+        return self._saved(user)
+    
+    def user_by_email(self, email):
+        return self.users.get(self._user_ids_by_email.get(email))
+    
+    def update_profile(self, user_id, data):
+        with self.lock('users', user_id) as user:
+            if user is None:
+                return None
+            return self._swap(user.replace(**{k: v for k, v in data.items() if k in User.PROFILE_FIELDS}))
+    
+    # Service requests
+    
+    def add_request(self, **fields):
+        timestamp = now()
+        return self._insert(
+            ServiceRequest(id=self.next_id('request'), created_at=timestamp, updated_at=timestamp, **fields)
+        )
+    
+    def update_request(self, service_req, **changes):
+        """Caller holds the request's stripe lock (store.lock('requests', id))"""
+        return self._swap(service_req.replace(updated_at=now(), **changes))
+    
+    # Bookings
+    
+    def add_booking(self, record_type, **fields):
+        timestamp = now()
+        if 'updated_at' in record_type.FIELDS:
+            fields['updated_at'] = timestamp
+        return self._insert(record_type(id=self.next_id('booking'), created_at=timestamp, **fields))
+    
+    def update_booking(self, booking, **changes):
+        """Caller holds the booking's stripe lock (store.lock('bookings', id))"""
+        if 'updated_at' in booking.FIELDS:
+            changes['updated_at'] = now()
+        return self._swap(booking.replace(**changes))
+    
+    # Serialization
+    
+    def user_dict(self, user_id):
+        user = self.users.get(user_id)
+        return user.to_dict() if user else None
+    
+    def request_dict(self, service_req):
+        data = service_req.to_dict()
+        data['client'] = self.user_dict(service_req.client_id)
+        data['artisan'] = self.user_dict(service_req.artisan_id)
+        return data
+    
+    def booking_dict(self, booking):
+        data = booking.to_dict()
+        if isinstance(booking, DirectBooking):
+            data['client'] = self.user_dict(booking.client_id)
+            data['artisan'] = self.user_dict(booking.artisan_id)
+        return data
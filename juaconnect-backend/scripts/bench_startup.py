@@ -0,0 +1,57 @@
+"""Startup-time benchmark.
+
+Measures, in fresh interpreters, how long it takes to import the app package
+and build the app with create_app, with and without db.create_all(). That is
+the startup of wsgi:app, the process the Procfile serves; the in-memory run.py
+app is not measured.
+
+    python scripts/bench_startup.py [--runs 10] [--database-url sqlite:///bench.db]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+from config import ProductionConfig
+imported = time.perf_counter()
+create_app(ProductionConfig)
+built = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': built - imported, 'total': built - start}))
+"""
+
+
+def run_probe(create_tables, database_url):
+    env = dict(os.environ, CREATE_TABLES='true' if create_tables else 'false', DATABASE_URL=database_url)
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-url', default='sqlite:///startup_bench.db')
+    args = parser.parse_args()
+    
+    # Warm the OS file cache and create the schema once so runs are comparable
+    run_probe(True, args.database_url)
+    
+    for create_tables in (True, False):
+        samples = [run_probe(create_tables, args.database_url) for _ in range(args.runs)]
+        print(f'CREATE_TABLES={str(create_tables).lower()} ({args.runs} runs, median ms)')
+        for phase in ('import', 'create_app', 'total'):
+            print(f'  {phase:<11} {statistics.median(s[phase] for s in samples) * 1000:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
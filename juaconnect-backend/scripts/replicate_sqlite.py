@@ -0,0 +1,47 @@
+"""Poor man's streaming replica for local testing with SQLite files.
+
+Copies the primary database into each replica file with the SQLite online
+backup API every --interval seconds, so the replicas trail the primary the way
+a real replica would. Run `flask replica-heartbeat` against the primary so the
+app can see how far behind each copy is.
+
+    python scripts/replicate_sqlite.py juaconnect.db replica1.db [replica2.db ...] [--interval 2] [--once]
+
+then start the app with
+    REPLICA_DATABASE_URLS=sqlite:///replica1.db,sqlite:///replica2.db
+"""
+import argparse
+import sqlite3
+import time
+
+
+def copy(primary, replica):
+    source = sqlite3.connect(primary)
+    target = sqlite3.connect(replica, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('primary')
+    parser.add_argument('replicas', nargs='+')
+    parser.add_argument('--interval', type=float, default=2.0, help='Seconds between copies')
+    parser.add_argument('--once', action='store_true', help='Copy once and exit')
+    args = parser.parse_args()
+    
+    while True:
+        for replica in args.replicas:
+            started = time.perf_counter()
+            copy(args.primary, replica)
+            print(f'{replica}: copied in {(time.perf_counter() - started) * 1000:.0f}ms', flush=True)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
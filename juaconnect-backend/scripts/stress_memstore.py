@@ -0,0 +1,140 @@
+"""Concurrency stress test for the run.py in-memory store.
+
+Many artisan threads race to accept, start and complete the same requests
+through the API, while reader threads poll the list endpoints and client
+threads keep creating requests. Exits non-zero if any invariant breaks.
+
+    python scripts/stress_memstore.py [--artisans 16] [--requests 400] [--data-dir DIR]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--artisans', type=int, default=16)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=400, help='Requests created per client')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--data-dir', help='Also check the persisted store by reloading it')
+    args = parser.parse_args()
+    
+    if args.data_dir:
+        os.environ['MEMSTORE_DATA_DIR'] = args.data_dir
+    sys.path.insert(0, BACKEND_DIR)
+    # Switch threads far more often than the default 5ms to shake out races
+    sys.setswitchinterval(1e-5)
+    import run
+    
+    app, store = run.app, run.store
+    errors = []
+    
+    def client(method, path, token=None, **kwargs):
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        response = getattr(app.test_client(), method)(path, headers=headers, **kwargs)
+        if response.status_code >= 500:
+            errors.append(f'{method.upper()} {path} -> {response.status_code}')
+        return response.status_code, response.get_json()
+    
+    def signup(name, user_type):
+        status, body = client('post', '/v1/auth/signup', json={
+            'email': f'{name}-{time.time_ns()}@stress.test', 'password': 'x', 'username': name,
+            'user_type': user_type, 'service_category': 'plumbing',
+        })
+        return body['data']['token'], body['data']['user']['id']
+    
+    clients = [signup(f'client{i}', 'client') for i in range(args.clients)]
+    artisans = [signup(f'artisan{i}', 'artisan') for i in range(args.artisans)]
+    
+    created = [[] for _ in clients]
+    accepted = Counter()
+    winners = {}
+    done = threading.Event()
+    
+    def create_requests(index):
+        token = clients[index][0]
+        for n in range(args.requests):
+            status, body = client('post', '/v1/client/requests', token, json={
+                'service_category': 'plumbing', 'description': f'job {n}', 'location': 'Nairobi', 'budget': 100,
+            })
+            created[index].append(body['data']['id'])
+    
+    def work(token, artisan_id):
+        seen = set()
+        while not (done.is_set() and len(seen) >= sum(map(len, created))):
+            pending = [rid for ids in created for rid in list(ids) if rid not in seen]
+            if not pending:
+                time.sleep(0.001)
+            random.shuffle(pending)
+            for rid in pending:
+                seen.add(rid)
+                status, _ = client('post', f'/v1/artisan/requests/{rid}/accept', token)
+                if status != 200:
+                    continue
+                accepted[rid] += 1
+                winners[rid] = artisan_id
+                client('post', f'/v1/artisan/requests/{rid}/start', token, json={'total_amount': 100})
+                client('post', f'/v1/artisan/requests/{rid}/complete', token)
+    
+    def read(token):
+        while not done.is_set() or any(t.is_alive() for t in workers):
+            status, body = client('get', '/v1/artisan/available-requests', token)
+            for item in body['data']:
+                if item['status'] != 'pending' or item['artisan_id'] is not None:
+                    errors.append(f'torn read of request {item["id"]}: {item["status"]} / {item["artisan_id"]}')
+            time.sleep(0.001)
+    
+    start = time.perf_counter()
+    creators = [threading.Thread(target=create_requests, args=(i,)) for i in range(len(clients))]
+    workers = [threading.Thread(target=work, args=artisan) for artisan in artisans]
+    readers = [threading.Thread(target=read, args=(artisans[0][0],)) for _ in range(args.readers)]
+    for thread in creators + workers + readers:
+        thread.start()
+    for thread in creators:
+        thread.join()
+    done.set()
+    for thread in workers + readers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    request_ids = [rid for ids in created for rid in ids]
+    requests = {r.id: r for r in store.rows('requests')}
+    bookings = store.rows('bookings')
+    checks = {
+        'unique request ids': len(set(request_ids)) == len(request_ids) == args.clients * args.requests,
+        'every request accepted exactly once': all(accepted[rid] == 1 for rid in request_ids),
+        'accepted by the winning artisan': all(requests[rid].artisan_id == winners[rid] for rid in request_ids),
+        'every request completed': all(requests[rid].status == 'completed' for rid in request_ids),
+        'one completed booking per request': sorted(b.request_id for b in bookings if b.status == 'completed') == sorted(request_ids),
+        'unique booking ids': len({b.id for b in bookings}) == len(bookings),
+        'no server errors or torn reads': not errors,
+    }
+    
+    if args.data_dir:
+        from memstore import Store
+        store.close()
+        reloaded = Store.open(args.data_dir)
+        checks['reloaded store matches'] = (
+            {r.id: r.to_tuple() for r in reloaded.rows('requests')} == {r.id: r.to_tuple() for r in requests.values()}
+            and len(reloaded.rows('bookings')) == len(bookings)
+        )
+        reloaded.close()
+    
+    calls = len(request_ids) * 3 + len(artisans) * len(request_ids)
+    print(f'{len(request_ids)} requests, {len(artisans)} artisans, {elapsed:.1f}s (~{calls / elapsed:.0f} calls/s)')
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    for error in errors[:10]:
+        print(f'  {error}')
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
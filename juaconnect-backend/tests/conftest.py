@@ -0,0 +1,60 @@
+import sys
+import pytest
+from app import create_app, db
+from app.services.sharding import ShardLocal
+from config import TestingConfig
+
+
+def reset_caches():
+    """Drop per-process caches (schedule index, feature tables, ...) left by an earlier test's app"""
+    for name, module in list(sys.modules.items()):
+        if name.startswith('app.'):
+            for value in list(vars(module).values()):
+                if isinstance(value, ShardLocal):
+                    value._instances.clear()
+
+
+@pytest.fixture
+def app():
+    reset_caches()
+    app = create_app(TestingConfig)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def signup(client):
+    """signup(name, user_type, **fields) -> (auth headers, user dict)"""
+    def signup(name, user_type='client', **fields):
+        response = client.post('/v1/auth/signup', json=dict(
+            username=name, email=f'{name}@example.com', password='secret123', user_type=user_type, **fields
+        ))
+        assert response.status_code == 201, response.get_json()
+        data = response.get_json()['data']
+        return {'Authorization': f"Bearer {data['token']}"}, data['user']
+    return signup
+
+
+@pytest.fixture
+def completed_job(client):
+    """completed_job(client headers, artisan headers, **request fields) -> the completed request dict"""
+    def completed_job(client_headers, artisan_headers, **fields):
+        fields = dict({
+            'service_category': 'Plumbing', 'description': 'Fix the kitchen sink',
+            'location': 'Westlands, Nairobi', 'budget': 1500, 'allow_duplicate': True,
+        }, **fields)
+        response = client.post('/v1/client/requests', headers=client_headers, json=fields)
+        assert response.status_code == 201, response.get_json()
+        request_id = response.get_json()['data']['id']
+        for step in ('accept', 'start', 'complete'):
+            response = client.post(f'/v1/artisan/requests/{request_id}/{step}', headers=artisan_headers)
+            assert response.status_code == 200, response.get_json()
+        return response.get_json()['data']
+    return completed_job
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import DemandRollup, EarningsRollup
+from app.services.analytics import rebuild_rollups
+
+KEY = {'X-Analytics-Key': 'ops-key'}
+
+
+@pytest.fixture(autouse=True)
+def analytics_key(app):
+    app.config['ANALYTICS_API_KEY'] = 'ops-key'
+
+
+def rollups(app):
+    with app.app_context():
+        demand = {
+            (r.bucket, r.service_category, r.area): (
+                r.created_count, r.accepted_count, r.completed_count, r.cancelled_count, r.earnings_total,
+                r.accept_seconds_total,
+            )
+            for r in DemandRollup.query
+        }
+        earnings = {(r.bucket, r.artisan_id): (r.completed_count, r.earnings_total) for r in EarningsRollup.query}
+        db.session.remove()
+    return demand, earnings
+
+
+def create_request(client, headers, **fields):
+    response = client.post('/v1/client/requests', headers=headers, json=dict({
+        'service_category': 'Plumbing', 'description': 'Fix the kitchen sink', 'location': 'Westlands, Nairobi',
+        'budget': 1500, 'allow_duplicate': True,
+    }, **fields))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']['id']
+
+
+def test_rollups_match_a_rebuild_from_history(app, client, signup, completed_job):
+    client_headers, _ = signup('client1')
+    plumber_headers, _ = signup('plumber', 'artisan', service_category='Plumbing')
+    painter_headers, _ = signup('painter', 'artisan', service_category='Painting')
+    completed_job(client_headers, plumber_headers)
+    completed_job(client_headers, painter_headers, service_category='Painting', location='Kilimani', budget=4000)
+    accepted = create_request(client, client_headers, description='Leaking tap')
+    assert client.post(f'/v1/artisan/requests/{accepted}/accept', headers=plumber_headers).status_code == 200
+    rejected = create_request(client, client_headers, description='Broken shower')
+    assert client.post(f'/v1/artisan/requests/{rejected}/accept', headers=plumber_headers).status_code == 200
+    assert client.post(f'/v1/artisan/requests/{rejected}/reject', headers=plumber_headers).status_code == 200
+    cancelled = create_request(client, client_headers, service_category='Painting', description='Paint the fence')
+    assert client.put(f'/v1/client/requests/{cancelled}', headers=client_headers).status_code == 200
+    
+    demand, earnings = rollups(app)
+    assert sum(counts[0] for counts in demand.values()) == 5
+    with app.app_context():
+        rebuild_rollups(chunk_size=2)
+        db.session.commit()
+        db.session.remove()
+    rebuilt_demand, rebuilt_earnings = rollups(app)
+    
+    assert rebuilt_demand.keys() == demand.keys()
+    for key, counts in demand.items():
+        assert rebuilt_demand[key] == pytest.approx(counts)
+    assert rebuilt_earnings == earnings
+
+
+def test_reports_need_the_analytics_key(app, client):
+    assert client.get('/v1/analytics/demand').status_code == 403
+    assert client.get('/v1/analytics/demand', headers={'X-Analytics-Key': 'wrong'}).status_code == 403
+    assert client.get('/v1/analytics/earnings', headers=KEY).status_code == 200
+    
+    # No key configured means no access at all, not access for an empty header
+    app.config['ANALYTICS_API_KEY'] = None
+    assert client.get('/v1/analytics/demand', headers={'X-Analytics-Key': ''}).status_code == 403
+
+
+@pytest.mark.parametrize('query', [
+    {'granularity': 'week'},
+    {'from': '2030-01-02T00:00:00', 'to': '2030-01-01T00:00:00'},
+    {'from': '2030-01-01T00:00:00', 'to': '2030-06-01T00:00:00'},
+    {'from': 'last tuesday'},
+])
+def test_invalid_windows_are_refused(client, query):
+    response = client.get('/v1/analytics/demand', headers=KEY, query_string=query)
+    assert response.status_code == 400
+
+
+def test_day_reports_sum_the_hours(client, signup, completed_job):
+    client_headers, _ = signup('client1')
+    artisan_headers, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    completed_job(client_headers, artisan_headers)
+    completed_job(client_headers, artisan_headers, budget=2500)
+    
+    now = datetime.utcnow()
+    response = client.get('/v1/analytics/earnings', headers=KEY, query_string={
+        'from': (now - timedelta(days=1)).isoformat(), 'to': (now + timedelta(hours=1)).isoformat(),
+        'granularity': 'day', 'artisan_id': artisan['id'],
+    })
+    assert response.status_code == 200
+    rows = response.get_json()['data']
+    assert [(row['artisan_id'], row['completed_count'], row['earnings_total']) for row in rows] == [(artisan['id'], 2, 4000)]
+    assert rows[0]['bucket'] == now.strftime('%Y-%m-%dT00:00:00')
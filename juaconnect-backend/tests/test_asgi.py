@@ -0,0 +1,118 @@
+import asyncio
+import json
+import threading
+import pytest
+from app import db
+from app.asgi import create_asgi_app
+from app.services.ratelimit import limiter
+from config import TestingConfig
+from tests.conftest import reset_caches
+
+
+def call(app, path, headers=None):
+    """(status, json body) of one GET through the ASGI app"""
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': 'GET', 'path': path, 'query_string': b'',
+        'client': ('10.0.0.1', 1234), 'server': ('testserver', 80),
+        'headers': [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+    }
+    sent = []
+    
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    
+    async def send(message):
+        sent.append(message)
+    
+    async def run():
+        await app(scope, receive, send)
+        for engine in app.engines.values():
+            await engine.dispose()
+    
+    asyncio.run(run())
+    body = b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+    return sent[0]['status'], json.loads(body)
+
+
+def signup(client, name, user_type='client', location='Westlands, Nairobi'):
+    response = client.post('/v1/auth/signup', json={
+        'username': name, 'email': f'{name}@example.com', 'password': 'secret123', 'user_type': user_type,
+        'location': location, 'service_category': 'Plumbing',
+    })
+    assert response.status_code == 201, response.get_json()
+    return {'Authorization': f"Bearer {response.get_json()['data']['token']}"}
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    reset_caches()
+    shards = {'nairobi': f"sqlite:///{tmp_path / 'nairobi.db'}", 'mombasa': f"sqlite:///{tmp_path / 'mombasa.db'}"}
+    config = type('ShardedConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'SHARD_DATABASE_URLS': shards,
+        'SHARD_DEFAULT_REGION': 'nairobi',
+        'SQLALCHEMY_BINDS': {f'shard_{region}': url for region, url in shards.items()},
+    })
+    yield create_asgi_app(config)
+    # init_app registers a metadata per bind on the shared db object
+    for region in shards:
+        db.metadatas.pop(f'shard_{region}', None)
+
+
+def test_admission_runs_off_the_event_loop(tmp_path, monkeypatch):
+    reset_caches()
+    config = type('FileConfig', (TestingConfig,), {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'api.db'}"})
+    app = create_asgi_app(config)
+    headers = signup(app.flask_app.test_client(), 'client1')
+    admitted_on = []
+    admit = limiter.admit
+    
+    def recording_admit(*args, **kwargs):
+        admitted_on.append(threading.current_thread())
+        return admit(*args, **kwargs)
+    
+    monkeypatch.setattr(limiter, 'admit', recording_admit)
+    status, body = call(app, '/v1/notifications/unread', headers)
+    assert status == 200
+    assert admitted_on and threading.main_thread() not in admitted_on
+
+
+def test_sharded_notifications_read_the_home_shard(sharded):
+    client = sharded.flask_app.test_client()
+    headers = signup(client, 'coast_client', location='Nyali, Mombasa')
+    with sharded.flask_app.app_context():
+        from app.models import Notification, User
+        from app.services.sharding import shard_router
+        with shard_router.use_shard('mombasa'):
+            user = User.query.filter_by(username='coast_client').one()
+            db.session.add(Notification(user_id=user.id, title='Hi', message='Welcome to the coast'))
+            db.session.commit()
+        db.session.remove()
+    expected = client.get('/v1/notifications/unread', headers=headers).get_json()['data']['count']
+    assert expected == 1
+    
+    status, body = call(sharded, '/v1/notifications/unread', headers)
+    assert status == 200
+    assert body['data']['count'] == expected
+    status, body = call(sharded, '/v1/notifications', headers)
+    assert status == 200
+    assert len(body['data']) == expected
+
+
+def test_sharded_artisan_reads_go_through_flask(sharded):
+    client = sharded.flask_app.test_client()
+    signup(client, 'coast_artisan', 'artisan', location='Nyali, Mombasa')
+    signup(client, 'city_artisan', 'artisan', location='Westlands, Nairobi')
+    with sharded.flask_app.app_context():
+        from app.models import User
+        from app.services.sharding import shard_router
+        for region in ('nairobi', 'mombasa'):
+            with shard_router.use_shard(region):
+                User.query.filter_by(user_type='artisan').update({'is_verified': True})
+                db.session.commit()
+        db.session.remove()
+    
+    assert not [pattern for pattern, _ in sharded.routes if 'artisan' in pattern.pattern]
+    status, body = call(sharded, '/v1/artisan/')
+    assert status == 200
+    assert {artisan['username'] for artisan in body['data']} == {'coast_artisan', 'city_artisan'}
@@ -0,0 +1,34 @@
+from flask_jwt_extended import JWTManager
+
+
+def test_batch_decodes_the_token_once(client, signup, monkeypatch):
+    headers, user = signup('client1')
+    decodes = []
+    original = JWTManager._decode_jwt_from_config
+    
+    def counting(self, *args, **kwargs):
+        decodes.append(args[0])
+        return original(self, *args, **kwargs)
+    
+    monkeypatch.setattr(JWTManager, '_decode_jwt_from_config', counting)
+    response = client.post('/v1/batch', headers=headers, json={'requests': [
+        {'method': 'GET', 'path': '/v1/auth/profile'},
+        {'method': 'GET', 'path': '/v1/client/requests'},
+        {'method': 'POST', 'path': '/v1/client/requests', 'body': {
+            'service_category': 'Plumbing', 'description': 'Fix the kitchen sink', 'location': 'Westlands',
+        }},
+        {'method': 'GET', 'path': '/v1/client/requests'},
+    ]})
+    
+    results = response.get_json()['data']
+    assert [result['status'] for result in results] == [200, 200, 201, 200]
+    assert len(results[3]['body']['data']) == 1
+    assert len(decodes) == 1
+
+
+def test_batch_with_a_bad_token_is_refused(client):
+    response = client.post('/v1/batch', headers={'Authorization': 'Bearer not-a-token'}, json={'requests': [
+        {'method': 'GET', 'path': '/v1/auth/profile'},
+    ]})
+    # flask_jwt_extended answers a malformed token with 422
+    assert response.status_code == 422
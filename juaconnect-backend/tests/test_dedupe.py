@@ -0,0 +1,50 @@
+import pytest
+
+NEAR_DUPLICATES = [
+    ('leaky pipe in kitchen', 'leaky pipe in the kitchen'),
+    ('Leaky pipe in kitchen', 'leaky pipe in kitchen!!'),
+    ('Fix the kitchen sink, it is leaking', "fix kitchen sink it's leaking"),
+    ('broken door lock', 'the door lock is broken'),
+    ('Replace broken window glass in the kitchen', 'replace broken kitchen window glass'),
+    ('Install ceiling fan in bedroom', 'install a ceiling fan in the bedroom'),
+]
+DIFFERENT_JOBS = [
+    ('leaky pipe in kitchen', 'leaky pipe in bathroom'),
+    ('Fix the kitchen sink', 'Fix the bathroom sink'),
+    ('Fix the kitchen sink', 'Install a new water heater'),
+    ('Paint the living room walls', 'Paint the bedroom ceiling'),
+    ('Replace kitchen tap', 'Replace bathroom tap'),
+    ('broken door lock', 'broken window'),
+]
+
+
+def submit(client, headers, description, location='Westlands, Nairobi'):
+    return client.post('/v1/client/requests', headers=headers, json={
+        'service_category': 'Plumbing', 'description': description, 'location': location,
+    })
+
+
+@pytest.mark.parametrize('first, second', NEAR_DUPLICATES)
+def test_near_duplicate_returns_the_original(client, signup, first, second):
+    headers, _ = signup('client1')
+    original = submit(client, headers, first)
+    assert original.status_code == 201
+    
+    response = submit(client, headers, second)
+    assert response.status_code == 200
+    assert response.get_json()['duplicate_of'] == original.get_json()['data']['id']
+
+
+@pytest.mark.parametrize('first, second', DIFFERENT_JOBS)
+def test_different_job_is_created(client, signup, first, second):
+    headers, _ = signup('client1')
+    assert submit(client, headers, first).status_code == 201
+    assert submit(client, headers, second).status_code == 201
+
+
+def test_same_description_elsewhere_or_by_another_client_is_created(client, signup):
+    headers, _ = signup('client1')
+    other_headers, _ = signup('client2')
+    assert submit(client, headers, 'leaky pipe in kitchen').status_code == 201
+    assert submit(client, headers, 'leaky pipe in kitchen', location='Kilimani, Nairobi').status_code == 201
+    assert submit(client, other_headers, 'leaky pipe in kitchen').status_code == 201
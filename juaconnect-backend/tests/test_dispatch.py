@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+from sqlalchemy import update
+from app import db
+from app.models import User
+from app.services.recommendations import solve_assignment
+
+
+def brute_force(values):
+    """Best total of positive values over every one-to-one partial matching"""
+    n, m = values.shape
+    
+    def best(row, used):
+        if row == n:
+            return 0.0
+        total = best(row + 1, used)  # leave this row unmatched
+        for column in range(m):
+            if not used & (1 << column) and values[row, column] > 0:
+                total = max(total, values[row, column] + best(row + 1, used | (1 << column)))
+        return total
+    
+    return best(0, 0)
+
+
+def check(values):
+    match = solve_assignment(values)
+    assert match.shape == (values.shape[0],)
+    columns = match[match >= 0]
+    assert len(set(columns.tolist())) == len(columns), 'a column was matched twice'
+    assert all(values[i, match[i]] > 0 for i in np.flatnonzero(match >= 0)), 'a worthless pair was matched'
+    total = sum(values[i, match[i]] for i in np.flatnonzero(match >= 0))
+    assert total == pytest.approx(brute_force(values))
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_solver_matches_brute_force_on_random_matrices(seed):
+    rng = np.random.default_rng(seed)
+    n, m = rng.integers(1, 7, size=2)
+    if seed % 3 == 0:
+        # Small integers make many ties, the degenerate case
+        values = rng.integers(-3, 4, size=(n, m)).astype(float)
+    else:
+        values = rng.normal(size=(n, m))
+    if seed % 5 == 0:
+        values[rng.random((n, m)) < 0.3] = -np.inf
+    check(values)
+
+
+def test_solver_handles_empty_and_worthless_input():
+    assert solve_assignment(np.zeros((0, 3))).tolist() == []
+    assert solve_assignment(np.full((2, 2), -1.0)).tolist() == [-1, -1]
+    assert solve_assignment(np.array([[np.nan, 2.0], [np.inf, 1.0]])).tolist() == [1, -1]
+
+
+def test_assign_mode_gives_each_request_one_artisan(app, client, signup):
+    client_headers, _ = signup('client1')
+    artisans = [signup(f'artisan{i}', 'artisan', service_category='Plumbing', location='Westlands, Nairobi',
+                       hourly_rate=500)[1] for i in range(2)]
+    with app.app_context():
+        db.session.execute(update(User).where(User.user_type == 'artisan').values(is_verified=True))
+        db.session.commit()
+        db.session.remove()
+    request_ids = [client.post('/v1/client/requests', headers=client_headers, json={
+        'service_category': 'Plumbing', 'description': f'Job number {i}', 'location': 'Westlands, Nairobi',
+        'budget': 2000, 'allow_duplicate': True,
+    }).get_json()['data']['id'] for i in range(3)]
+    
+    app.config['ASSIGNMENT_MIN_SCORE'] = -100.0
+    with app.app_context():
+        from app.services.dispatch import run_batch_assignment
+        plans = [(service_request.id, artisan_id) for service_request, artisan_id, _ in run_batch_assignment('assign')]
+        db.session.remove()
+    
+    # Two artisans, three requests: two are assigned, each to a different artisan
+    assert len(plans) == 2
+    assert len({artisan_id for _, artisan_id in plans}) == 2
+    assert {artisan_id for _, artisan_id in plans} == {artisan['id'] for artisan in artisans}
+    statuses = [client.get(f'/v1/client/requests/{request_id}', headers=client_headers).get_json()['data']['status']
+                for request_id in request_ids]
+    assert sorted(statuses) == ['accepted', 'accepted', 'pending']
+
+
+def unread(client, headers, artisan):
+    """(dashboard unread counter, unread notifications actually stored)"""
+    counter = client.get(f"/v1/artisan/{artisan['id']}/dashboard", headers=headers).get_json()['data']
+    count = client.get('/v1/notifications/unread', headers=headers).get_json()['data']['count']
+    return counter['unread_notifications'], count
+
+
+def test_fan_out_notifies_verified_artisans_in_the_category(app, client, signup):
+    client_headers, _ = signup('client1')
+    plumbers = [signup(f'plumber{i}', 'artisan', service_category=category)
+                for i, category in enumerate(('Plumbing', ' plumbing '))]
+    unverified = signup('unverified', 'artisan', service_category='Plumbing')
+    painter = signup('painter', 'artisan', service_category='Painting')
+    with app.app_context():
+        db.session.execute(update(User).where(User.id == unverified[1]['id']).values(is_verified=False))
+        db.session.commit()
+        db.session.remove()
+    
+    response = client.post('/v1/client/requests', headers=client_headers, json={
+        'service_category': 'Plumbing', 'description': 'Fix the kitchen sink', 'location': 'Westlands, Nairobi',
+    })
+    assert response.status_code == 201
+    request_id = response.get_json()['data']['id']
+    for headers, artisan in plumbers:
+        assert unread(client, headers, artisan) == (1, 1)
+        notification = client.get('/v1/notifications', headers=headers).get_json()['data'][0]
+        assert notification['related_id'] == request_id
+    for headers, artisan in (unverified, painter):
+        assert unread(client, headers, artisan) == (0, 0)
+    
+    # Reading the notification brings the counter back down
+    headers, artisan = plumbers[0]
+    notification_id = client.get('/v1/notifications', headers=headers).get_json()['data'][0]['id']
+    assert client.put(f'/v1/notifications/{notification_id}/read', headers=headers).status_code == 200
+    assert unread(client, headers, artisan) == (0, 0)
+
+
+def test_fan_out_skips_the_requester_and_closed_requests(app, signup):
+    _, plumber = signup('plumber', 'artisan', service_category='Plumbing')
+    _, other = signup('other', 'artisan', service_category='Plumbing')
+    with app.app_context():
+        from app.models import ArtisanStats, ServiceRequest
+        from app.services.dispatch import fan_out_request
+        own = ServiceRequest(client_id=plumber['id'], service_category='Plumbing', description='My own sink',
+                             location='Kilimani', status='pending')
+        taken = ServiceRequest(client_id=plumber['id'], artisan_id=other['id'], service_category='Plumbing',
+                               description='Taken', location='Kilimani', status='accepted')
+        db.session.add_all([own, taken])
+        db.session.commit()
+        
+        assert fan_out_request(own.id) == 1
+        assert fan_out_request(taken.id) == 0
+        assert fan_out_request(own.id + 1000) == 0
+        counters = {s.user_id: s.unread_notifications for s in ArtisanStats.query}
+        assert counters == {plumber['id']: 0, other['id']: 1}
+        db.session.remove()
@@ -0,0 +1,85 @@
+import time
+import pytest
+from app.services.jobs import JobQueue, JobRunner, job
+
+calls = []
+
+
+@job('test_flaky')
+def flaky_job(fail=True):
+    calls.append(fail)
+    if fail:
+        raise RuntimeError('boom')
+
+
+@pytest.fixture
+def queue(tmp_path):
+    calls.clear()
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'))
+
+
+def row(queue, job_id):
+    return queue._conn().execute(
+        'SELECT status, attempts, run_at, last_error FROM jobs WHERE id = ?', (job_id,)
+    ).fetchone()
+
+
+def make_due(queue, job_id):
+    queue._conn().execute('UPDATE jobs SET run_at = ? WHERE id = ?', (time.time(), job_id))
+
+
+def test_failed_jobs_retry_with_backoff(app, queue):
+    app.config['JOB_BACKOFF_SECONDS'] = 10
+    job_id = queue.put('test_flaky', {}, max_attempts=3)
+    runner = JobRunner()
+    
+    for attempt, backoff in ((1, 10), (2, 20)):
+        before = time.time()
+        runner.run_claimed(app, queue, queue.claim(60))
+        status, attempts, run_at, last_error = row(queue, job_id)
+        assert (status, attempts) == ('queued', attempt)
+        assert 'boom' in last_error
+        # Exponential backoff with up to 20% jitter
+        assert before + backoff * 0.8 <= run_at <= time.time() + backoff * 1.2
+        assert queue.claim(60) is None
+        make_due(queue, job_id)
+    
+    runner.run_claimed(app, queue, queue.claim(60))
+    assert row(queue, job_id)[:2] == ('dead', 3)
+    assert calls == [True] * 3
+
+
+def test_jobs_use_their_own_attempt_limit(app, queue):
+    app.config['JOB_MAX_ATTEMPTS'] = 5
+    job_id = queue.put('test_flaky', {}, max_attempts=1)
+    JobRunner().run_claimed(app, queue, queue.claim(60))
+    assert row(queue, job_id)[:2] == ('dead', 1)
+    
+    assert queue.retry_dead() == 1
+    assert row(queue, job_id)[:2] == ('queued', 0)
+
+
+def test_expired_leases_are_reclaimed(app, queue):
+    job_id = queue.put('test_flaky', {'fail': False}, max_attempts=3)
+    first = queue.claim(-1)  # the worker holding it has died
+    second = queue.claim(60)
+    assert (second[0], second[3]) == (job_id, 2)
+    
+    # The first runner finishing late must not delete the reclaimed job
+    assert not queue.complete(job_id, first[5])
+    assert not queue.fail(job_id, first[5], 'late', retry_in=1)
+    assert row(queue, job_id)[:2] == ('running', 2)
+    
+    JobRunner().run_claimed(app, queue, second)
+    assert row(queue, job_id) is None
+    assert calls == [False]
+
+
+def test_expired_last_attempt_is_marked_dead(queue):
+    job_id = queue.put('test_flaky', {}, max_attempts=2)
+    queue.claim(-1)
+    queue.claim(-1)
+    assert queue.claim(60) is None
+    status, attempts, _, last_error = row(queue, job_id)
+    assert (status, attempts, last_error) == ('dead', 2, 'Lease expired')
+    assert calls == []
@@ -0,0 +1,54 @@
+import os
+import pytest
+from memstore import Store, StoreReadOnly
+
+
+def test_writes_fail_before_changing_tables_without_the_journal(tmp_path):
+    store = Store.open(str(tmp_path))
+    user = store.add_user(username='a', email='a@example.com', user_type='client')
+    store.journal._owner_error = 'owned by another worker'
+    
+    with pytest.raises(StoreReadOnly):
+        store.add_user(username='b', email='b@example.com', user_type='client')
+    with pytest.raises(StoreReadOnly):
+        store.update_profile(user.id, {'bio': 'changed'})
+    with pytest.raises(StoreReadOnly):
+        store.add_request(client_id=user.id, service_category='Plumbing', description='x', location='y',
+                          status='pending')
+    
+    assert store.user_by_email('b@example.com') is None
+    assert store.users[user.id].bio is None
+    assert store.rows('requests') == []
+    store.journal._owner_error = None
+    store.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_only_the_first_forked_worker_writes(tmp_path):
+    store = Store.open(str(tmp_path))
+    owner_ready, owner_done = os.pipe(), os.pipe()
+    
+    owner = os.fork()
+    if owner == 0:
+        # First worker: holds the data directory until the parent is done
+        os.write(owner_ready[1], b'1')
+        os.read(owner_done[0], 1)
+        os._exit(0)
+    os.read(owner_ready[0], 1)
+    
+    result = os.pipe()
+    other = os.fork()
+    if other == 0:
+        try:
+            store.add_user(username='b', email='b@example.com', user_type='client')
+            outcome = b'wrote'
+        except StoreReadOnly:
+            outcome = b'refused' if store.user_by_email('b@example.com') is None else b'diverged'
+        os.write(result[1], outcome)
+        os._exit(0)
+    outcome = os.read(result[0], 16)
+    
+    os.write(owner_done[1], b'1')
+    os.waitpid(owner, 0)
+    os.waitpid(other, 0)
+    assert outcome == b'refused'
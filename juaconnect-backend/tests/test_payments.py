@@ -0,0 +1,223 @@
+import hashlib
+import io
+import hmac
+import json
+import threading
+import pytest
+from app import create_app, db
+from app.models import Payment
+from config import ProductionConfig, TestingConfig
+
+
+@pytest.fixture
+def paid_job(signup, completed_job):
+    client_headers, _ = signup('client')
+    artisan_headers, artisan = signup('artisan', 'artisan', service_category='Plumbing')
+    return client_headers, artisan_headers, artisan, completed_job(client_headers, artisan_headers)
+
+
+def start_payment(client, headers, request_id, key):
+    return client.post('/v1/payments', headers=dict(headers, **{'Idempotency-Key': key}), json={'request_id': request_id})
+
+
+def reference_of(app, payment_id):
+    with app.app_context():
+        return db.session.get(Payment, payment_id).provider_reference
+
+
+def test_payment_responses_hide_the_provider_reference(client, paid_job):
+    client_headers, _, _, job = paid_job
+    response = start_payment(client, client_headers, job['id'], 'pay-1')
+    assert response.status_code == 201
+    assert 'provider_reference' not in response.get_json()['data']
+
+
+def test_signed_callback_settles_and_credits_the_ledger(app, client, paid_job):
+    app.config['PAYMENT_CALLBACK_SECRET'] = 'callback-secret'
+    client_headers, artisan_headers, _, job = paid_job
+    payment = start_payment(client, client_headers, job['id'], 'pay-1').get_json()['data']
+    body = json.dumps({'reference': reference_of(app, payment['id']), 'status': 'completed', 'amount': 1500}).encode()
+    
+    forged = client.post('/v1/payments/callback', data=body, content_type='application/json')
+    assert forged.status_code == 401
+    
+    signature = hmac.new(b'callback-secret', body, hashlib.sha256).hexdigest()
+    response = client.post('/v1/payments/callback', data=body, content_type='application/json',
+                           headers={'X-Signature': signature})
+    assert response.get_json()['data']['settled'] == 1
+    ledger = client.get('/v1/payments/ledger', headers=artisan_headers).get_json()
+    assert ledger['balance'] == 1500
+
+
+def test_unsigned_callbacks_are_refused_outside_development(app, client, paid_job):
+    client_headers, _, _, job = paid_job
+    payment = start_payment(client, client_headers, job['id'], 'pay-1').get_json()['data']
+    app.testing = False
+    response = client.post('/v1/payments/callback', json={
+        'reference': reference_of(app, payment['id']), 'status': 'completed', 'amount': 1500,
+    })
+    assert response.status_code == 401
+
+
+def test_production_refuses_the_stub_provider():
+    config = type('StubProductionConfig', (ProductionConfig,), {
+        'PAYMENT_PROVIDER': 'stub', 'SQLALCHEMY_DATABASE_URI': TestingConfig.SQLALCHEMY_DATABASE_URI,
+    })
+    with pytest.raises(RuntimeError):
+        create_app(config)
+
+
+def test_production_without_a_provider_turns_payments_off():
+    config = type('NoProviderConfig', (ProductionConfig,), {
+        'PAYMENT_PROVIDER': None, 'SQLALCHEMY_DATABASE_URI': TestingConfig.SQLALCHEMY_DATABASE_URI,
+        'CREATE_TABLES': True, 'RATE_LIMIT_ENABLED': False, 'JOBS_ASYNC': False,
+    })
+    app = create_app(config)
+    client = app.test_client()
+    response = client.post('/v1/auth/signup', json={
+        'username': 'c', 'email': 'c@example.com', 'password': 'secret123', 'user_type': 'client',
+    })
+    headers = {'Authorization': f"Bearer {response.get_json()['data']['token']}"}
+    assert client.post('/v1/payments', headers=headers, json={'request_id': 1}).status_code == 503
+    with app.app_context():
+        db.drop_all()
+
+
+def test_retry_with_the_same_key_returns_the_original_payment(client, paid_job):
+    client_headers, _, _, job = paid_job
+    first = start_payment(client, client_headers, job['id'], 'pay-1')
+    again = start_payment(client, client_headers, job['id'], 'pay-1')
+    assert (first.status_code, again.status_code) == (201, 200)
+    assert again.get_json()['data']['id'] == first.get_json()['data']['id']
+
+
+def test_a_second_key_cannot_pay_the_same_request_twice(client, paid_job):
+    client_headers, _, _, job = paid_job
+    assert start_payment(client, client_headers, job['id'], 'pay-1').status_code == 201
+    assert start_payment(client, client_headers, job['id'], 'pay-2').status_code == 409
+
+
+def test_idempotency_keys_are_scoped_to_the_client(client, signup, completed_job, paid_job):
+    client_headers, artisan_headers, _, job = paid_job
+    other_headers, _ = signup('other_client')
+    other_job = completed_job(other_headers, artisan_headers, description='Fix the bathroom tap')
+    
+    mine = start_payment(client, client_headers, job['id'], 'same-key').get_json()['data']
+    theirs = start_payment(client, other_headers, other_job['id'], 'same-key')
+    assert theirs.status_code == 201
+    assert theirs.get_json()['data']['id'] != mine['id']
+
+
+def test_failed_payment_can_be_retried(app, client, paid_job):
+    client_headers, _, _, job = paid_job
+    payment = start_payment(client, client_headers, job['id'], 'pay-1').get_json()['data']
+    client.post('/v1/payments/callback', json={
+        'reference': reference_of(app, payment['id']), 'status': 'failed',
+    })
+    assert start_payment(client, client_headers, job['id'], 'pay-2').status_code == 201
+
+
+def test_stub_settlement_file_reconciles_once(app, client, paid_job):
+    from app.services.payments import reconcile, write_stub_settlement
+    client_headers, artisan_headers, _, job = paid_job
+    start_payment(client, client_headers, job['id'], 'pay-1')
+    
+    with app.app_context():
+        settlement = io.StringIO()
+        assert write_stub_settlement(settlement) == 1
+        settlement.seek(0)
+        assert reconcile(settlement)['settled'] == 1
+        settlement.seek(0)
+        assert reconcile(settlement)['duplicate'] == 1
+    
+    ledger = client.get('/v1/payments/ledger', headers=artisan_headers).get_json()
+    assert [entry['amount'] for entry in ledger['data']] == [1500]
+
+
+def test_bad_settlement_rows_are_skipped_without_aborting_the_batch(app, client, signup, completed_job, paid_job):
+    from app.services.payments import reconcile
+    client_headers, artisan_headers, _, job = paid_job
+    other_job = completed_job(client_headers, artisan_headers, description='Fix the bathroom tap', budget=800)
+    first = start_payment(client, client_headers, job['id'], 'pay-1').get_json()['data']
+    second = start_payment(client, client_headers, other_job['id'], 'pay-2').get_json()['data']
+    
+    settlement = io.StringIO(
+        'reference,status,amount\n'
+        f"{reference_of(app, first['id'])},completed,\n"
+        f"{reference_of(app, second['id'])},completed,800\n"
+    )
+    with app.app_context():
+        totals = reconcile(settlement)
+    assert (totals['invalid'], totals['settled']) == (1, 1)
+    
+    response = client.post('/v1/payments/callback', json=[
+        {'reference': reference_of(app, first['id']), 'status': 'completed', 'amount': 'abc'},
+    ])
+    assert response.get_json()['data']['invalid'] == 1
+
+
+def test_payer_still_sees_a_payment_whose_request_is_gone(app, client, paid_job):
+    client_headers, artisan_headers, _, job = paid_job
+    payment = start_payment(client, client_headers, job['id'], 'pay-1').get_json()['data']
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM service_requests WHERE id = :id'), {'id': job['id']})
+        db.session.commit()
+        db.session.remove()
+    
+    assert client.get(f"/v1/payments/{payment['id']}", headers=client_headers).status_code == 200
+    assert client.get(f"/v1/payments/{payment['id']}", headers=artisan_headers).status_code == 403
+
+
+def test_concurrent_settlements_keep_the_running_balance(tmp_path):
+    from app.services.payments import settle_batch
+    from tests.conftest import reset_caches
+    reset_caches()
+    config = type('FileConfig', (TestingConfig,), {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'pay.db'}"})
+    app = create_app(config)
+    client = app.test_client()
+    tokens = {}
+    for name, user_type in (('client', 'client'), ('artisan', 'artisan')):
+        response = client.post('/v1/auth/signup', json={
+            'username': name, 'email': f'{name}@example.com', 'password': 'secret123', 'user_type': user_type,
+            'service_category': 'Plumbing',
+        })
+        tokens[name] = {'Authorization': f"Bearer {response.get_json()['data']['token']}"}
+    references = []
+    for i, budget in enumerate((1000, 1001)):
+        request_id = client.post('/v1/client/requests', headers=tokens['client'], json={
+            'service_category': 'Plumbing', 'description': f'Job {i}', 'location': 'Westlands', 'budget': budget,
+            'allow_duplicate': True,
+        }).get_json()['data']['id']
+        for step in ('accept', 'start', 'complete'):
+            client.post(f'/v1/artisan/requests/{request_id}/{step}', headers=tokens['artisan'])
+        payment = start_payment(client, tokens['client'], request_id, f'pay-{i}').get_json()['data']
+        references.append((reference_of(app, payment['id']), budget))
+    
+    barrier = threading.Barrier(2)
+    errors = []
+    
+    def settle(reference, amount):
+        with app.app_context():
+            barrier.wait()
+            try:
+                settle_batch([{'reference': reference, 'status': 'completed', 'amount': amount}])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+    
+    threads = [threading.Thread(target=settle, args=pair) for pair in references]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    with app.app_context():
+        from app.models import LedgerEntry
+        entries = LedgerEntry.query.order_by(LedgerEntry.id).all()
+        running = [(entry.amount, entry.balance_after) for entry in entries]
+        db.session.remove()
+    first, second = running
+    assert second[1] == first[1] + second[0]
+    assert sorted(balance for _, balance in running) == [first[0], 2001.0]
@@ -0,0 +1,66 @@
+import threading
+import time
+from app.services.pricing import BudgetHistograms, estimate_price, price_tables
+
+
+def test_estimate_uses_completed_jobs_in_the_area(client, signup, completed_job, app):
+    client_headers, _ = signup('client1')
+    artisan_headers, _ = signup('artisan1', 'artisan', service_category='Plumbing')
+    for budget in (1000, 1500, 2000, 2500, 3000):
+        completed_job(client_headers, artisan_headers, budget=budget, description=f'Fix the sink for {budget}')
+    
+    response = client.get('/v1/client/price-estimate?service_category=Plumbing&location=Westlands', headers=client_headers)
+    estimate = response.get_json()['data']
+    assert (estimate['source'], estimate['samples']) == ('area', 5)
+    assert 1000 <= estimate['low'] < estimate['median'] < estimate['high'] <= 3000
+
+
+def test_first_estimate_does_not_wait_for_the_build(app, monkeypatch):
+    release = threading.Event()
+    build = BudgetHistograms.build
+    
+    def slow_build(*args, **kwargs):
+        release.wait(5)
+        return build(*args, **kwargs)
+    
+    monkeypatch.setattr(BudgetHistograms, 'build', slow_build)
+    app.config['JOBS_ASYNC'] = True
+    with app.app_context():
+        started = time.perf_counter()
+        assert estimate_price('Plumbing', 'Westlands') is None
+        assert time.perf_counter() - started < 1
+        release.set()
+        deadline = time.monotonic() + 5
+        while price_tables.current()._table is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert price_tables.current()._table is not None
+
+
+def test_estimates_stay_consistent_while_jobs_are_counted(app):
+    with app.app_context():
+        table = BudgetHistograms(100, 100000, 60)
+    errors = []
+    done = threading.Event()
+    
+    def count():
+        # New categories keep growing (reallocating) the counts array
+        for i in range(3000):
+            table.add(f'category {i}', 'Westlands', 1000 + i)
+        done.set()
+    
+    def estimate():
+        while not done.is_set():
+            try:
+                for i in range(0, 3000, 97):
+                    table.estimate(f'category {i}', 'Westlands', 1)
+            except Exception as e:
+                errors.append(e)
+                return
+    
+    threads = [threading.Thread(target=count), threading.Thread(target=estimate)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert table.estimate('category 2999', 'Westlands', 1)['samples'] == 1
@@ -0,0 +1,32 @@
+import pytest
+from app import create_app, db
+from config import TestingConfig
+
+
+@pytest.fixture
+def limited_client():
+    config = type('LimitedConfig', (TestingConfig,), {
+        'RATE_LIMIT_ENABLED': True, 'PROXY_HOPS': 1, 'RATE_LIMIT_IP_BURST': 3, 'RATE_LIMIT_IP_PER_SECOND': 0.001,
+        'RATE_LIMIT_COSTS': dict(TestingConfig.RATE_LIMIT_COSTS, **{'auth.signin': 1}),
+    })
+    app = create_app(config)
+    yield app.test_client()
+    with app.app_context():
+        db.drop_all()
+
+
+def signin(client, forwarded_for):
+    return client.post('/v1/auth/signin', json={'email': 'x@example.com', 'password': 'x'},
+                       headers={'X-Forwarded-For': forwarded_for}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+
+def test_forwarded_clients_get_their_own_buckets(limited_client):
+    statuses = [signin(limited_client, '203.0.113.7').status_code for _ in range(4)]
+    assert statuses[:3] == [401, 401, 401] and statuses[3] == 429
+    assert signin(limited_client, '198.51.100.9').status_code == 401
+
+
+def test_spoofed_forwarded_entries_do_not_escape_the_bucket(limited_client):
+    # The router appends the real caller last; anything before it is client-supplied
+    statuses = [signin(limited_client, f'1.2.3.{n}, 203.0.113.8').status_code for n in range(4)]
+    assert statuses[3] == 429
@@ -0,0 +1,37 @@
+from sqlalchemy import event, update
+from app import db
+from app.models import User
+
+
+def recommendation_queries(app, client, signup, artisans):
+    """Number of SELECTs one recommendations call makes with the given number of matching artisans"""
+    headers, _ = signup('client1')
+    for i in range(artisans):
+        signup(f'artisan{i}', 'artisan', service_category='Plumbing', location='Westlands, Nairobi',
+               skills=['pipes', 'taps'], languages=['English'])
+    with app.app_context():
+        db.session.execute(update(User).where(User.user_type == 'artisan').values(is_verified=True))
+        db.session.commit()
+        db.session.remove()
+    request_id = client.post('/v1/client/requests', headers=headers, json={
+        'service_category': 'Plumbing', 'description': 'Fix the kitchen sink', 'location': 'Westlands, Nairobi',
+    }).get_json()['data']['id']
+    # Warm the per-process feature tables so only the response's own queries are counted
+    client.get(f'/v1/client/requests/{request_id}/recommendations', headers=headers)
+    
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get(f'/v1/client/requests/{request_id}/recommendations', headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert len(response.get_json()['data']) == artisans
+    return sum(statement.lstrip().upper().startswith('SELECT') for statement in statements)
+
+
+def test_recommendations_load_profiles_in_batches(app, client, signup):
+    # The request, the artisans, then one query per profile collection however many artisans match
+    assert recommendation_queries(app, client, signup, 6) <= 6
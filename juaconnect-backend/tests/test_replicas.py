@@ -0,0 +1,79 @@
+import sqlite3
+import pytest
+from app import create_app, db
+from app.services.replicas import WRITE_HEADER, beat
+from config import TestingConfig
+from tests.conftest import reset_caches
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """(app, primary path, replica path) with one SQLite file replica"""
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    reset_caches()
+    config = type('ReplicaConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'REPLICA_BINDS': ['replica0'],
+        'SQLALCHEMY_BINDS': {'replica0': f'sqlite:///{replica}'},
+        'REPLICA_MAX_LAG_SECONDS': 60,
+        'REPLICA_CHECK_SECONDS': 0,
+    })
+    yield create_app(config), primary, replica
+    # init_app registers a metadata per bind on the shared db object; later apps have no replica0
+    db.metadatas.pop('replica0', None)
+
+
+def replicate(app, primary, replica):
+    """Stamp the heartbeat and copy the primary, as `replica-heartbeat` and scripts/replicate_sqlite.py do"""
+    with app.app_context():
+        beat()
+        db.session.remove()
+    source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+    source.backup(target)
+    target.close()
+    source.close()
+
+
+def test_reads_after_a_write_skip_a_replica_that_lags_it(replicated):
+    app, primary, replica = replicated
+    client = app.test_client(use_cookies=False)
+    response = client.post('/v1/auth/signup', json={
+        'username': 'client1', 'email': 'client1@example.com', 'password': 'secret123', 'user_type': 'client',
+    })
+    headers = {'Authorization': f"Bearer {response.get_json()['data']['token']}"}
+    replicate(app, primary, replica)
+    
+    response = client.post('/v1/client/requests', headers=headers, json={
+        'service_category': 'Plumbing', 'description': 'Fix the kitchen sink', 'location': 'Westlands, Nairobi',
+    })
+    assert response.status_code == 201
+    written_at = response.headers[WRITE_HEADER]
+    
+    # Another worker with no memory of the write: only the echoed stamp keeps the read on the primary
+    def my_requests(**extra):
+        response = client.get('/v1/client/requests', headers=dict(headers, **extra))
+        return len(response.get_json()['data'])
+    
+    assert my_requests() == 0
+    assert my_requests(**{WRITE_HEADER: written_at}) == 1
+    assert my_requests(**{WRITE_HEADER: 'nonsense'}) == 0
+    
+    replicate(app, primary, replica)
+    assert my_requests(**{WRITE_HEADER: written_at}) == 1
+
+
+def test_write_cookie_keeps_browser_reads_on_the_primary(replicated):
+    app, primary, replica = replicated
+    client = app.test_client()
+    response = client.post('/v1/auth/signup', json={
+        'username': 'client1', 'email': 'client1@example.com', 'password': 'secret123', 'user_type': 'client',
+    })
+    headers = {'Authorization': f"Bearer {response.get_json()['data']['token']}"}
+    replicate(app, primary, replica)
+    
+    client.post('/v1/client/requests', headers=headers, json={
+        'service_category': 'Plumbing', 'description': 'Fix the kitchen sink', 'location': 'Westlands, Nairobi',
+    })
+    assert len(client.get('/v1/client/requests', headers=headers).get_json()['data']) == 1
+    client.delete_cookie('last_write')
+    assert len(client.get('/v1/client/requests', headers=headers).get_json()['data']) == 0
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import DemandRollup, EarningsRollup, Notification, Payment, ServiceRequest, ServiceRequestArchive
+from app.services.analytics import rebuild_rollups
+from app.services.ratings import rebuild_aggregates
+from app.services.retention import compact_notifications, compact_requests
+from app.services.stats import rebuild_stats
+
+
+def archive_finished_requests(app):
+    with app.app_context():
+        moved = compact_requests(retention_days=0)
+        db.session.remove()
+    return moved
+
+
+def rollups(app):
+    with app.app_context():
+        demand = sorted(
+            (r.bucket, r.service_category, r.area, r.created_count, r.accepted_count, r.completed_count)
+            for r in DemandRollup.query
+        )
+        earnings = sorted((r.bucket, r.artisan_id, r.completed_count, r.earnings_total) for r in EarningsRollup.query)
+        db.session.remove()
+    return demand, earnings
+
+
+def test_archived_requests_stay_in_the_client_views(app, client, signup, completed_job):
+    client_headers, _ = signup('client1')
+    artisan_headers, _ = signup('artisan1', 'artisan', service_category='Plumbing')
+    done = completed_job(client_headers, artisan_headers)
+    open_request = client.post('/v1/client/requests', headers=client_headers, json={
+        'service_category': 'Plumbing', 'description': 'Broken shower', 'location': 'Kilimani', 'allow_duplicate': True,
+    }).get_json()['data']
+    
+    assert archive_finished_requests(app) == 1
+    with app.app_context():
+        assert db.session.get(ServiceRequest, done['id']) is None
+        assert db.session.get(ServiceRequestArchive, done['id']).status == 'completed'
+        assert db.session.get(ServiceRequest, open_request['id']) is not None
+        db.session.remove()
+    
+    listed = client.get('/v1/client/requests', headers=client_headers).get_json()['data']
+    assert [(req['id'], req['status']) for req in listed] == [(open_request['id'], 'pending'), (done['id'], 'completed')]
+    detail = client.get(f"/v1/client/requests/{done['id']}", headers=client_headers)
+    assert detail.status_code == 200
+    assert detail.get_json()['data']['status'] == 'completed'
+    bookings = client.get('/v1/client/bookings', headers=client_headers).get_json()['data']
+    assert [booking['request_id'] for booking in bookings] == [done['id']]
+    
+    other_headers, _ = signup('client2')
+    assert client.get(f"/v1/client/requests/{done['id']}", headers=other_headers).status_code == 403
+
+
+def test_archived_requests_can_be_reviewed_paid_and_rebuilt(app, client, signup, completed_job):
+    client_headers, _ = signup('client1')
+    artisan_headers, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    done = completed_job(client_headers, artisan_headers)
+    assert archive_finished_requests(app) == 1
+    
+    booking_id = client.get('/v1/client/bookings', headers=client_headers).get_json()['data'][0]['id']
+    response = client.post(f'/v1/client/bookings/{booking_id}/review', headers=client_headers, json={'rating': 5})
+    assert response.status_code == 201
+    
+    response = client.post('/v1/payments', headers=dict(client_headers, **{'Idempotency-Key': 'pay-1'}),
+                           json={'request_id': done['id']})
+    assert response.status_code == 201, response.get_json()
+    payment = response.get_json()['data']
+    with app.app_context():
+        reference = db.session.get(Payment, payment['id']).provider_reference
+        db.session.remove()
+    response = client.post('/v1/payments/callback', json={'reference': reference, 'status': 'completed', 'amount': 1500})
+    assert response.get_json()['data']['settled'] == 1
+    assert client.get('/v1/payments/ledger', headers=artisan_headers).get_json()['balance'] == 1500
+    assert client.get(f"/v1/payments/{payment['id']}", headers=artisan_headers).status_code == 200
+    
+    dashboard = f"/v1/artisan/{artisan['id']}/dashboard"
+    before = client.get(dashboard, headers=artisan_headers).get_json()['data']
+    assert before['requests']['completed'] == 1 and before['completed_jobs'] == 1 and before['rating_count'] == 1
+    counted = rollups(app)
+    assert all(counted)
+    
+    # The rebuilds read history through all_requests(), so the archived job still counts
+    with app.app_context():
+        rebuild_stats()
+        rebuild_aggregates()
+        rebuild_rollups()
+        db.session.commit()
+        db.session.remove()
+    assert client.get(dashboard, headers=artisan_headers).get_json()['data'] == before
+    assert rollups(app) == counted
+
+
+def add_notifications(app, user_id, *specs):
+    """One notification per (days old, is_read); returns their ids"""
+    now = datetime.utcnow()
+    with app.app_context():
+        notifications = [
+            Notification(user_id=user_id, title=f'#{i}', message='Hello', is_read=is_read,
+                         created_at=now - timedelta(days=days, minutes=i))
+            for i, (days, is_read) in enumerate(specs)
+        ]
+        db.session.add_all(notifications)
+        db.session.commit()
+        ids = [n.id for n in notifications]
+        db.session.remove()
+    return ids
+
+
+def compact(app, **kwargs):
+    with app.app_context():
+        result = compact_notifications(**kwargs)
+        db.session.remove()
+    return result
+
+
+def hot_ids(client, headers):
+    return sorted(n['id'] for n in client.get('/v1/notifications', headers=headers).get_json()['data'])
+
+
+def test_old_and_excess_read_notifications_are_archived(app, client, signup):
+    headers, user = signup('client1')
+    old_read = add_notifications(app, user['id'], (40, True), (45, True))
+    old_unread = add_notifications(app, user['id'], (50, False))
+    recent = add_notifications(app, user['id'], (1, True), (2, True), (3, True))
+    
+    assert compact(app, retention_days=30, hot_limit=200) == (1, 2)
+    assert hot_ids(client, headers) == sorted(old_unread + recent)
+    
+    # Beyond the newest hot_limit, read notifications go too, however recent; unread ones never do
+    assert compact(app, retention_days=30, hot_limit=1) == (1, 2)
+    assert hot_ids(client, headers) == sorted(old_unread + recent[:1])
+    assert client.get('/v1/notifications/unread', headers=headers).get_json()['data']['count'] == 1
+    
+    archived = client.get('/v1/notifications/archive', headers=headers).get_json()
+    assert sorted(n['id'] for n in archived['data']) == sorted(old_read + recent[1:])
+
+
+def test_archive_pages_newest_first(app, client, signup):
+    app.config['NOTIFICATION_ARCHIVE_CHUNK'] = 2
+    headers, user = signup('client1')
+    _, other = signup('client2')
+    ids = add_notifications(app, user['id'], *[(40 + i, True) for i in range(5)])
+    add_notifications(app, other['id'], (40, True))
+    assert compact(app, retention_days=30) == (2, 6)
+    
+    first = client.get('/v1/notifications/archive?limit=2', headers=headers).get_json()
+    assert [n['id'] for n in first['data']] == ids[:3]
+    assert first['next_before'] is not None
+    second = client.get(f"/v1/notifications/archive?limit=2&before={first['next_before']}", headers=headers).get_json()
+    assert [n['id'] for n in second['data']] == ids[3:]
+    assert second['next_before'] is None
@@ -0,0 +1,33 @@
+from sqlalchemy import text
+from app import db
+
+
+def bookings_of(client, headers):
+    return client.get('/v1/client/bookings', headers=headers).get_json()['data']
+
+
+def test_review_updates_the_artisan_rating(client, signup, completed_job):
+    client_headers, _ = signup('client1')
+    artisan_headers, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    completed_job(client_headers, artisan_headers)
+    booking_id = bookings_of(client, client_headers)[0]['id']
+    
+    response = client.post(f'/v1/client/bookings/{booking_id}/review', headers=client_headers, json={'rating': 4})
+    assert response.status_code == 201
+    again = client.post(f'/v1/client/bookings/{booking_id}/review', headers=client_headers, json={'rating': 5})
+    assert again.status_code == 400
+    assert client.get(f"/v1/artisan/{artisan['id']}").get_json()['data']['rating_count'] == 1
+
+
+def test_review_of_a_booking_whose_request_is_gone_is_not_found(app, client, signup, completed_job):
+    client_headers, _ = signup('client1')
+    artisan_headers, _ = signup('artisan1', 'artisan', service_category='Plumbing')
+    job = completed_job(client_headers, artisan_headers)
+    booking_id = bookings_of(client, client_headers)[0]['id']
+    with app.app_context():
+        db.session.execute(text('DELETE FROM service_requests WHERE id = :id'), {'id': job['id']})
+        db.session.commit()
+        db.session.remove()
+    
+    response = client.post(f'/v1/client/bookings/{booking_id}/review', headers=client_headers, json={'rating': 4})
+    assert response.status_code == 404
@@ -0,0 +1,138 @@
+import threading
+from datetime import datetime
+from app import create_app, db
+from config import TestingConfig
+from tests.conftest import reset_caches
+
+
+def book(client, headers, artisan_id, start, end, **fields):
+    return client.post('/v1/client/book-artisan', headers=headers, json=dict({
+        'artisan_id': artisan_id, 'service_category': 'Plumbing', 'description': 'Fix the kitchen sink',
+        'location': 'Westlands, Nairobi', 'budget': 1500, 'preferred_date': start, 'end_date': end,
+        'allow_duplicate': True,
+    }, **fields))
+
+
+def test_overlapping_bookings_are_refused(client, signup):
+    headers, _ = signup('client1')
+    _, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    
+    assert book(client, headers, artisan['id'], '2030-01-01T10:00:00', '2030-01-01T12:00:00').status_code == 201
+    assert book(client, headers, artisan['id'], '2030-01-01T11:00:00', '2030-01-01T13:00:00').status_code == 409
+    assert book(client, headers, artisan['id'], '2030-01-01T12:00:00', '2030-01-01T14:00:00').status_code == 201
+
+
+def test_booking_made_by_another_worker_is_seen(app, client, signup):
+    headers, _ = signup('client1')
+    _, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    assert book(client, headers, artisan['id'], '2030-01-01T08:00:00', '2030-01-01T09:00:00').status_code == 201
+    
+    # Written straight to the database, so this process's schedule index never hears of it
+    with app.app_context():
+        from app.models import Booking, ServiceRequest
+        other = ServiceRequest(client_id=1, artisan_id=artisan['id'], service_category='Plumbing',
+                               description='Other worker', location='Kilimani', status='pending')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Booking(request_id=other.id, artisan_id=artisan['id'], status='scheduled',
+                               start_date=datetime(2030, 1, 1, 10), end_date=datetime(2030, 1, 1, 12)))
+        db.session.commit()
+        db.session.remove()
+    
+    assert book(client, headers, artisan['id'], '2030-01-01T11:00:00', '2030-01-01T13:00:00').status_code == 409
+
+
+def test_concurrent_bookings_take_a_slot_once(tmp_path):
+    reset_caches()
+    config = type('FileConfig', (TestingConfig,), {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'race.db'}"})
+    app = create_app(config)
+    client = app.test_client()
+    signups = []
+    for name, user_type in (('client1', 'client'), ('artisan1', 'artisan')):
+        response = client.post('/v1/auth/signup', json={
+            'username': name, 'email': f'{name}@example.com', 'password': 'secret123', 'user_type': user_type,
+        })
+        data = response.get_json()['data']
+        signups.append(({'Authorization': f"Bearer {data['token']}"}, data['user']))
+    (headers, _), (_, artisan) = signups
+    
+    barrier = threading.Barrier(4)
+    statuses = []
+    
+    def attempt(i):
+        barrier.wait()
+        response = book(app.test_client(), headers, artisan['id'], '2030-01-01T10:00:00',
+                        '2030-01-01T12:00:00', description=f'Fix the kitchen sink #{i}')
+        statuses.append(response.status_code)
+    
+    threads = [threading.Thread(target=attempt, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert statuses.count(201) == 1, statuses
+    with app.app_context():
+        from app.models import Booking
+        assert Booking.query.filter_by(artisan_id=artisan['id'], status='scheduled').count() == 1
+        db.session.remove()
+
+
+def free_ids(client, start, end):
+    response = client.get(f'/v1/artisan/free?service_category=Plumbing&start={start}&end={end}')
+    assert response.status_code == 200, response.get_json()
+    return {artisan['id'] for artisan in response.get_json()['data']}
+
+
+def test_free_artisans_are_confirmed_against_the_database(app, client, signup):
+    signup('client1')
+    _, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    assert free_ids(client, '2030-01-01T10:00:00', '2030-01-01T12:00:00') == {artisan['id']}
+    
+    # Booked by another worker after this process loaded the artisan's schedule
+    with app.app_context():
+        from app.models import Booking, ServiceRequest
+        other = ServiceRequest(client_id=1, artisan_id=artisan['id'], service_category='Plumbing',
+                               description='Other worker', location='Kilimani', status='pending')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Booking(request_id=other.id, artisan_id=artisan['id'], status='scheduled',
+                               start_date=datetime(2030, 1, 1, 10), end_date=datetime(2030, 1, 1, 12)))
+        db.session.commit()
+        db.session.remove()
+    
+    assert free_ids(client, '2030-01-01T11:00:00', '2030-01-01T13:00:00') == set()
+
+
+def test_schedules_are_reloaded_after_the_refresh_interval(app, client, signup):
+    headers, _ = signup('client1')
+    _, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    assert book(client, headers, artisan['id'], '2030-01-01T10:00:00', '2030-01-01T12:00:00').status_code == 201
+    
+    # Cancelled by another worker; this process's index still holds the booking
+    with app.app_context():
+        from app.models import Booking
+        Booking.query.filter_by(artisan_id=artisan['id']).update({'status': 'cancelled'})
+        db.session.commit()
+        db.session.remove()
+    assert free_ids(client, '2030-01-01T10:00:00', '2030-01-01T12:00:00') == set()
+    
+    app.config['SCHEDULE_INDEX_REFRESH_SECONDS'] = 0
+    assert free_ids(client, '2030-01-01T10:00:00', '2030-01-01T12:00:00') == {artisan['id']}
+
+
+def test_rolled_back_release_stays_in_the_index(app, client, signup):
+    headers, _ = signup('client1')
+    _, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    response = book(client, headers, artisan['id'], '2030-01-01T10:00:00', '2030-01-01T12:00:00')
+    assert response.status_code == 201
+    
+    with app.app_context():
+        from app.models import ServiceRequest
+        from app.services.scheduling import release_bookings, schedule_index
+        start, end = datetime(2030, 1, 1, 10), datetime(2030, 1, 1, 12)
+        assert schedule_index.conflict(artisan['id'], start, end) is not None
+        release_bookings(db.session.get(ServiceRequest, response.get_json()['data']['id']), 'cancelled')
+        db.session.rollback()
+        assert schedule_index.conflict(artisan['id'], start, end) is not None
+        db.session.remove()
@@ -0,0 +1,121 @@
+import sqlite3
+from app import create_app, db
+from config import TestingConfig
+from tests.conftest import reset_caches
+
+# The tables as the first release created them
+FIRST_RELEASE = """
+CREATE TABLE users (
+    id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL, user_type VARCHAR(20) NOT NULL, phone VARCHAR(20), location VARCHAR(255),
+    created_at DATETIME, service_category VARCHAR(100), experience_years INTEGER, bio TEXT, rating FLOAT,
+    is_verified BOOLEAN, profile_photo VARCHAR(500), skills TEXT, hourly_rate FLOAT, availability TEXT,
+    portfolio_urls TEXT, languages VARCHAR(200), service_area VARCHAR(255)
+);
+CREATE TABLE notifications (
+    id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id), title VARCHAR(200) NOT NULL,
+    message TEXT NOT NULL, notification_type VARCHAR(50), related_id INTEGER, is_read BOOLEAN, created_at DATETIME
+);
+CREATE TABLE service_requests (
+    id INTEGER NOT NULL PRIMARY KEY, client_id INTEGER NOT NULL REFERENCES users (id),
+    artisan_id INTEGER REFERENCES users (id), service_category VARCHAR(100) NOT NULL, description TEXT NOT NULL,
+    status VARCHAR(20), location VARCHAR(255) NOT NULL, budget FLOAT, created_at DATETIME, updated_at DATETIME
+);
+CREATE TABLE bookings (
+    id INTEGER NOT NULL PRIMARY KEY, request_id INTEGER NOT NULL REFERENCES service_requests (id),
+    start_date DATETIME NOT NULL, end_date DATETIME, total_amount FLOAT, status VARCHAR(20), created_at DATETIME
+);
+CREATE TABLE payments (
+    id INTEGER NOT NULL PRIMARY KEY, booking_id INTEGER NOT NULL REFERENCES bookings (id), amount FLOAT NOT NULL,
+    status VARCHAR(20), payment_method VARCHAR(50), created_at DATETIME
+);
+CREATE TABLE reviews (
+    id INTEGER NOT NULL PRIMARY KEY, booking_id INTEGER NOT NULL REFERENCES bookings (id),
+    reviewer_id INTEGER NOT NULL REFERENCES users (id), rating INTEGER NOT NULL, comment TEXT, created_at DATETIME
+);
+INSERT INTO users VALUES (1, 'old_client', 'c@example.com', 'x', 'client', NULL, 'Nairobi', '2024-01-01 00:00:00',
+    NULL, NULL, NULL, 0, 0, NULL, NULL, NULL, NULL, NULL, NULL, NULL);
+INSERT INTO users VALUES (2, 'old_artisan', 'a@example.com', 'x', 'artisan', NULL, 'Nairobi', '2024-01-01 00:00:00',
+    'Plumbing', 3, NULL, 0, 1, NULL, 'pipes', 500, NULL, NULL, 'English', NULL);
+INSERT INTO service_requests VALUES (1, 1, 2, 'Plumbing', 'Leaking sink', 'completed', 'Westlands',
+    1000, '2024-01-02 00:00:00', '2024-01-03 00:00:00');
+INSERT INTO bookings VALUES (1, 1, '2024-01-02 10:00:00', '2024-01-02 12:00:00', 1000, 'completed', '2024-01-02 00:00:00');
+INSERT INTO reviews VALUES (1, 1, 1, 5, 'Great', '2024-01-04 00:00:00');
+INSERT INTO notifications VALUES (1, 2, 'Hi', 'Welcome', 'system', NULL, 0, '2024-01-01 00:00:00');
+"""
+
+
+def old_database(tmp_path):
+    path = tmp_path / 'old.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(FIRST_RELEASE)
+    return path
+
+
+def test_create_app_upgrades_a_first_release_database(tmp_path):
+    path = old_database(tmp_path)
+    reset_caches()
+    config = type('OldDatabaseConfig', (TestingConfig,), {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    app = create_app(config)
+    client = app.test_client()
+    
+    response = client.post('/v1/auth/signup', json={
+        'username': 'new_client', 'email': 'new@example.com', 'password': 'secret123', 'user_type': 'client',
+    })
+    assert response.status_code == 201, response.get_json()
+    
+    with app.app_context():
+        from app.models import Booking, Review, User, Notification
+        artisan = db.session.get(User, 2)
+        assert (artisan.rating_count, artisan.rating_sum, artisan.completed_jobs) == (1, 5.0, 1)
+        assert db.session.get(Booking, 1).artisan_id == 2
+        review = db.session.get(Review, 1)
+        assert (review.artisan_id, review.reviewer_name) == (2, 'old_client')
+        assert db.session.get(Notification, 1).updated_at is not None
+        db.session.remove()
+
+
+def test_init_db_is_repeatable(tmp_path):
+    path = old_database(tmp_path)
+    reset_caches()
+    config = type('OldDatabaseConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'CREATE_TABLES': False,
+    })
+    app = create_app(config)
+    runner = app.test_cli_runner()
+    
+    first = runner.invoke(args=['init-db'])
+    assert 'Added users.rating_sum' in first.output
+    assert 'Added service_requests.idempotency_key' in first.output
+    second = runner.invoke(args=['init-db'])
+    assert second.exit_code == 0
+    assert 'Added' not in second.output
+    
+    with sqlite3.connect(path) as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_service_requests_open', 'uq_service_requests_client_key', 'uq_reviews_booking_reviewer'} <= indexes
+
+
+def test_normalize_profiles_skips_only_the_bad_field(tmp_path):
+    path = old_database(tmp_path)
+    with sqlite3.connect(path) as conn:
+        conn.execute("""UPDATE users SET skills = 'pipes, Drains', languages = 'English, Swahili',
+                        availability = '{"monday": "17:00-09:00"}' WHERE id = 2""")
+        conn.execute("""INSERT INTO users (id, username, email, password_hash, user_type, is_verified, availability)
+                        VALUES (3, 'tiler', 't@example.com', 'x', 'artisan', 1, '{"tue": "08:00-12:00"}')""")
+    reset_caches()
+    config = type('OldDatabaseConfig', (TestingConfig,), {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    app = create_app(config)
+    
+    result = app.test_cli_runner().invoke(args=['normalize-profiles'])
+    assert result.exit_code == 0, result.output
+    assert 'Skipping availability for user 2' in result.output
+    assert 'Normalized profiles for 2 artisans.' in result.output
+    with app.app_context():
+        from app.models import User
+        artisan, tiler = db.session.get(User, 2), db.session.get(User, 3)
+        assert sorted(skill.slug for skill in artisan.skills) == ['drains', 'pipes']
+        assert sorted(language.language for language in artisan.languages) == ['english', 'swahili']
+        assert artisan.availability_slots == []
+        assert [(slot.day_of_week, str(slot.start_time)) for slot in tiler.availability_slots] == [(1, '08:00:00')]
+        db.session.remove()
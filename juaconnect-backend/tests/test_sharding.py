@@ -0,0 +1,71 @@
+import pytest
+from flask import request
+from app import create_app, db
+from app.models import User
+from app.services.ratelimit import limiter
+from app.services.sharding import shard_router
+from config import TestingConfig
+from tests.conftest import reset_caches
+
+
+@pytest.fixture
+def sharded_app(tmp_path):
+    reset_caches()
+    shards = {'nairobi': f"sqlite:///{tmp_path / 'nairobi.db'}", 'mombasa': f"sqlite:///{tmp_path / 'mombasa.db'}"}
+    config = type('ShardedConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'SHARD_DATABASE_URLS': shards,
+        'SHARD_DEFAULT_REGION': 'nairobi',
+        'SQLALCHEMY_BINDS': {f'shard_{region}': url for region, url in shards.items()},
+        'RATE_LIMIT_ENABLED': True,
+        'MAX_CONCURRENT_REQUESTS': 1,
+    })
+    yield create_app(config)
+    for region in shards:
+        db.metadatas.pop(f'shard_{region}', None)
+
+
+def add_artisans(app, **ratings):
+    """One verified artisan per region, named after it, with the given rating"""
+    client = app.test_client()
+    for region, rating in ratings.items():
+        response = client.post('/v1/auth/signup', json={
+            'username': region, 'email': f'{region}@example.com', 'password': 'secret123',
+            'user_type': 'artisan', 'location': region.title(), 'service_category': 'Plumbing',
+        })
+        assert response.status_code == 201, response.get_json()
+    with app.app_context():
+        for region, rating in ratings.items():
+            with shard_router.use_shard(region):
+                User.query.filter_by(user_type='artisan').update({'is_verified': True, 'rating': rating})
+                db.session.commit()
+        db.session.remove()
+
+
+def test_fan_out_keeps_the_admission_slot_until_the_request_ends(sharded_app):
+    held = []
+    
+    @sharded_app.after_request
+    def record_slots(response):
+        if request.endpoint == 'artisan.get_all_artisans':
+            held.append(bool(request.environ.get('juaconnect.admission_slots')))
+        return response
+    
+    add_artisans(sharded_app, nairobi=4.0, mombasa=4.5)
+    client = sharded_app.test_client()
+    for _ in range(3):
+        response = client.get('/v1/artisan/?sort=rating')
+        assert response.status_code == 200
+        assert [artisan['username'] for artisan in response.get_json()['data']] == ['mombasa', 'nairobi']
+    # The shard threads never tear down the request, so its slot is released once, at the end
+    assert held == [True] * 3
+    slot = limiter._semaphore('*', 1)
+    assert slot.acquire(blocking=False)
+    slot.release()
+
+
+def test_fan_out_passes_request_data_to_each_shard(sharded_app):
+    add_artisans(sharded_app, nairobi=4.8, mombasa=3.0)
+    response = sharded_app.test_client().get('/v1/artisan/search?service_category=Plumbing&sort=rating')
+    assert response.status_code == 200
+    assert [artisan['username'] for artisan in response.get_json()['data']] == ['nairobi', 'mombasa']
@@ -0,0 +1,63 @@
+from app import db
+
+
+def stats_for(app, artisan_id, drop=False):
+    with app.app_context():
+        from app.models import ArtisanStats
+        stats = db.session.get(ArtisanStats, artisan_id)
+        if drop:
+            db.session.delete(stats)
+            db.session.commit()
+            db.session.remove()
+            return None
+        counts = {name: getattr(stats, name) for name in (
+            'pending_count', 'accepted_count', 'in_progress_count', 'completed_count', 'cancelled_count'
+        )}
+        db.session.remove()
+        return counts
+
+
+def new_request(client, headers, **fields):
+    response = client.post('/v1/client/requests', headers=headers, json=dict({
+        'service_category': 'Plumbing', 'description': 'Fix the kitchen sink',
+        'location': 'Westlands, Nairobi', 'budget': 1500, 'allow_duplicate': True,
+    }, **fields))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']['id']
+
+
+def test_reject_counts_the_new_status_when_stats_are_rebuilt(app, client, signup):
+    client_headers, _ = signup('client1')
+    artisan_headers, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    request_id = new_request(client, client_headers)
+    assert client.post(f'/v1/artisan/requests/{request_id}/accept', headers=artisan_headers).status_code == 200
+    
+    # A missing stats row makes the transition rebuild it from the requests table
+    stats_for(app, artisan['id'], drop=True)
+    assert client.post(f'/v1/artisan/requests/{request_id}/reject', headers=artisan_headers).status_code == 200
+    assert stats_for(app, artisan['id'])['accepted_count'] == 0
+
+
+def test_cancel_counts_the_new_status_when_stats_are_rebuilt(app, client, signup):
+    client_headers, _ = signup('client1')
+    artisan_headers, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    request_id = new_request(client, client_headers)
+    for step in ('accept', 'start'):
+        assert client.post(f'/v1/artisan/requests/{request_id}/{step}', headers=artisan_headers).status_code == 200
+    
+    stats_for(app, artisan['id'], drop=True)
+    assert client.put(f'/v1/client/requests/{request_id}', headers=client_headers).status_code == 200
+    counts = stats_for(app, artisan['id'])
+    assert (counts['in_progress_count'], counts['cancelled_count']) == (0, 1)
+
+
+def test_completed_request_cannot_be_cancelled(app, client, signup, completed_job):
+    client_headers, _ = signup('client1')
+    artisan_headers, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    job = completed_job(client_headers, artisan_headers)
+    
+    response = client.put(f"/v1/client/requests/{job['id']}", headers=client_headers)
+    assert response.status_code == 400
+    assert client.get(f"/v1/artisan/{artisan['id']}").get_json()['data']['completed_jobs'] == 1
+    counts = stats_for(app, artisan['id'])
+    assert (counts['completed_count'], counts['cancelled_count']) == (1, 0)
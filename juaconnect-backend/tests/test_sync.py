@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import FeedTombstone
+from app.services.sync import SHARED_FEED, prune_tombstones
+
+FEEDS = ('/v1/artisan/available-requests', '/v1/artisan/accepted-requests', '/v1/client/requests', '/v1/notifications')
+
+
+@pytest.fixture(autouse=True)
+def no_lag(app):
+    # Without the lag every row changed after a poll is strictly newer than its watermark
+    app.config['SYNC_WATERMARK_LAG_SECONDS'] = 0
+
+
+def poll(client, path, headers, since=None):
+    response = client.get(path, headers=headers, query_string={'since': since} if since else None)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def create_request(client, headers, description='Fix the kitchen sink'):
+    response = client.post('/v1/client/requests', headers=headers, json={
+        'service_category': 'Plumbing', 'description': description, 'location': 'Westlands, Nairobi',
+        'budget': 1500, 'allow_duplicate': True,
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data']['id']
+
+
+def test_available_requests_delta(client, signup):
+    client_headers, _ = signup('client1')
+    artisan_headers, artisan = signup('artisan1', 'artisan', service_category='Plumbing')
+    _, other_artisan = signup('artisan2', 'artisan', service_category='Plumbing')
+    
+    taken = create_request(client, client_headers, 'Leaking tap')
+    # A direct booking is never in the open pool, however often it changes
+    booked = client.post('/v1/client/book-artisan', headers=client_headers, json={
+        'artisan_id': other_artisan['id'], 'service_category': 'Plumbing', 'description': 'Blocked drain',
+        'location': 'Kilimani', 'budget': 900,
+    }).get_json()['data']['id']
+    watermark = poll(client, FEEDS[0], artisan_headers)['watermark']
+    
+    cancelled = create_request(client, client_headers, 'Broken shower')
+    kept = create_request(client, client_headers, 'New sink')
+    assert client.put(f'/v1/client/requests/{booked}', headers=client_headers).status_code == 200
+    delta = poll(client, FEEDS[0], artisan_headers, watermark)
+    assert sorted(req['id'] for req in delta['data']) == [cancelled, kept]
+    assert delta['removed'] == []
+    
+    watermark = delta['watermark']
+    assert client.post(f'/v1/artisan/requests/{taken}/accept', headers=artisan_headers).status_code == 200
+    assert client.put(f'/v1/client/requests/{cancelled}', headers=client_headers).status_code == 200
+    delta = poll(client, FEEDS[0], artisan_headers, watermark)
+    assert delta['data'] == []
+    assert delta['removed'] == sorted([taken, cancelled])
+    
+    # Progress on an accepted request doesn't touch the pool
+    watermark = delta['watermark']
+    assert client.post(f'/v1/artisan/requests/{taken}/start', headers=artisan_headers).status_code == 200
+    delta = poll(client, FEEDS[0], artisan_headers, watermark)
+    assert (delta['data'], delta['removed']) == ([], [])
+
+
+def test_accepted_requests_delta(client, signup):
+    client_headers, _ = signup('client1')
+    artisan_headers, _ = signup('artisan1', 'artisan', service_category='Plumbing')
+    first = create_request(client, client_headers, 'Leaking tap')
+    second = create_request(client, client_headers, 'Broken shower')
+    watermark = poll(client, FEEDS[1], artisan_headers)['watermark']
+    
+    for request_id in (first, second):
+        assert client.post(f'/v1/artisan/requests/{request_id}/accept', headers=artisan_headers).status_code == 200
+    delta = poll(client, FEEDS[1], artisan_headers, watermark)
+    assert sorted(req['id'] for req in delta['data']) == [first, second]
+    
+    watermark = delta['watermark']
+    assert client.post(f'/v1/artisan/requests/{second}/reject', headers=artisan_headers).status_code == 200
+    delta = poll(client, FEEDS[1], artisan_headers, watermark)
+    assert (delta['data'], delta['removed']) == ([], [second])
+
+
+def test_client_requests_delta(client, signup):
+    client_headers, _ = signup('client1')
+    artisan_headers, _ = signup('artisan1', 'artisan', service_category='Plumbing')
+    first = create_request(client, client_headers, 'Leaking tap')
+    watermark = poll(client, FEEDS[2], client_headers)['watermark']
+    assert poll(client, FEEDS[2], client_headers, watermark)['data'] == []
+    
+    second = create_request(client, client_headers, 'Broken shower')
+    assert client.post(f'/v1/artisan/requests/{first}/accept', headers=artisan_headers).status_code == 200
+    delta = poll(client, FEEDS[2], client_headers, watermark)
+    assert {req['id']: req['status'] for req in delta['data']} == {first: 'accepted', second: 'pending'}
+
+
+def test_notifications_delta(client, signup):
+    client_headers, _ = signup('client1')
+    artisan_headers, _ = signup('artisan1', 'artisan', service_category='Plumbing')
+    for description in ('Leaking tap', 'Broken shower'):
+        request_id = create_request(client, client_headers, description)
+        assert client.post(f'/v1/artisan/requests/{request_id}/accept', headers=artisan_headers).status_code == 200
+    full = poll(client, FEEDS[3], client_headers)
+    read, deleted = [n['id'] for n in full['data']]
+    
+    assert client.put(f'/v1/notifications/{read}/read', headers=client_headers).status_code == 200
+    assert client.delete(f'/v1/notifications/{deleted}', headers=client_headers).status_code == 200
+    delta = poll(client, FEEDS[3], client_headers, full['watermark'])
+    assert [(n['id'], n['is_read']) for n in delta['data']] == [(read, True)]
+    assert delta['removed'] == [deleted]
+    assert delta['unread_count'] == 0
+
+
+@pytest.mark.parametrize('path', FEEDS)
+def test_expired_and_malformed_watermarks(client, signup, path):
+    headers, _ = signup('user1', 'client' if path.startswith('/v1/client') else 'artisan')
+    old = (datetime.utcnow() - timedelta(days=31)).isoformat()
+    response = client.get(path, headers=headers, query_string={'since': old})
+    assert response.status_code == 410
+    response = client.get(path, headers=headers, query_string={'since': 'yesterday'})
+    assert response.status_code == 400
+
+
+def test_old_tombstones_are_pruned(app):
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.add_all([
+            FeedTombstone(feed='available_requests', user_id=SHARED_FEED, entity_id=1, removed_at=now - timedelta(days=31)),
+            FeedTombstone(feed='available_requests', user_id=SHARED_FEED, entity_id=2, removed_at=now - timedelta(days=29)),
+        ])
+        db.session.commit()
+        assert prune_tombstones() == 1
+        assert [t.entity_id for t in FeedTombstone.query.all()] == [2]
@@ -0,0 +1,5 @@
+from app import create_app
+from config import ProductionConfig
+
+# WSGI entry point for the database-backed API: gunicorn -c gunicorn.conf.py wsgi:app
+app = create_app(ProductionConfig)
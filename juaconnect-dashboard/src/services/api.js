@@ -715,6 +715,22 @@ const api = {
     return await response.json();
   },
 
+  // Run several API calls in one round trip.
+  // requests: [{ method, path, body }] with paths like '/v1/auth/profile'.
+  // Resolves to [{ status, body }] in the same order.
+  batch: async (requests) => {
+    const response = await fetch(`${API_BASE_URL}/batch`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${getToken()}`,
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ requests })
+    });
+    const result = await response.json();
+    return result.success ? result.data : [];
+  },
+
   // Artisan Endpoints
   getAvailableRequests: async () => {
     // Use mock API if enabled